@@ -38,6 +38,7 @@ bl_info = {
 }
 
 import os
+import logging
 
 # Determine if the code is running from within Blender
 env_blender = True
@@ -46,7 +47,7 @@ try:
     env_blender = os.path.basename(bpy.app.binary_path or '').lower().startswith('blender')
 except ModuleNotFoundError:
     env_blender = False   
-print('INFO: Blender environment:', env_blender)
+logging.debug('Blender environment: %s', env_blender)
 
 # To support reload properly, try to access a package var, 
 # if it's there, reload everything
@@ -56,43 +57,31 @@ print('INFO: Blender environment:', env_blender)
 #else:
 #	from . import blender_temporary as bldtmp
 
-from . import sosi_importer as sosimp	
+if env_blender:
+    from . import sosi_importer as sosimp	
+    from . import sosi_operators as soops
+    from . import sosi_backend as sobknd
 #from . import blender_temporary as bldtmp
 
 # -----------------------------------------------------------------------------
 
-def main(context):
-    sosimp.do_imports()
-
-# -----------------------------------------------------------------------------
-
-class ImportSOSIData(bpy.types.Operator):
-    """Tooltip"""
-    bl_idname = "import_files.sosi_data"
-    bl_label = "Import SOSI Data"
-
-    def execute(self, context):
-        main(context)
-        return {'FINISHED'}
-        
-# -----------------------------------------------------------------------------
-    
-def menu_func_import(self, context):
-    self.layout.operator(ImportSOSIData.bl_idname)
-
-# -----------------------------------------------------------------------------
-
 def register():
-    bpy.utils.register_class(ImportSOSIData)
+    bpy.utils.register_class(soops.ImportSOSIData)
+    bpy.utils.register_class(soops.SosiTagItem)
+    bpy.utils.register_class(soops.ImportSOSIDataPython)
     bpy.utils.register_class(sosimp.SosiImporterPreferences)
-    bpy.types.TOPBAR_MT_file_import.append(menu_func_import)
+    bpy.types.TOPBAR_MT_file_import.append(soops.menu_func_import)
 
 # -----------------------------------------------------------------------------
 
 def unregister():
-    bpy.utils.unregister_class(sosimp.SosiPreferences)
-    bpy.utils.unregister_class(ImportSOSIData)
-    bpy.types.TOPBAR_MT_file_import.remove(menu_func_import)
+    bpy.utils.unregister_class(sosimp.SosiImporterPreferences)
+    bpy.utils.unregister_class(soops.ImportSOSIDataPython)
+    bpy.utils.unregister_class(soops.SosiTagItem)
+    bpy.utils.unregister_class(soops.ImportSOSIData)
+    bpy.types.TOPBAR_MT_file_import.remove(soops.menu_func_import)
+    # The DLL stays loaded for the session until here
+    sobknd.close_backends()
 
 # -----------------------------------------------------------------------------
 
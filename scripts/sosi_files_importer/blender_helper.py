@@ -25,7 +25,7 @@ This file is part of SosiImporter, an addon to import SOSI files containing
 """
 
 import bpy
-import bmesh
+import numpy as np
 
 # -----------------------------------------------------------------------------
 
@@ -109,19 +109,213 @@ class Mesh():
         ob_name -- new object name
         coords -- float triplets eg: [(-1.0, 1.0, 0.0), (-1.0, -1.0, 0.0)]
         """
-        #print(ob_name)
-        #print(coords)
-        #if (len(edges) > 0):
-        #    print(edges)
+        loops = [i for f in faces for i in f]
+        loop_totals = [len(f) for f in faces]
+        return Mesh.from_arrays(ob_name, np.asarray(coords, dtype=np.float32).reshape(-1, 3),
+            np.asarray(edges, dtype=np.int32).reshape(-1, 2),
+            np.asarray(loops, dtype=np.int32), np.asarray(loop_totals, dtype=np.int32))
+
+    @staticmethod
+    def loop_starts(loop_totals):
+        """First loop of every polygon, from the number of loops per polygon."""
+        starts = np.zeros(len(loop_totals), dtype=np.int32)
+        np.cumsum(loop_totals[:-1], out=starts[1:])
+        return starts
+
+    @staticmethod
+    def polygon_edges(nverts, edges, loops, loop_starts, loop_totals):
+        """Combine edges with the polygon edges.
+
+        Return the unique (m, 2) int32 edges and, for every loop, the index
+        of the edge from its vertex to the next vertex of its polygon.
+        """
+        nloops = len(loops)
+        nxt = np.arange(1, nloops + 1)
+        nxt[loop_starts + loop_totals - 1] = loop_starts  # Last loop wraps
+        a = np.minimum(loops, loops[nxt]).astype(np.int64)
+        b = np.maximum(loops, loops[nxt]).astype(np.int64)
+        keys = np.concatenate((np.minimum(edges[:, 0], edges[:, 1]).astype(np.int64) * nverts +
+            np.maximum(edges[:, 0], edges[:, 1]), a * nverts + b))
+        uniq, inverse = np.unique(keys, return_inverse=True)
+        all_edges = np.empty((len(uniq), 2), dtype=np.int32)
+        all_edges[:, 0] = uniq // nverts
+        all_edges[:, 1] = uniq % nverts
+        return all_edges, inverse[len(edges):].astype(np.int32)
+
+    @staticmethod
+    def set_arrays(mesh, positions, edges = None, loops = None, loop_starts = None, loop_totals = None):
+        """Fill an empty mesh from NumPy arrays with foreach_set.
+
+        Keyword arguments:
+        mesh -- mesh without geometry
+        positions -- (n, 3) float32 array of vertex coordinates
+        edges -- optional (m, 2) int32 array of vertex index pairs
+        loops -- optional int32 array of vertex indices for all polygons
+        loop_starts -- first loop per polygon, computed if None
+        loop_totals -- number of loops per polygon, required with loops
+        """
+        nverts = len(positions)
+        if edges is None:
+            edges = np.empty((0, 2), dtype=np.int32)
+        mesh.vertices.add(nverts)
+        mesh.vertices.foreach_set('co', np.ascontiguousarray(positions, dtype=np.float32).ravel())
         
-        # Create new mesh and a new object
+        if (loops is None) or (len(loops) == 0):
+            mesh.edges.add(len(edges))
+            mesh.edges.foreach_set('vertices', np.ascontiguousarray(edges, dtype=np.int32).ravel())
+        else:
+            # The polygon edges are made here, so no calc_edges is needed
+            loop_totals = np.asarray(loop_totals, dtype=np.int32)
+            if loop_starts is None:
+                loop_starts = Mesh.loop_starts(loop_totals)
+            edges, loop_edges = Mesh.polygon_edges(nverts, np.asarray(edges), np.asarray(loops),
+                np.asarray(loop_starts), loop_totals)
+            mesh.edges.add(len(edges))
+            mesh.edges.foreach_set('vertices', edges.ravel())
+            mesh.loops.add(len(loops))
+            mesh.loops.foreach_set('vertex_index', np.ascontiguousarray(loops, dtype=np.int32))
+            mesh.loops.foreach_set('edge_index', loop_edges)
+            mesh.polygons.add(len(loop_totals))
+            mesh.polygons.foreach_set('loop_start', np.ascontiguousarray(loop_starts, dtype=np.int32))
+            if not mesh.polygons.bl_rna.properties['loop_total'].is_readonly:
+                mesh.polygons.foreach_set('loop_total', loop_totals)
+        
+        mesh.update(calc_edges=False)
+        return mesh
+
+    @staticmethod
+    def get_arrays(mesh):
+        """Return (positions, edges, loops, loop_starts, loop_totals) of a mesh."""
+        positions = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+        mesh.vertices.foreach_get('co', positions)
+        edges = np.empty(len(mesh.edges) * 2, dtype=np.int32)
+        mesh.edges.foreach_get('vertices', edges)
+        loops = np.empty(len(mesh.loops), dtype=np.int32)
+        mesh.loops.foreach_get('vertex_index', loops)
+        loop_starts = np.empty(len(mesh.polygons), dtype=np.int32)
+        mesh.polygons.foreach_get('loop_start', loop_starts)
+        loop_totals = np.empty(len(mesh.polygons), dtype=np.int32)
+        mesh.polygons.foreach_get('loop_total', loop_totals)
+        return positions.reshape(-1, 3), edges.reshape(-1, 2), loops, loop_starts, loop_totals
+
+    @staticmethod
+    def from_arrays(ob_name, coords, edges = None, loops = None, loop_totals = None):
+        """Create mesh object from NumPy arrays, see set_arrays().
+
+        Keyword arguments:
+        ob_name -- new object name
+        coords -- (n, 3) array of vertex coordinates
+        edges -- optional (m, 2) array of vertex indices
+        loops -- optional array of vertex indices for all polygons
+        loop_totals -- number of loops per polygon, required with loops
+        """
         mesh = bpy.data.meshes.new(ob_name)
         obj = bpy.data.objects.new(ob_name, mesh)
         
-        mesh.from_pydata(coords, edges, faces)
-        mesh.update()
+        Mesh.set_arrays(mesh, coords, edges, loops, None, loop_totals)
         
         return obj
+
+    @staticmethod
+    def append_arrays(mesh, coords, edges = None, loops = None, loop_totals = None):
+        """Append NumPy vertex, edge and polygon arrays to a mesh.
+
+        The new elements are added to the mesh collections, the existing
+        ones keep their attribute values, material indices etc.
+
+        Keyword arguments:
+        mesh -- existing mesh
+        coords -- (n, 3) array of vertex coordinates
+        edges -- optional (m, 2) array of vertex indices, local to coords
+        loops -- optional array of vertex indices for all polygons, local to coords
+        loop_totals -- number of loops per polygon, required with loops
+        """
+        nverts = len(mesh.vertices)
+        nedges = len(mesh.edges)
+        nloops = len(mesh.loops)
+        npolys = len(mesh.polygons)
+        coords = np.asarray(coords, dtype=np.float32).reshape(-1, 3)
+        if edges is None:
+            edges = np.empty((0, 2), dtype=np.int32)
+        edges = np.asarray(edges, dtype=np.int32).reshape(-1, 2)
+        
+        mesh.vertices.add(len(coords))
+        Mesh.set_tail(mesh.vertices, 'co', nverts, coords)
+        if (loops is None) or (len(loops) == 0):
+            mesh.edges.add(len(edges))
+            Mesh.set_tail(mesh.edges, 'vertices', nedges, edges + nverts)
+        else:
+            loops = np.asarray(loops, dtype=np.int32)
+            loop_totals = np.asarray(loop_totals, dtype=np.int32)
+            loop_starts = Mesh.loop_starts(loop_totals)
+            edges, loop_edges = Mesh.polygon_edges(len(coords), edges, loops, loop_starts, loop_totals)
+            mesh.edges.add(len(edges))
+            Mesh.set_tail(mesh.edges, 'vertices', nedges, edges + nverts)
+            mesh.loops.add(len(loops))
+            Mesh.set_tail(mesh.loops, 'vertex_index', nloops, loops + nverts)
+            Mesh.set_tail(mesh.loops, 'edge_index', nloops, loop_edges + nedges)
+            mesh.polygons.add(len(loop_totals))
+            Mesh.set_tail(mesh.polygons, 'loop_start', npolys, loop_starts + nloops)
+            if not mesh.polygons.bl_rna.properties['loop_total'].is_readonly:
+                Mesh.set_tail(mesh.polygons, 'loop_total', npolys, loop_totals)
+        
+        mesh.update(calc_edges=False)
+        return mesh
+
+    @staticmethod
+    def set_tail(collection, prop, start, values):
+        """Set prop of the items from start on to values, the items before are kept."""
+        values = np.asarray(values)
+        all_values = np.empty((len(collection),) + values.shape[1:], dtype=values.dtype)
+        collection.foreach_get(prop, all_values.ravel())
+        all_values[start:] = values
+        collection.foreach_set(prop, all_values.ravel())
+
+    @staticmethod
+    def get_attribute(mesh, name, domain, dtype):
+        """All values of attribute name on domain, None if the mesh has none."""
+        attr = mesh.attributes.get(name)
+        if (attr is None) or (attr.domain != domain):
+            return None
+        values = np.empty(len(attr.data), dtype=dtype)
+        attr.data.foreach_get('value', values)
+        return values
+
+    @staticmethod
+    def set_attribute(mesh, name, attr_type, domain, values):
+        """Write all values of an INT or FLOAT attribute at once, created if missing."""
+        attr = mesh.attributes.get(name)
+        if attr is None:
+            attr = mesh.attributes.new(name, attr_type, domain)
+        attr.data.foreach_set('value', np.ascontiguousarray(values))
+        
+# -----------------------------------------------------------------------------
+
+class ImportRegistry():
+    """
+    Name lookups for one import session. Filled once from the scene when
+    the import starts, and updated as objects are created, so the lookups
+    per SOSI element do not have to scan all scene objects.
+    """
+    
+    active = None   # Registry of the import in progress, if any
+    
+    def __init__(self):
+        self.mesh_objs = {}     # name -> mesh object
+        self.parents = {}       # name -> parent (empty) object
+        self.collections = {}   # (main name, sub name) -> collection
+        for o in bpy.context.scene.objects:
+            if o.type == 'MESH':
+                self.mesh_objs.setdefault(o.name, o)
+    
+    @staticmethod
+    def begin():
+        ImportRegistry.active = ImportRegistry()
+        return ImportRegistry.active
+    
+    @staticmethod
+    def end():
+        ImportRegistry.active = None
         
 # -----------------------------------------------------------------------------
         
@@ -139,12 +333,19 @@ class Collection():
 
     @staticmethod
     def get_or_create_linked_subcollection_by_name(mcoll_name, scoll_name):
+        reg = ImportRegistry.active
+        if reg != None:
+            scoll = reg.collections.get((mcoll_name, scoll_name))
+            if scoll != None:
+                return scoll
         mcoll = Collection.get_or_create_linked_collection_by_name(mcoll_name)
         scoll = bpy.data.collections.get(scoll_name)
         if scoll is None:
             scoll = bpy.data.collections.new(scoll_name)
             #print('Sub collection created')
             mcoll.children.link(scoll)
+        if reg != None:
+            reg.collections[(mcoll_name, scoll_name)] = scoll
         return scoll
 
     @staticmethod
@@ -158,6 +359,110 @@ class Collection():
         return scoll2
     
 # -----------------------------------------------------------------------------
+
+class PointSymbols():
+    """
+    A symbol mesh per OBJTYPE instanced on the loose vertices (the PUNKT
+    elements) of an imported object, by a geometry nodes modifier. The
+    instances share the symbol mesh, rotated by the sosi_rotation attribute.
+    Replace the mesh of a symbol object to change the symbol.
+    """
+    
+    GROUP_NAME = 'SOSI Point Symbols'
+    MODIFIER_NAME = 'SOSI Symbols'
+    COLLECTION_NAME = 'SOSI Symbols'
+    
+    @staticmethod
+    def supported():
+        # Named Attribute node
+        return bpy.app.version >= (3, 2, 0)
+    
+    @staticmethod
+    def symbol_object(objtype, size):
+        """The symbol object of objtype, a small pyramid when created."""
+        name = 'SOSI Symbol ' + objtype
+        ob = bpy.data.objects.get(name)
+        if ob is None:
+            s = size * 0.5
+            coords = [(-s, -s, 0.0), (s, -s, 0.0), (s, s, 0.0), (-s, s, 0.0), (0.0, 0.0, size)]
+            faces = [(3, 2, 1, 0), (0, 1, 4), (1, 2, 4), (2, 3, 4), (3, 0, 4)]
+            ob = Mesh.point_cloud(name, coords, [], faces)
+            coll = Collection.get_or_create_linked_subcollection_by_name('SOSI', PointSymbols.COLLECTION_NAME)
+            coll.hide_viewport = True
+            coll.hide_render = True
+            coll.objects.link(ob)
+        return ob
+    
+    @staticmethod
+    def new_socket(group, in_out, socket_type, name):
+        if hasattr(group, 'interface'):     # Blender 4.0+
+            return group.interface.new_socket(name, in_out=in_out, socket_type=socket_type)
+        sockets = group.inputs if in_out == 'INPUT' else group.outputs
+        return sockets.new(socket_type, name)
+    
+    @staticmethod
+    def input_identifier(group, name):
+        if hasattr(group, 'interface'):
+            return group.interface.items_tree[name].identifier
+        return group.inputs[name].identifier
+    
+    @staticmethod
+    def node_group():
+        """The geometry nodes group instancing the Symbol object, created once."""
+        group = bpy.data.node_groups.get(PointSymbols.GROUP_NAME)
+        if group is not None:
+            return group
+        group = bpy.data.node_groups.new(PointSymbols.GROUP_NAME, 'GeometryNodeTree')
+        if hasattr(group, 'is_modifier'):
+            group.is_modifier = True
+        PointSymbols.new_socket(group, 'INPUT', 'NodeSocketGeometry', 'Geometry')
+        PointSymbols.new_socket(group, 'INPUT', 'NodeSocketObject', 'Symbol')
+        PointSymbols.new_socket(group, 'OUTPUT', 'NodeSocketGeometry', 'Geometry')
+        nodes = group.nodes
+        links = group.links
+        group_in = nodes.new('NodeGroupInput')
+        group_out = nodes.new('NodeGroupOutput')
+        info = nodes.new('GeometryNodeObjectInfo')
+        # Loose vertices: no edges
+        neighbors = nodes.new('GeometryNodeInputMeshVertexNeighbors')
+        loose = nodes.new('FunctionNodeCompare')
+        loose.data_type = 'INT'
+        loose.operation = 'EQUAL'
+        rotation = nodes.new('GeometryNodeInputNamedAttribute')
+        rotation.data_type = 'FLOAT'
+        rotation.inputs['Name'].default_value = 'sosi_rotation'
+        euler = nodes.new('ShaderNodeCombineXYZ')
+        instance = nodes.new('GeometryNodeInstanceOnPoints')
+        join = nodes.new('GeometryNodeJoinGeometry')
+        
+        links.new(group_in.outputs['Geometry'], instance.inputs['Points'])
+        links.new(group_in.outputs['Symbol'], info.inputs['Object'])
+        links.new(info.outputs['Geometry'], instance.inputs['Instance'])
+        links.new(neighbors.outputs['Vertex Count'], loose.inputs[2])  # A and B (INT)
+        loose.inputs[3].default_value = 0
+        links.new(loose.outputs['Result'], instance.inputs['Selection'])
+        # Blender 3.x has an Attribute output per data type
+        attr = [s for s in rotation.outputs if (s.name == 'Attribute') and s.enabled][0]
+        links.new(attr, euler.inputs['Z'])
+        links.new(euler.outputs['Vector'], instance.inputs['Rotation'])
+        links.new(group_in.outputs['Geometry'], join.inputs['Geometry'])
+        links.new(instance.outputs['Instances'], join.inputs['Geometry'])
+        links.new(join.outputs['Geometry'], group_out.inputs['Geometry'])
+        for i, node in enumerate((group_in, info, neighbors, loose, rotation, euler, instance, join, group_out)):
+            node.location = (i * 200.0, 0.0)
+        return group
+    
+    @staticmethod
+    def add_modifier(ob, symbol):
+        """Instance symbol on the loose vertices of ob, modifier added once."""
+        mod = ob.modifiers.get(PointSymbols.MODIFIER_NAME)
+        if mod is None:
+            mod = ob.modifiers.new(PointSymbols.MODIFIER_NAME, 'NODES')
+            mod.node_group = PointSymbols.node_group()
+        mod[PointSymbols.input_identifier(mod.node_group, 'Symbol')] = symbol
+        return mod
+
+# -----------------------------------------------------------------------------
     
 class SceneSettings():
                 
@@ -201,6 +506,9 @@ class SceneSettings():
 # -----------------------------------------------------------------------------
 
 def get_or_create_SOSI_parent_object(sosi_parent_name):
+    reg = ImportRegistry.active
+    if (reg != None) and (sosi_parent_name in reg.parents):
+        return reg.parents[sosi_parent_name]
     top_parent = bpy.data.objects.get(sosi_parent_name)
     if top_parent == None:
         top_parent = bpy.data.objects.new(sosi_parent_name, None)
@@ -209,6 +517,8 @@ def get_or_create_SOSI_parent_object(sosi_parent_name):
         top_parent.empty_display_type = 'SPHERE'
         bpy.context.scene.collection.objects.link(top_parent)
 #           logging.debug(' SOSI_Parent:', top_parent)
+    if reg != None:
+        reg.parents[sosi_parent_name] = top_parent
     return top_parent
     
 # -----------------------------------------------------------------------------
@@ -223,6 +533,9 @@ def setMyEnvironment():
 # -----------------------------------------------------------------------------
     
 def get_mesh_obj_named(obname):
+    reg = ImportRegistry.active
+    if reg != None:
+        return reg.mesh_objs.get(obname)
     for o in bpy.context.scene.objects:
         if o.type == 'MESH' and o.name == obname:
             return o
@@ -230,46 +543,12 @@ def get_mesh_obj_named(obname):
 
 # -----------------------------------------------------------------------------
 
-    
-# Join the two meshes together and name the resulting mesh name
-def meshes_join(name, me1, me2):
-    bm = bmesh.new()
-    bm.from_mesh(me1)
-    #print(bm)
-    bm.from_mesh(me2)
-    #print(bm)
-    me = bpy.data.meshes.new(name)
-    bm.to_mesh(me)
-    bm.free()
-    return me
-
-# -----------------------------------------------------------------------------    
-
-# Join the mesh in the object ob_new to the existing mesh object eith name obname
-def mesh_obj_join_existing(obname, ob_new):
-    
-    ob_orig = None
-    for o in bpy.context.scene.objects:
-        if o.type == 'MESH':
-            if o.name == obname:
-                ob_orig = o
-                
-    if ob_orig != None:
-        #print('Found orig', ob_orig)
-        
-        me_orig = ob_orig.data
-        me_joined = meshes_join(obname, me_orig, ob_new.data)
-        
-        ob_orig.data = me_joined
-        bpy.data.meshes.remove(me_orig, do_unlink=True)
-        return ob_orig
-    else:
-        return None
-    #    me_new = ob_new.data
-    #    me_new.name = obname
-    #    ob_new.name = obname
-    #    return ob_new   
-    
+# Make a new mesh object findable by get_mesh_obj_named during the import
+def register_mesh_obj(obname, ob):
+    reg = ImportRegistry.active
+    if reg != None:
+        reg.mesh_objs[obname] = ob
+
 # -----------------------------------------------------------------------------
 
 def lock_obj_to_parent(obj):
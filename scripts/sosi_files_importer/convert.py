@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright © 2022 Jonny Normann Skålvik
+
+Permission is hereby granted, free of charge, to any person obtaining a copy 
+of this software and associated documentation files (the “Software”), to deal 
+in the Software without restriction, including without limitation the rights 
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell 
+copies of the Software, and to permit persons to whom the Software is 
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in 
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE 
+SOFTWARE.
+
+This file is part of SosiImporter, an addon to import SOSI files containing
+3D model data into Blender.
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from . import sosi_settings as soset
+from . import sosi_datahelper as sodhlp
+from . import sosi_parser as sopars
+from . import sosi_accumulator as soacc
+from . import sosi_pipeline as sopipe
+from . import sosi_spatial as sospat
+from . import sosi_export as soexp
+
+# Command line batch conversion of SOSI files to OBJ, PLY or binary glTF,
+# without Blender:
+#
+#   python -m sosi_files_importer.convert -r area_ref.txt -f glb -o out/ sheets/
+#
+# Each input file gives one output file with the same base name, files
+# found in a directory keep their path below it (sheets/a/x.sos gives
+# out/a/x.glb).
+
+# -----------------------------------------------------------------------------
+
+def find_sosi_files(paths, recursive):
+    """Return (filename, path relative to the input directory) per SOSI file."""
+    filenames = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for f in sorted(files):
+                    if f.lower().endswith('.sos'):
+                        filename = os.path.join(root, f)
+                        filenames.append((filename, os.path.relpath(filename, path)))
+                if not recursive:
+                    break
+        else:
+            filenames.append((path, os.path.basename(path)))
+    return filenames
+
+def output_paths(filenames, output, extension):
+    """
+    The output file per (filename, relative path) of find_sosi_files(),
+    None if two input files would give the same output file.
+    """
+    out_paths = [os.path.join(output, os.path.splitext(rel)[0] + extension) for filename, rel in filenames]
+    seen = {}
+    for (filename, rel), out_path in zip(filenames, out_paths):
+        key = os.path.normcase(os.path.abspath(out_path))
+        if key in seen:
+            print('{} and {} both give {}'.format(seen[key], filename, out_path), file=sys.stderr)
+            return None
+        seen[key] = filename
+    return out_paths
+
+# -----------------------------------------------------------------------------
+
+def convert_file(filename, out_path, fmt, ref_e, ref_n, elem_filter, max_bytes, settings):
+    """
+    Convert one SOSI file, return (filename, number of elements, number of
+    vertices removed by welding, seconds).
+    """
+    sopipe.apply_settings(settings)
+    t0 = time.perf_counter()
+    writer = soexp.WRITERS[fmt](out_path, ref_e, ref_n)
+    acc = soacc.MeshAccumulator(lambda key, md: writer.write_mesh(key[1], md), max_bytes,
+        sopipe.weld_vertices())
+    nelements = 0
+    try:
+        for elem in sopipe.load_elements(filename, ref_e, ref_n, elem_filter):
+            acc.add_element(elem.id, (elem.filename, elem.objname), sodhlp.coords_to_3D(elem.coords),
+                holes=elem.holes, grid=elem.grid)
+            nelements += 1
+        acc.flush()
+    finally:
+        writer.close()
+    return filename, nelements, acc.nwelded, time.perf_counter() - t0
+
+# -----------------------------------------------------------------------------
+
+def print_result(filename, nelements, nwelded, secs):
+    welded = ', {} vertices welded'.format(nwelded) if nwelded > 0 else ''
+    print('{}: {} elements{}, {:.2f} s'.format(filename, nelements, welded, secs))
+
+# -----------------------------------------------------------------------------
+
+KIND_NAMES = {
+    'punkt' : sodhlp.SosiObjId.PUNKT.value,
+    'kurve' : sodhlp.SosiObjId.KURVE.value,
+    'buep' : sodhlp.SosiObjId.BUEP.value,
+    'flate' : sodhlp.SosiObjId.FLATE.value
+}
+
+def make_parser():
+    parser = argparse.ArgumentParser(prog='python -m sosi_files_importer.convert',
+        description='Convert SOSI files (.sos) to OBJ, PLY or binary glTF.')
+    parser.add_argument('inputs', nargs='+', help='SOSI files or directories')
+    parser.add_argument('-o', '--output', default='.', help='output directory')
+    parser.add_argument('-f', '--format', choices=sorted(soexp.WRITERS), default='glb')
+    ref = parser.add_mutually_exclusive_group(required=True)
+    ref.add_argument('-r', '--ref-file', help='reference coordinate file (E and N lines)')
+    ref.add_argument('--ref', nargs=2, type=float, metavar=('E', 'N'), help='reference coordinate')
+    parser.add_argument('--objtype', action='append', help='import only this OBJTYPE (repeatable)')
+    parser.add_argument('--kind', action='append', choices=sorted(KIND_NAMES),
+        help='import only this element kind (repeatable)')
+    parser.add_argument('--bbox', nargs=4, type=float, metavar=('MIN_E', 'MIN_N', 'MAX_E', 'MAX_N'))
+    parser.add_argument('--radius', type=float, help='window radius around the reference point')
+    parser.add_argument('--hoyde', nargs=2, type=float, metavar=('MIN', 'MAX'), help='height range')
+    parser.add_argument('--clip', action='store_true', help='cut elements at the bbox/window')
+    parser.add_argument('--weld', action='store_true', help='merge the vertices shared by elements')
+    parser.add_argument('--recursive', action='store_true', help='search directories recursively')
+    parser.add_argument('-j', '--jobs', type=int, default=0, help='worker processes, 0: one per CPU')
+    parser.add_argument('--chunk-mb', type=int, default=64,
+        help='mesh data kept in memory before it is written')
+    parser.add_argument('--cache', action='store_true',
+        help='use and fill the parse cache, holds a whole file in memory when filling it')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    return parser
+
+# -----------------------------------------------------------------------------
+
+def main(argv = None):
+    args = make_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+        format='%(levelname)s: %(message)s')
+    
+    if args.ref_file:
+        ref_e, ref_n = sopars.read_reference_file(args.ref_file)
+    else:
+        ref_e, ref_n = args.ref
+    
+    elem_filter = sopars.ElementFilter(clip = args.clip)
+    if args.objtype:
+        elem_filter.objtypes = set(args.objtype)
+    if args.kind:
+        elem_filter.kinds = set(KIND_NAMES[k] for k in args.kind)
+    if args.radius:
+        elem_filter.bbox = sospat.window_bbox(ref_e, ref_n, args.radius)
+    elif args.bbox:
+        elem_filter.bbox = tuple(args.bbox)
+    if args.hoyde:
+        elem_filter.hoyde_range = tuple(args.hoyde)
+    
+    soset.SOSI_WELD_VERTICES = args.weld
+    # Storing a file in the cache needs all of it in memory, the files
+    # are streamed otherwise
+    soset.SOSI_CACHE_ENABLED = args.cache
+    filenames = find_sosi_files(args.inputs, args.recursive)
+    if len(filenames) == 0:
+        print('No SOSI files found', file=sys.stderr)
+        return 1
+    out_paths = output_paths(filenames, args.output, soexp.WRITERS[args.format].extension)
+    if out_paths == None:
+        return 1
+    
+    jobs = []
+    for (filename, rel), out_path in zip(filenames, out_paths):
+        os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+        jobs.append((filename, out_path, args.format, ref_e, ref_n, elem_filter,
+            args.chunk_mb * 1024 * 1024, sopipe.get_settings()))
+    
+    nproc = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    nproc = max(1, min(nproc, len(jobs)))
+    nfailed = 0
+    if nproc == 1:
+        for job in jobs:
+            try:
+                print_result(*convert_file(*job))
+            except Exception as e:
+                print('{}: failed: {}'.format(job[0], e), file=sys.stderr)
+                nfailed += 1
+    else:
+        with ProcessPoolExecutor(max_workers=nproc) as pool:
+            futures = [(job[0], pool.submit(convert_file, *job)) for job in jobs]
+            for filename, fut in futures:
+                try:
+                    print_result(*fut.result())
+                except Exception as e:
+                    print('{}: failed: {}'.format(filename, e), file=sys.stderr)
+                    nfailed += 1
+    return 1 if nfailed > 0 else 0
+
+# -----------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    sys.exit(main())
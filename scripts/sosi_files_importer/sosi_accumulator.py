@@ -0,0 +1,476 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright © 2022 Jonny Normann Skålvik
+
+Permission is hereby granted, free of charge, to any person obtaining a copy 
+of this software and associated documentation files (the “Software”), to deal 
+in the Software without restriction, including without limitation the rights 
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell 
+copies of the Software, and to permit persons to whom the Software is 
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in 
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE 
+SOFTWARE.
+
+This file is part of SosiImporter, an addon to import SOSI files containing
+3D model data into Blender.
+"""
+
+import logging
+import numpy as np
+from . import sosi_datahelper as sodhlp
+from . import sosi_geom_helper as sogeohlp
+from . import sosi_parser as sopars
+from . import sosi_settings as soset
+from . import sosi_stats as sostat
+
+# Attributes of elements delivered without them
+NO_ATTRS = (0, 0, float('nan'), 0, 0.0)
+
+# -----------------------------------------------------------------------------
+
+class MeshData():
+    """
+    Vertex, edge and polygon arrays for one object, collected from many SOSI
+    elements. The element arrays are kept in lists and only concatenated
+    once, when the Blender mesh is created.
+    """
+
+    def __init__(self, exact = False):
+        # float64 vertices and their integer SOSI coordinates (see
+        # sosi_parser.SosiElement.grid) until weld(), float32 is coarser
+        # than the SOSI units far from the reference coordinate
+        self.exact = exact
+        self.vert_dtype = np.float64 if exact else np.float32
+        self.vert_parts = []
+        self.grid_parts = []
+        self.edge_parts = []
+        self.loop_parts = []
+        self.loop_total_parts = []
+        self.nverts = 0
+        self.nedges = 0
+        self.nloops = 0
+        self.npolys = 0
+        self.nelements = 0
+        self.pending_arcs = []  # BUEP points, segmented in one batch later
+        self.pending_arc_attrs = []
+        self.pending_arc_grids = []
+        # Per element: ELEMENT_ATTR_DTYPE values and number of vertices
+        self.attr_parts = []
+        self.attr_rows = []
+        self.count_parts = []
+        self.count_rows = []
+        self.nwelded = 0        # Vertices removed by weld()
+
+    def add(self, coords, edges = None, loops = None, loop_totals = None, attrs = None, grid = None):
+        """
+        Append the (n, 3) coords, the optional (m, 2) edges and the optional
+        polygons (loop vertex indices and number of loops per polygon) of
+        one element. Indices are local to the element and are offset here.
+        attrs are the element's values, see sodhlp.element_attrs(). grid
+        are the integer SOSI coordinates of coords, None if unknown.
+        """
+        self.attr_rows.append(attrs or NO_ATTRS)
+        self.count_rows.append(len(coords))
+        return self.add_block(coords, edges, loops, loop_totals, grid)
+
+    def add_block(self, coords, edges = None, loops = None, loop_totals = None, grid = None):
+        """Append geometry without element attributes, see add()."""
+        offset = self.nverts
+        self.vert_parts.append(np.asarray(coords, dtype=self.vert_dtype))
+        if self.exact:
+            self.grid_parts.append(sopars.no_grid(len(coords)) if grid is None else \
+                np.asarray(grid, dtype=np.int64))
+        self.nverts += len(coords)
+        if (edges is not None) and (len(edges) > 0):
+            self.edge_parts.append(np.asarray(edges, dtype=np.int32) + offset)
+            self.nedges += len(edges)
+        if (loops is not None) and (len(loops) > 0):
+            self.loop_parts.append(np.asarray(loops, dtype=np.int32) + offset)
+            self.loop_total_parts.append(np.asarray(loop_totals, dtype=np.int32))
+            self.nloops += len(loops)
+            self.npolys += len(loop_totals)
+        self.nelements += 1
+        return offset
+
+    def add_records(self, table, records, attrs):
+        """
+        Append the elements records (of the sosi_parser.ElementTable table)
+        with their attrs, as add() per element would but in one block. BUEP
+        elements are pending arcs as in add_arc().
+        """
+        ids = records['id']
+        for i in np.flatnonzero(ids == sodhlp.SosiObjId.BUEP.value):
+            off = records['coord_offset'][i]
+            self.add_arc(table.coords[off:off + records['ncoords'][i]], attrs[i].item(),
+                table.grid[off:off + records['ncoords'][i]])
+        block = ids != sodhlp.SosiObjId.BUEP.value
+        if not np.any(block):
+            return
+        records = records[block]
+        ids = ids[block]
+        rows, counts = table.vertex_rows(records)
+        starts = np.cumsum(counts) - counts
+        # Vertex i -> i + 1 within each KURVE
+        elem_of = np.repeat(np.arange(len(records)), counts)
+        last = np.zeros(len(rows), dtype=bool)
+        last[(starts + counts - 1)[counts > 0]] = True
+        ev = np.flatnonzero((ids == sodhlp.SosiObjId.KURVE.value)[elem_of] & ~last)
+        edges = np.column_stack((ev, ev + 1))
+        flate = (ids == sodhlp.SosiObjId.FLATE.value) & (counts > 0)
+        tri = flate & ((records['nholes'] > 0) | soset.SOSI_FLATE_TRIANGULATE)
+        if not np.any(tri):
+            # One polygon per FLATE using all the ring points
+            loops = np.flatnonzero(flate[elem_of])
+            loop_totals = counts[flate]
+        else:
+            loop_parts = []
+            total_parts = []
+            for i in np.flatnonzero(flate):
+                if tri[i]:
+                    rec = records[i]
+                    holes = table.holes[rec['hole_offset']:rec['hole_offset'] + rec['nholes']]
+                    with sostat.stats.stage('flate_triangulation'):
+                        tris = sogeohlp.triangulate_polygon_2D(table.coords[rows[starts[i]:starts[i] + counts[i]]],
+                            holes)
+                    loop_parts.append(tris.ravel() + starts[i])
+                    total_parts.append(np.full(len(tris), 3))
+                else:
+                    loop_parts.append(np.arange(starts[i], starts[i] + counts[i]))
+                    total_parts.append([counts[i]])
+            loops = np.concatenate(loop_parts)
+            loop_totals = np.concatenate(total_parts)
+        self.add_element_attrs(attrs[block], counts)
+        self.add_block(table.coords[rows], edges, loops, loop_totals, table.grid[rows])
+        self.nelements += len(records) - 1
+
+    def add_element_attrs(self, attrs, counts):
+        """Append the attribute and count arrays of several elements."""
+        self.flush_attr_rows()
+        self.attr_parts.append(np.asarray(attrs, dtype=sodhlp.ELEMENT_ATTR_DTYPE))
+        self.count_parts.append(np.asarray(counts, dtype=np.int32))
+
+    def flush_attr_rows(self):
+        if len(self.attr_rows) > 0:
+            self.attr_parts.append(np.array(self.attr_rows, dtype=sodhlp.ELEMENT_ATTR_DTYPE))
+            self.count_parts.append(np.array(self.count_rows, dtype=np.int32))
+            self.attr_rows = []
+            self.count_rows = []
+
+    @staticmethod
+    def from_arrays(vertices, edges, loops, loop_totals, nelements, element_attrs = None, element_counts = None):
+        """MeshData holding the already combined arrays of nelements elements."""
+        md = MeshData()
+        md.add_block(vertices, edges, loops, loop_totals)
+        if element_attrs is not None:
+            md.add_element_attrs(element_attrs, element_counts)
+        md.nelements = nelements
+        return md
+
+    def add_arc(self, arc_pts, attrs = None, grid = None):
+        """
+        Add the three points of a BUEP element, see tessellate_arcs(). A
+        BUEP with another number of points is no arc, it is added as a curve.
+        """
+        if len(arc_pts) != 3:
+            self.add(arc_pts, sodhlp.points_to_edges(len(arc_pts)), attrs=attrs, grid=grid)
+            return
+        self.pending_arcs.append(np.asarray(arc_pts, dtype=np.float64))
+        self.pending_arc_attrs.append(attrs or NO_ATTRS)
+        self.pending_arc_grids.append(sopars.no_grid(3) if grid is None else np.asarray(grid))
+
+    def tessellate_arcs(self):
+        """
+        Split all pending BUEP elements into curve segments in one batch.
+        Return the number of elements and the number of points created.
+        """
+        if len(self.pending_arcs) == 0:
+            return 0, 0
+        narcs = len(self.pending_arcs)
+        with sostat.stats.stage('arc_tessellation'):
+            pts, offsets = sogeohlp.buep_pts_segments_3D(np.stack(self.pending_arcs))
+        self.add_element_attrs(self.pending_arc_attrs, np.diff(offsets))
+        # The arc ends keep their integer SOSI coordinates
+        grids = np.stack(self.pending_arc_grids)
+        grid = sopars.no_grid(len(pts))
+        grid[offsets[:-1]] = grids[:, 0]
+        grid[offsets[1:] - 1] = grids[:, 2]
+        self.pending_arcs = []
+        self.pending_arc_attrs = []
+        self.pending_arc_grids = []
+        edges = sodhlp.points_to_edges(len(pts))
+        mask = np.ones(len(edges), dtype=bool)
+        mask[offsets[1:-1] - 1] = False  # No edges between elements
+        self.add_block(pts, edges[mask], grid=grid)
+        self.nelements += narcs - 1
+        return narcs, len(pts)
+
+    def nbytes(self):
+        return self.nverts * (3 * self.vert_dtype().itemsize + (16 if self.exact else 0)) \
+            + self.nedges * 2 * 4 + (self.nloops + self.npolys) * 4 \
+            + len(self.pending_arcs) * 9 * 8 + self.nelements * (sodhlp.ELEMENT_ATTR_DTYPE.itemsize + 8)
+
+    def vertices(self, dtype = np.float32):
+        if len(self.vert_parts) == 0:
+            return np.empty((0, 3), dtype=dtype)
+        return np.concatenate(self.vert_parts).astype(dtype, copy=False)
+
+    def grid(self):
+        """The integer SOSI coordinates of the vertices, exact MeshData only."""
+        if len(self.grid_parts) == 0:
+            return sopars.no_grid(0)
+        return np.concatenate(self.grid_parts)
+
+    def edges(self):
+        if len(self.edge_parts) == 0:
+            return np.empty((0, 2), dtype=np.int32)
+        return np.concatenate(self.edge_parts)
+
+    def loops(self):
+        if len(self.loop_parts) == 0:
+            return np.empty(0, dtype=np.int32)
+        return np.concatenate(self.loop_parts)
+
+    def loop_totals(self):
+        if len(self.loop_total_parts) == 0:
+            return np.empty(0, dtype=np.int32)
+        return np.concatenate(self.loop_total_parts)
+
+    def element_attrs(self):
+        self.flush_attr_rows()
+        if len(self.attr_parts) == 0:
+            return np.empty(0, dtype=sodhlp.ELEMENT_ATTR_DTYPE)
+        return np.concatenate(self.attr_parts)
+
+    def element_counts(self):
+        """Number of vertices per element, all 1 after weld()."""
+        self.flush_attr_rows()
+        if len(self.count_parts) == 0:
+            return np.empty(0, dtype=np.int32)
+        return np.concatenate(self.count_parts)
+
+    def loose_vertices(self):
+        """Mask of the vertices in no edge or polygon, i.e. of PUNKT elements."""
+        loose = np.ones(self.nverts, dtype=bool)
+        loose[self.edges().ravel()] = False
+        loose[self.loops()] = False
+        return loose
+
+    def vertex_attrs(self):
+        """The element attributes repeated for every vertex (ELEMENT_ATTR_DTYPE)."""
+        return np.repeat(self.element_attrs(), self.element_counts())
+
+    def weld(self):
+        """
+        Merge the vertices with the same integer SOSI coordinates (E, N, see
+        sosi_parser.SosiElement.grid) and the same height, the float64 z is
+        not offset by the reference and compared as is. Vertices without
+        integer coordinates are kept. The vertices keep their order of first
+        use. Edges and polygons are remapped, and collapsed or repeated
+        edges and polygon corners dropped. The element attributes become
+        per vertex, from the first element using it.
+        Pending BUEP elements must be tessellated first, and the MeshData
+        made exact. Return the number of vertices removed.
+        """
+        verts = self.vertices(np.float64)
+        if len(verts) == 0:
+            return 0
+        keys = np.empty((len(verts), 3), dtype=np.int64)
+        keys[:, :2] = self.grid()
+        keys[:, 2] = np.ascontiguousarray(verts[:, 2]).view(np.int64)
+        unknown = np.flatnonzero(keys[:, 0] == sopars.GRID_NONE)
+        keys[unknown, 1] = unknown  # Unique
+        keys[unknown, 2] = 0
+        keys = keys.view(np.dtype((np.void, keys.dtype.itemsize * 3))).ravel()
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        nremoved = len(verts) - len(first)
+        if nremoved == 0:
+            return 0
+        order = np.argsort(first)
+        remap = np.empty(len(first), dtype=np.int32)
+        remap[order] = np.arange(len(first), dtype=np.int32)
+        remap = remap[inverse.ravel()]
+        kept = first[order]
+        attrs = self.vertex_attrs()[kept]
+        
+        edges = remap[self.edges()]
+        edges = edges[edges[:, 0] != edges[:, 1]]
+        if len(edges) > 0:
+            pairs = np.ascontiguousarray(np.sort(edges, axis=1)).view(np.int64).ravel()
+            _, idx = np.unique(pairs, return_index=True)
+            edges = edges[np.sort(idx)]
+        
+        loops = remap[self.loops()]
+        loop_totals = self.loop_totals()
+        if len(loops) > 0:
+            # Drop corners equal to the next corner of the same polygon
+            starts = np.cumsum(loop_totals) - loop_totals
+            owner = np.repeat(np.arange(len(loop_totals)), loop_totals)
+            nxt = np.arange(1, len(loops) + 1)
+            nxt[starts + loop_totals - 1] = starts
+            keep = loops != loops[nxt]
+            loop_totals = np.bincount(owner[keep], minlength=len(loop_totals)).astype(np.int32)
+            keep &= (loop_totals >= 3)[owner]
+            loops = loops[keep]
+            loop_totals = loop_totals[loop_totals >= 3]
+        
+        nelements = self.nelements
+        nwelded = self.nwelded + nremoved
+        self.__init__()
+        self.add_block(verts[kept], edges, loops, loop_totals)
+        self.add_element_attrs(attrs, np.ones(len(kept), dtype=np.int32))
+        self.nelements = nelements
+        self.nwelded = nwelded
+        return nremoved
+
+# -----------------------------------------------------------------------------
+
+class MeshAccumulator():
+    """
+    Collects MeshData per key, where the key is (collection name, object name,
+    OBJTYPE), see sosi_spatial.element_key().
+    commit_func(key, meshdata) is called for every key when flushed, i.e. at
+    the end of a file or when the memory used exceeds max_bytes.
+    """
+
+    def __init__(self, commit_func, max_bytes, weld = False):
+        self.commit_func = commit_func
+        self.max_bytes = max_bytes
+        self.weld = weld        # See MeshData.weld()
+        self.nwelded = 0        # Vertices removed by welding
+        self.narcs = 0          # BUEP elements segmented
+        self.narc_pts = 0       # and the number of points created
+        self.meshes = {}    # Insertion ordered
+        self.nbytes = 0
+        self.nflushes = 0
+
+    def get_meshdata(self, key):
+        md = self.meshes.get(key)
+        if md == None:
+            md = MeshData(exact = self.weld)
+            self.meshes[key] = md
+        return md
+
+    def add(self, key, coords, edges = None, loops = None, loop_totals = None, attrs = None, grid = None):
+        md = self.get_meshdata(key)
+        nbytes = md.nbytes()
+        md.add(coords, edges, loops, loop_totals, attrs, grid)
+        self.nbytes += md.nbytes() - nbytes
+        self.check_size()
+
+    def add_element(self, id, key, coords, attrs = None, holes = None, grid = None):
+        """
+        Add one SOSI element with object id id and (n, 3) coords: points,
+        curve edges, one polygon for FLATE or BUEP points to be segmented.
+        attrs are the element's values, see sodhlp.element_attrs(). A FLATE
+        with holes (start indices of the hole rings in coords), or any FLATE
+        when SOSI_FLATE_TRIANGULATE is set, is added as triangles. grid are
+        the integer SOSI coordinates to weld with, None if unknown.
+        """
+        objid = sodhlp.SosiObjId(id)
+        ncoords = len(coords)
+        sostat.stats.count('elements ' + objid.name)
+        sostat.stats.count('element vertices', ncoords)
+        if objid == sodhlp.SosiObjId.PUNKT:
+            self.add(key, coords, attrs=attrs, grid=grid)
+        elif objid == sodhlp.SosiObjId.KURVE:
+            self.add(key, coords, sodhlp.points_to_edges(ncoords), attrs=attrs, grid=grid)
+        elif objid == sodhlp.SosiObjId.FLATE:
+            if ((holes is not None) and (len(holes) > 0)) or soset.SOSI_FLATE_TRIANGULATE:
+                with sostat.stats.stage('flate_triangulation'):
+                    tris = sogeohlp.triangulate_polygon_2D(coords, holes)
+                self.add(key, coords, None, tris.ravel(), np.full(len(tris), 3), attrs, grid)
+            else:
+                # One polygon using all the ring points
+                loops = np.arange(ncoords, dtype=np.int32)
+                self.add(key, coords, None, loops, [ncoords], attrs, grid)
+        elif objid == sodhlp.SosiObjId.BUEP:
+            # Segmented together with all other BUEP elements when flushed
+            self.add_arc(key, coords, attrs, grid)
+
+    def add_table(self, table, keys, key_ids):
+        """
+        Add the elements of an sosi_parser.ElementTable, as add_element()
+        per element but a whole object at a time. keys are the keys used,
+        key_ids the index into keys per record (sosi_spatial.table_keys()).
+        """
+        records = table.records
+        if len(records) == 0:
+            return
+        kinds, nkinds = np.unique(records['id'], return_counts=True)
+        for kind, n in zip(kinds, nkinds):
+            sostat.stats.count('elements ' + sodhlp.SosiObjId(int(kind)).name, int(n))
+        sostat.stats.count('element vertices', int(records['ncoords'].sum()))
+        attrs = table.element_attrs()
+        # The objects in the order of their first element
+        order = np.argsort(key_ids, kind='stable')
+        sorted_ids = key_ids[order]
+        bounds = np.flatnonzero(np.diff(sorted_ids)) + 1
+        groups = np.split(order, bounds)
+        groups.sort(key=lambda group: group[0])
+        for group in groups:
+            md = self.get_meshdata(keys[key_ids[group[0]]])
+            nbytes = md.nbytes()
+            md.add_records(table, records[group], attrs[group])
+            self.nbytes += md.nbytes() - nbytes
+            self.check_size()
+
+    def add_arc(self, key, arc_pts, attrs = None, grid = None):
+        md = self.get_meshdata(key)
+        nbytes = md.nbytes()
+        md.add_arc(arc_pts, attrs, grid)
+        self.nbytes += md.nbytes() - nbytes
+        self.check_size()
+
+    def check_size(self):
+        if self.nbytes > self.max_bytes:
+            logging.debug('Mesh accumulator exceeds %d bytes, flushing partial meshes', self.max_bytes)
+            self.flush()
+
+    def flush(self):
+        for key, md in self.meshes.items():
+            narcs, npts = md.tessellate_arcs()
+            self.narcs += narcs
+            self.narc_pts += npts
+            if self.weld:
+                with sostat.stats.stage('weld'):
+                    self.nwelded += md.weld()
+            if md.nverts > 0:
+                self.commit_func(key, md)
+        self.meshes = {}
+        self.nbytes = 0
+        self.nflushes += 1
+
+    def discard(self):
+        """Drop the collected data without committing it (cancelled import)."""
+        self.meshes = {}
+        self.nbytes = 0
+
+    def reset_stats(self):
+        self.narcs = 0
+        self.narc_pts = 0
+        self.nflushes = 0
+        self.nwelded = 0
+
+    def log_weld_stats(self):
+        if self.nwelded > 0:
+            logging.info('Welding: {} shared vertices removed'.format(self.nwelded))
+
+    def log_arc_stats(self):
+        """Log the BUEP points created, compared to fixed SOSI_BUEP_SPLITS."""
+        if self.narcs == 0:
+            return
+        npts_fixed = self.narcs * (2 * soset.SOSI_BUEP_SPLITS + 1)
+        saved = npts_fixed - self.narc_pts
+        # One vertex (3 floats) and one edge (2 ints) per point
+        logging.info('BUEP: {} elements, {} vertices ({} with {} splits), {} vertices / {:.1f} kB saved'.format(
+            self.narcs, self.narc_pts, npts_fixed, soset.SOSI_BUEP_SPLITS,
+            saved, saved * (3 * 4 + 2 * 4) / 1024))
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright © 2022 Jonny Normann Skålvik
+
+Permission is hereby granted, free of charge, to any person obtaining a copy 
+of this software and associated documentation files (the “Software”), to deal 
+in the Software without restriction, including without limitation the rights 
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell 
+copies of the Software, and to permit persons to whom the Software is 
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in 
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE 
+SOFTWARE.
+
+This file is part of SosiImporter, an addon to import SOSI files containing
+3D model data into Blender.
+"""
+
+import os
+import abc
+import time
+import ctypes
+import logging
+from collections import namedtuple
+from . import sosi_settings as soset
+from . import sosi_datahelper as sodhlp
+from . import sosi_parser as sopars
+from . import sosi_scan as sosca
+from . import sosi_stats as sostat
+
+# The sources of SOSI elements for an import by do_imports(): the native
+# DLL (Windows). The Python parser is run by the importer directly, see
+# sosi_importer.import_files_python(). A backend is created once and kept
+# for the session, so the DLL is loaded and prototyped only once and not
+# per import.
+# A backend delivers its elements to element_func(id, objrefnum, sosires,
+# objname, coords, filename, attrs = None, holes = None), coords is an
+# (n, 3) array only valid during the call, or in chunks of many elements
+# to chunk_func(table), table is an sosi_parser.ElementTable.
+
+# Reference coordinate, unity and number of files of an import
+SosiInputs = namedtuple('SosiInputs', ['easting', 'northing', 'unity', 'nfiles'])
+
+# Backend names, see get_backend() and the addon preferences
+BACKEND_DLL = 'DLL'
+BACKEND_PYTHON = 'PYTHON'
+
+c_int = ctypes.c_int
+c_double = ctypes.c_double
+c_void_p = ctypes.c_void_p
+c_char_p = ctypes.c_char_p
+
+# -----------------------------------------------------------------------------
+
+class SosiBackend(abc.ABC):
+    """Base of the element sources, see the module comment"""
+    
+    name = ''
+    
+    @abc.abstractmethod
+    def get_inputs(self, bldscale, clip_end, unit_system, unit_length, unit_scale):
+        """
+        Select the files to import, returns SosiInputs. nfiles is 0 when
+        there is nothing to import (e.g. cancelled by the user).
+        """
+    
+    @abc.abstractmethod
+    def process_files(self, nfiles, element_func):
+        """Deliver the elements of the selected files to element_func"""
+    
+    def process_chunks(self, nfiles, chunk_func, size = None):
+        """
+        Deliver the elements of the selected files to chunk_func in
+        ElementTables of at most size (SOSI_CHUNK_ELEMENTS when None)
+        elements of one file. Collected from process_files() here.
+        """
+        size = size or soset.SOSI_CHUNK_ELEMENTS
+        builder = None
+        
+        def element_func(id, objrefnum, sosires, objname, coords, filename, attrs = None, holes = None):
+            nonlocal builder
+            res = 0
+            if (builder != None) and ((builder.filename != filename) or (len(builder) >= size)):
+                res = chunk_func(builder.table())
+                builder = None
+            if builder == None:
+                builder = sopars.ElementTableBuilder(filename)
+            hoyde = None if (attrs == None) or (attrs[2] != attrs[2]) else attrs[2]
+            builder.add(id, objrefnum, sosires, objname, coords.shape[1], coords, hoyde, holes)
+            return res
+        
+        res = self.process_files(nfiles, element_func)
+        if (res == 0) and (builder != None) and (len(builder) > 0):
+            res = chunk_func(builder.table())
+        return res
+    
+    def scan_file(self, filename):
+        """Header and element counts of a file (sosi_scan.SosiScan)"""
+        return sosca.scan_sosi_file(filename)
+    
+    def close(self):
+        """Release what the backend holds, it is not usable afterwards"""
+        pass
+
+# -----------------------------------------------------------------------------
+
+def dll_path():
+    if soset.USE_DEBUG_DLL_PATH == True:
+        return soset.DEBUG_DLL_PATH
+    dir_path = os.path.dirname(os.path.realpath(__file__))
+    head_path, tail_path = os.path.split(dir_path)
+    return os.path.join(head_path, soset.REL_DLL_PATH)
+
+def free_library(handle):
+    from ctypes import wintypes
+    kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+    kernel32.FreeLibrary.argtypes = [wintypes.HMODULE]
+    kernel32.FreeLibrary.restype = wintypes.BOOL
+    kernel32.FreeLibrary(handle)
+
+class DllBackend(SosiBackend):
+    """The native SOSI library, Windows only"""
+    
+    name = BACKEND_DLL
+    
+    # Prototype of the element callback
+    callback_type = ctypes.CFUNCTYPE(c_int, c_int, c_int, c_int, c_char_p, c_int, c_int,
+        ctypes.POINTER(c_double), c_char_p)
+    
+    def __init__(self, path = None):
+        self.path = path or dll_path()
+        self.dll = ctypes.WinDLL(self.path)
+        self.dll.get_SosiInputObjects.argtypes = [ctypes.POINTER(c_double), ctypes.POINTER(c_double),
+            ctypes.POINTER(c_double), c_double, c_double, c_int, c_int, c_double]
+        self.dll.get_SosiInputObjects.restype = c_int
+        self.dll.process_SosiFiles.argtypes = [c_int, c_void_p]
+        self.dll.process_SosiFiles.restype = c_int
+        # Kept here to avoid garbage collection while the DLL may call it
+        self.callback = self.callback_type(self.on_element)
+        self.element_func = None
+        logging.debug('Loaded {}'.format(self.path))
+    
+    def get_inputs(self, bldscale, clip_end, unit_system, unit_length, unit_scale):
+        peasting = c_double()
+        pnorthing = c_double()
+        punity = c_double()
+        nfiles = self.dll.get_SosiInputObjects(peasting, pnorthing, punity, bldscale, clip_end,
+            unit_system, unit_length, unit_scale)
+        return SosiInputs(peasting.value, pnorthing.value, punity.value, nfiles)
+    
+    def process_files(self, nfiles, element_func):
+        self.element_func = element_func
+        try:
+            return self.dll.process_SosiFiles(nfiles, self.callback)
+        finally:
+            self.element_func = None
+    
+    # Called by the DLL per sosi object
+    def on_element(self, id, objrefnum, sosires, pobjname, ndims, ncoords, pcoord_ary, pfilename):
+        t0 = time.perf_counter()
+        objname = pobjname.decode('utf-8')
+        # NUMPY view on the DLL buffer, no copy. Only valid during this call.
+        a = sodhlp.coord_buffer_to_array(pcoord_ary, ndims, ncoords)
+        coords = sodhlp.coords_to_3D(a)
+        filename = sopars.source_name(pfilename.decode('utf8'))
+        sostat.stats.add_time('coord_handoff', time.perf_counter() - t0)
+        return self.element_func(id, objrefnum, sosires, objname, coords, filename)
+    
+    def close(self):
+        # Unloading lets the DLL be recompiled without restarting Blender
+        if self.dll != None:
+            handle = self.dll._handle
+            self.dll = None
+            self.callback = None
+            free_library(handle)
+            logging.debug('Unloaded {}'.format(self.path))
+
+# -----------------------------------------------------------------------------
+
+# The session backends by name, created when first used
+backends = {}
+
+def get_backend(name = BACKEND_DLL):
+    """The session backend name (BACKEND_DLL), loaded once"""
+    backend = backends.get(name)
+    if backend == None:
+        if name != BACKEND_DLL:
+            raise ValueError('No session backend {}'.format(name))
+        backend = DllBackend()
+        backends[name] = backend
+    return backend
+
+def set_backend(name, backend):
+    """Use backend for name from now on"""
+    old = backends.get(name)
+    if (old != None) and (old is not backend):
+        old.close()
+    backends[name] = backend
+
+def close_backend(name):
+    backend = backends.pop(name, None)
+    if backend != None:
+        backend.close()
+
+def close_backends():
+    """Release all session backends, when the addon is unregistered"""
+    for name in list(backends):
+        close_backend(name)
+
+def default_backend_name():
+    return BACKEND_DLL if os.name == 'nt' else BACKEND_PYTHON
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright © 2022 Jonny Normann Skålvik
+
+Permission is hereby granted, free of charge, to any person obtaining a copy 
+of this software and associated documentation files (the “Software”), to deal 
+in the Software without restriction, including without limitation the rights 
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell 
+copies of the Software, and to permit persons to whom the Software is 
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in 
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE 
+SOFTWARE.
+
+This file is part of SosiImporter, an addon to import SOSI files containing
+3D model data into Blender.
+"""
+
+import io
+import time
+import ctypes
+import logging
+import numpy as np
+from . import sosi_datahelper as sodhlp
+from . import sosi_geom_helper as sogeohlp
+from . import sosi_log_helper as sologhlp
+from . import sosi_parser as sopars
+from . import sosi_accumulator as soacc
+
+# Micro benchmarks for the import hot paths, runnable without Blender:
+#   python -m sosi_files_importer.sosi_benchmarks
+# The mesh construction benchmark needs Blender, e.g. from its Python
+# console: from sosi_files_importer import sosi_benchmarks; sosi_benchmarks.run_all()
+
+# -----------------------------------------------------------------------------
+
+def time_call(func, repeat):
+    """Return the best time [s] of repeat calls to func."""
+    best = None
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        t = time.perf_counter() - t0
+        if (best == None) or (t < best):
+            best = t
+    return best
+
+# -----------------------------------------------------------------------------
+
+def bench_coord_handoff(ncoords=100000, ndims=2, repeat=5):
+    """
+    Compare the previous coordinate handoff from the DLL callback
+    (np.fromiter, list of tuples, list of edges) with the zero-copy
+    array view, using a ctypes double buffer like the one the DLL delivers.
+    """
+    buf = (ctypes.c_double * (ncoords * ndims))(*np.random.rand(ncoords * ndims))
+    pcoord_ary = ctypes.cast(buf, ctypes.POINTER(ctypes.c_double))
+
+    def old_path():
+        a = np.fromiter(pcoord_ary, dtype=np.double, count=ndims * ncoords)
+        coord_list = []
+        for i in range(ncoords):
+            if ndims == 2:
+                coord_list.append((a[i * 2], a[i * 2 + 1], 0.0))
+            else:
+                coord_list.append((a[i * 3], a[i * 3 + 1], a[i * 3 + 2]))
+        edg_list = sodhlp.points_to_edglist(coord_list)
+        return coord_list, edg_list
+
+    def new_path():
+        a = sodhlp.coord_buffer_to_array(pcoord_ary, ndims, ncoords)
+        return sodhlp.coords_to_3D(a), sodhlp.points_to_edges(ncoords)
+
+    # Both paths must give the same result
+    coord_list, edg_list = old_path()
+    coords, edges = new_path()
+    assert np.array_equal(np.asarray(coord_list), coords)
+    assert np.array_equal(np.asarray(edg_list), edges)
+
+    t_old = time_call(old_path, repeat)
+    t_new = time_call(new_path, repeat)
+    print('Coordinate handoff, {} coords, {}D:'.format(ncoords, ndims))
+    print('  fromiter + lists: {:10.3f} ms'.format(t_old * 1000))
+    print('  array view:       {:10.3f} ms'.format(t_new * 1000))
+    return t_old, t_new
+
+# -----------------------------------------------------------------------------
+
+def random_arcs(narcs, seed=0):
+    """Random BUEP point triples, a third of them horizontal."""
+    rng = np.random.default_rng(seed)
+    arcs = rng.uniform(-100.0, 100.0, (narcs, 3, 3))
+    arcs[:narcs // 3, :, 2] = rng.uniform(-10.0, 10.0, (narcs // 3, 1))
+    return arcs
+
+# -----------------------------------------------------------------------------
+
+def bench_arc_tessellation(narcs=2000, num_splits=8, repeat=3):
+    """
+    Compare arc_pts_segments_3D per BUEP with arcs_pts_segments_3D for
+    all BUEP elements at once, and check that the results match.
+    """
+    arcs = random_arcs(narcs)
+
+    def single():
+        return [sogeohlp.arc_pts_segments_3D(a, num_splits) for a in arcs]
+
+    def batch():
+        return sogeohlp.arcs_pts_segments_3D(arcs, num_splits)
+
+    ref = single()
+    pts, offsets = batch()
+    max_dev = 0.0
+    for i in range(narcs):
+        dev = np.abs(np.asarray(ref[i]) - pts[offsets[i]:offsets[i + 1]]).max()
+        max_dev = max(max_dev, dev)
+    assert max_dev < 1e-9, max_dev
+
+    t_single = time_call(single, repeat)
+    t_batch = time_call(batch, repeat)
+    print('Arc tessellation, {} BUEP, {} splits, max deviation {:.3g}:'.format(narcs, num_splits, max_dev))
+    print('  per element: {:10.3f} ms'.format(t_single * 1000))
+    print('  batch:       {:10.3f} ms'.format(t_batch * 1000))
+    return t_single, t_batch
+
+# -----------------------------------------------------------------------------
+
+def bench_mesh_construction(sizes=(10000, 100000, 1000000), repeat=3):
+    """
+    Compare mesh.from_pydata with blender_helper.Mesh.set_arrays, for
+    meshes with sizes vertices, a curve through all vertices and a quad
+    polygon on every fourth vertex. Blender only.
+    """
+    import bpy
+    from . import blender_helper as bldhlp
+
+    results = []
+    for nverts in sizes:
+        coords = np.random.rand(nverts, 3).astype(np.float32)
+        edges = sodhlp.points_to_edges(nverts)
+        loops = np.arange(nverts - nverts % 4, dtype=np.int32)
+        loop_totals = np.full(len(loops) // 4, 4, dtype=np.int32)
+        
+        def pydata():
+            mesh = bpy.data.meshes.new('bench_pydata')
+            faces = loops.reshape(-1, 4).tolist()
+            mesh.from_pydata(coords.tolist(), edges.tolist(), faces)
+            mesh.update()
+            bpy.data.meshes.remove(mesh)
+        
+        def arrays():
+            mesh = bpy.data.meshes.new('bench_arrays')
+            bldhlp.Mesh.set_arrays(mesh, coords, edges, loops, None, loop_totals)
+            bpy.data.meshes.remove(mesh)
+        
+        t_pydata = time_call(pydata, repeat)
+        t_arrays = time_call(arrays, repeat)
+        print('Mesh construction, {} vertices:'.format(nverts))
+        print('  from_pydata:  {:10.3f} ms'.format(t_pydata * 1000))
+        print('  foreach_set:  {:10.3f} ms'.format(t_arrays * 1000))
+        results.append((nverts, t_pydata, t_arrays))
+    return results
+
+# -----------------------------------------------------------------------------
+
+def bench_element_logging(nelements=100000, repeat=3):
+    """
+    Logging overhead per element at the DEBUG, INFO and WARNING levels:
+    the previous eagerly formatted logging.info line per element, compared
+    with sosi_log_helper.ElementLog. Emitted lines go to a memory stream.
+    """
+    logger = logging.getLogger('sosi_bench')
+    logger.propagate = False
+    handler = logging.StreamHandler(io.StringIO())
+    logger.addHandler(handler)
+    elog = sologhlp.ElementLog(logger)
+    kinds = ['KURVE', 'BUEP', 'FLATE', 'PUNKT']
+    
+    def eager():
+        for i in range(nelements):
+            logger.info('{} {}: Res= 0x{:x} NoOfCoords= {}'.format(kinds[i & 3], i, 0, 12))
+    
+    def lazy():
+        elog.reset()
+        for i in range(nelements):
+            elog.add(kinds[i & 3], i, 0, 12)
+        elog.log_summary()
+    
+    def baseline():
+        for i in range(nelements):
+            kinds[i & 3]
+    
+    results = []
+    try:
+        t_base = time_call(baseline, repeat)
+        print('Element logging, {} elements, per element:'.format(nelements))
+        for level in (logging.DEBUG, logging.INFO, logging.WARNING):
+            logger.setLevel(level)
+            t_eager = time_call(eager, repeat) - t_base
+            t_lazy = time_call(lazy, repeat) - t_base
+            print('  {:<8} eager: {:8.3f} us   ElementLog: {:8.3f} us'.format(
+                logging.getLevelName(level), t_eager / nelements * 1e6, t_lazy / nelements * 1e6))
+            results.append((level, t_eager, t_lazy))
+    finally:
+        logger.removeHandler(handler)
+    return results
+
+# -----------------------------------------------------------------------------
+
+def bench_element_delivery(nelements=100000, ncoords=1, chunk_size=4096, repeat=3):
+    """
+    Mesh accumulation of small elements (PUNKT by default) delivered one
+    call per element versus in sosi_parser.ElementTable chunks.
+    """
+    rng = np.random.default_rng(0)
+    names = ['Fastmerke', 'Kumme', 'Tre']
+    kind = sodhlp.SosiObjId.PUNKT if ncoords == 1 else sodhlp.SosiObjId.KURVE
+    coords = rng.random((nelements, ncoords, 3)) * 1000.0
+    elements = [sopars.SosiElement(kind.value, i, 0, names[i % 3], 3, coords[i], 'bench.sos')
+        for i in range(nelements)]
+    tables = list(sopars.iter_element_chunks(elements, 'bench.sos', chunk_size))
+    logger = logging.getLogger('sosi_bench_delivery')
+    logger.setLevel(logging.INFO)
+    
+    def per_element():
+        acc = soacc.MeshAccumulator(lambda key, md: None, 1 << 40)
+        elog = sologhlp.ElementLog(logger)
+        for elem in elements:
+            acc.add_element(elem.id, (elem.filename, elem.objname, elem.objname), elem.coords,
+                sodhlp.element_attrs(elem.objrefnum, elem.objname, None, elem.sosires))
+            elog.add(kind.name, elem.objrefnum, elem.sosires, len(elem.coords))
+        acc.flush()
+    
+    def chunked():
+        acc = soacc.MeshAccumulator(lambda key, md: None, 1 << 40)
+        elog = sologhlp.ElementLog(logger)
+        for table in tables:
+            acc.add_table(table, [(table.filename, name, name) for name in table.names], table.records['name_id'])
+            elog.add_table(table)
+        acc.flush()
+    
+    t_elem = time_call(per_element, repeat)
+    t_chunk = time_call(chunked, repeat)
+    print('Element delivery, {} {} elements: per element {:.3f} s, chunks of {} {:.3f} s ({:.1f}x)'.format(
+        nelements, kind.name, t_elem, chunk_size, t_chunk, t_elem / t_chunk))
+    return t_elem, t_chunk
+
+# -----------------------------------------------------------------------------
+
+def run_all():
+    bench_coord_handoff(ndims=2)
+    bench_coord_handoff(ndims=3)
+    bench_arc_tessellation(num_splits=8)
+    bench_arc_tessellation(num_splits=0)
+    bench_element_logging()
+    bench_element_delivery()
+    bench_element_delivery(ncoords=8)
+    try:
+        import bpy
+    except ImportError:
+        print('Mesh construction: needs Blender, skipped')
+        return
+    bench_mesh_construction()
+
+# -----------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    run_all()
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright © 2022 Jonny Normann Skålvik
+
+Permission is hereby granted, free of charge, to any person obtaining a copy 
+of this software and associated documentation files (the “Software”), to deal 
+in the Software without restriction, including without limitation the rights 
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell 
+copies of the Software, and to permit persons to whom the Software is 
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in 
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE 
+SOFTWARE.
+
+This file is part of SosiImporter, an addon to import SOSI files containing
+3D model data into Blender.
+"""
+
+import os
+import string
+import hashlib
+import logging
+from . import sosi_settings as soset
+from . import sosi_parser as sopars
+
+# Cache of parsed SOSI files. Each file's ElementTable is stored as a
+# compressed .npz file, named by a hash of the file contents, the reference
+# coordinate and the settings affecting the parsing. The least recently
+# used files are removed when the cache grows beyond its size limit. The
+# element indexes (sosi_index) share the directory, but are not evicted.
+
+CACHE_VERSION = 5   # Increase when the stored ElementTable changes
+
+# Settings affecting the parser output
+CACHE_KEY_SETTINGS = [
+    'SOSI_BUEP_SPLITS',
+    'SOSI_BUEP_CHORD_TOLERANCE',
+    'SOSI_ARC_SEGMENTS'
+]
+
+# Hit/miss counters for this session
+stats = {'hits' : 0, 'misses' : 0}
+
+# (path, size, mtime) -> content hash, to hash each file once per session
+_content_hashes = {}
+
+# -----------------------------------------------------------------------------
+
+def cache_dir():
+    if soset.SOSI_CACHE_DIR:
+        return soset.SOSI_CACHE_DIR
+    return os.path.join(os.path.expanduser('~'), '.sosi_importer_cache')
+
+# -----------------------------------------------------------------------------
+
+def content_hash(filename):
+    st = os.stat(filename)
+    memo_key = (os.path.realpath(filename), st.st_size, st.st_mtime_ns)
+    h = _content_hashes.get(memo_key)
+    if h == None:
+        hsh = hashlib.blake2b(digest_size=20)
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                hsh.update(block)
+        h = hsh.hexdigest()
+        _content_hashes[memo_key] = h
+    return h
+
+# -----------------------------------------------------------------------------
+
+def cache_key(filename, ref_e, ref_n):
+    hsh = hashlib.blake2b(digest_size=20)
+    hsh.update(content_hash(filename).encode())
+    settings = [CACHE_VERSION, repr(ref_e), repr(ref_n), sopars.source_name(filename)]
+    settings += [repr(getattr(soset, name)) for name in CACHE_KEY_SETTINGS]
+    hsh.update('|'.join(str(s) for s in settings).encode())
+    return hsh.hexdigest()
+
+# -----------------------------------------------------------------------------
+
+def is_cache_file(name):
+    """True for the names of the ElementTable files, see cache_key()."""
+    key, ext = os.path.splitext(name)
+    return (ext == '.npz') and (len(key) == 40) and all(c in string.hexdigits for c in key)
+
+# -----------------------------------------------------------------------------
+
+def evict(max_bytes):
+    """Remove the least recently used cache files until below max_bytes."""
+    cdir = cache_dir()
+    entries = []
+    for name in os.listdir(cdir):
+        if is_cache_file(name):
+            st = os.stat(os.path.join(cdir, name))
+            entries.append((st.st_mtime, st.st_size, name))
+    total = sum(e[1] for e in entries)
+    for mtime, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(cdir, name))
+            total -= size
+            logging.debug('Cache: removed %s', name)
+        except OSError:
+            pass
+
+# -----------------------------------------------------------------------------
+
+def load_or_parse(filename, ref_e, ref_n, elem_filter = None):
+    """
+    Return the elements of filename accepted by elem_filter (an
+    sosi_parser.ElementFilter, None for all). Taken from the cache if
+    present, otherwise the whole file is parsed and stored. The file's
+    element index selects the filtered elements: the records of the
+    cached table, or with the cache disabled the blocks read from the file.
+    """
+    if (elem_filter != None) and elem_filter.is_empty():
+        elem_filter = None
+    if not soset.SOSI_CACHE_ENABLED:
+        if (elem_filter != None) and soset.SOSI_INDEX_ENABLED:
+            from . import sosi_index as soidx
+            return soidx.iter_indexed_elements(filename, ref_e, ref_n, elem_filter)
+        return sopars.iter_sosi_elements(filename, ref_e, ref_n, elem_filter)
+    
+    path = os.path.join(cache_dir(), cache_key(filename, ref_e, ref_n) + '.npz')
+    if os.path.isfile(path):
+        try:
+            table = sopars.ElementTable.load(path)
+            os.utime(path)  # Most recently used
+            stats['hits'] += 1
+            logging.debug('Cache hit: %s', filename)
+            return select_elements(filename, table, ref_e, ref_n, elem_filter)
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning('Cache file %s unreadable (%s), parsing again', path, e)
+    
+    stats['misses'] += 1
+    table = sopars.ElementTable.from_elements(sopars.source_name(filename),
+        sopars.iter_sosi_elements(filename, ref_e, ref_n))
+    try:
+        os.makedirs(cache_dir(), exist_ok=True)
+        tmp_path = path + '.tmp'
+        table.save(tmp_path)
+        os.replace(tmp_path, path)
+        evict(soset.SOSI_CACHE_MAX_BYTES)
+    except OSError as e:
+        logging.warning('Cache: could not store %s (%s)', filename, e)
+    return select_elements(filename, table, ref_e, ref_n, elem_filter)
+
+# -----------------------------------------------------------------------------
+
+def select_elements(filename, table, ref_e, ref_n, elem_filter):
+    """
+    The elements of the cached table of filename accepted by elem_filter,
+    only the records selected by the element index, including its spatial
+    grid for the filter window, are decoded.
+    """
+    if (elem_filter != None) and soset.SOSI_INDEX_ENABLED:
+        from . import sosi_index as soidx   # Imports this module
+        index = soidx.load_or_build_index(filename)
+        table = soidx.select_table(index, table, elem_filter)
+    return sopars.filter_elements(table.elements(), elem_filter, ref_e, ref_n)
+
+# -----------------------------------------------------------------------------
+
+def reset_stats():
+    stats['hits'] = 0
+    stats['misses'] = 0
+
+# -----------------------------------------------------------------------------
+
+def log_stats():
+    if soset.SOSI_CACHE_ENABLED:
+        logging.info('Cache: {} hits, {} misses ({})'.format(stats['hits'], stats['misses'], cache_dir()))
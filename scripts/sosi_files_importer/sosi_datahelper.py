@@ -24,7 +24,17 @@ This file is part of SosiImporter, an addon to import SOSI files containing
 3D model data into Blender.
 """
 
+import zlib
+import numpy as np
 from enum import Enum
+from . import sosi_settings as soset
+
+# -----------------------------------------------------------------------------
+
+# Result flags reported per SOSI element (sosires)
+RES_SOSI_GENERAL_ERROR	    = 0x0001
+RES_SOSI_DIMENSION_MISMATCH = 0x0010
+RES_SOSI_LOOP_UNCLOSED      = 0x0100
 
 # -----------------------------------------------------------------------------
 
@@ -51,4 +61,75 @@ def intary_to_trilist(ints, ilen):
     trilist = []
     for i in range(0, ilen):
         trilist.append((ints[3 * i], ints[3 * i + 1], ints[3 * i + 2]))
-    return trilist
\ No newline at end of file
+    return trilist
+
+# -----------------------------------------------------------------------------
+
+# npts: number of sequential points
+# return (npts - 1, 2) array of point indices defining edges
+def points_to_edges(npts):
+    edges = np.empty((max(npts - 1, 0), 2), dtype=np.int32)
+    edges[:, 0] = np.arange(0, npts - 1)
+    edges[:, 1] = edges[:, 0] + 1
+    return edges
+
+# -----------------------------------------------------------------------------
+
+def coord_buffer_to_array(pcoord_ary, ndims, ncoords):
+    """
+    Wrap the ctypes double pointer pcoord_ary as an (ncoords, ndims) array
+    without copying. The array is only valid as long as the buffer is, 
+    i.e. during the DLL callback.
+    """
+    if ncoords == 0:
+        return np.empty((0, ndims))
+    return np.ctypeslib.as_array(pcoord_ary, shape=(ncoords, ndims))
+
+# -----------------------------------------------------------------------------
+
+def coords_to_3D(coords):
+    """Return the (n, 2) or (n, 3) coords as an (n, 3) array, z = 0.0 for 2D."""
+    if coords.shape[1] == 3:
+        return coords
+    pts = np.zeros((len(coords), 3))
+    pts[:, :2] = coords
+    return pts
+
+# -----------------------------------------------------------------------------
+
+# Properties of the SOSI element each vertex/polygon comes from, stored
+# as mesh attributes (Blender attribute name, type). refnum is 64 bit as in
+# sosi_parser.ELEMENT_DTYPE, Blender INT attributes are 32 bit.
+ELEMENT_ATTR_DTYPE = np.dtype([
+    ('refnum', 'i8'),
+    ('objtype', 'i4'),
+    ('hoyde', 'f4'),
+    ('sosires', 'i4'),
+    ('rotation', 'f4')])    # About Z [radians], see retning_rotation()
+
+ELEMENT_ATTR_NAMES = {
+    'refnum' : ('sosi_refnum', 'INT'),
+    'objtype' : ('sosi_objtype', 'INT'),
+    'hoyde' : ('sosi_hoyde', 'FLOAT'),
+    'sosires' : ('sosi_flags', 'INT'),
+    'rotation' : ('sosi_rotation', 'FLOAT')
+}
+
+def objtype_id(objtype):
+    """Integer id of an OBJTYPE name, the same in every import."""
+    return zlib.crc32(objtype.encode('utf-8')) & 0x7fffffff
+
+def element_attrs(refnum, objname, hoyde, sosires, retning = None):
+    """The ELEMENT_ATTR_DTYPE values of one element, hoyde and retning None if unknown."""
+    return (refnum, objtype_id(objname), float('nan') if hoyde == None else hoyde, sosires,
+        0.0 if retning == None else float(retning_rotation(retning)))
+
+def retning_rotation(retning):
+    """
+    The rotation about Z [radians, counter clockwise from east] of ..RETNING
+    values, given clockwise from north in SOSI_RETNING_FULL_CIRCLE units.
+    NaN (no ..RETNING) gives 0.0.
+    """
+    retning = np.asarray(retning, dtype=np.float64)
+    rotation = np.pi * 0.5 - retning * (2.0 * np.pi / soset.SOSI_RETNING_FULL_CIRCLE)
+    return np.where(np.isnan(retning), 0.0, rotation)
\ No newline at end of file
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright © 2022 Jonny Normann Skålvik
+
+Permission is hereby granted, free of charge, to any person obtaining a copy 
+of this software and associated documentation files (the “Software”), to deal 
+in the Software without restriction, including without limitation the rights 
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell 
+copies of the Software, and to permit persons to whom the Software is 
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in 
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE 
+SOFTWARE.
+
+This file is part of SosiImporter, an addon to import SOSI files containing
+3D model data into Blender.
+"""
+
+import os
+import json
+import shutil
+import struct
+import tempfile
+import numpy as np
+from . import sosi_geom_helper as sogeohlp
+
+# Streaming mesh file writers, used by the command line converter. The
+# meshes are written as they are committed by the mesh accumulator, so
+# memory use does not grow with the file size. Formats with counts or
+# lengths in the header (PLY, glTF) write the data to temporary files
+# first. Vertex coordinates are relative to the reference coordinate.
+
+# -----------------------------------------------------------------------------
+
+def polygon_starts(loop_totals):
+    starts = np.zeros(len(loop_totals), dtype=np.int64)
+    np.cumsum(loop_totals[:-1], out=starts[1:])
+    return starts
+
+# -----------------------------------------------------------------------------
+
+def triangulate_mesh_polygons(vertices, loops, loop_totals):
+    """Triangles (vertex indices) for all polygons of a mesh, ear clipped."""
+    parts = [np.empty((0, 3), dtype=np.int64)]
+    for start, total in zip(polygon_starts(loop_totals), loop_totals):
+        ring = loops[start:start + total]
+        parts.append(ring[sogeohlp.triangulate_polygon_2D(vertices[ring])])
+    return np.concatenate(parts)
+
+# -----------------------------------------------------------------------------
+
+class ObjWriter():
+    """Wavefront OBJ, one 'o' group per committed mesh."""
+
+    extension = '.obj'
+
+    def __init__(self, path, ref_e, ref_n):
+        self.f = open(path, 'w')
+        self.f.write('# SOSI export, reference coordinate E{} N{}\n'.format(ref_e, ref_n))
+        self.nverts = 0
+
+    def write_mesh(self, name, md):
+        vertices = md.vertices()
+        base = self.nverts + 1
+        self.f.write('o {}\n'.format(name.replace(' ', '_')))
+        np.savetxt(self.f, vertices, fmt='v %.3f %.3f %.3f')
+        edges = md.edges()
+        loops = md.loops()
+        if len(edges) > 0:
+            np.savetxt(self.f, edges + base, fmt='l %d %d')
+        if len(loops) > 0:
+            for start, total in zip(polygon_starts(md.loop_totals()), md.loop_totals()):
+                self.f.write('f ' + ' '.join(map(str, loops[start:start + total] + base)) + '\n')
+        # PUNKT vertices, also in meshes with curves or polygons
+        points = np.flatnonzero(md.loose_vertices())
+        if len(points) > 0:
+            np.savetxt(self.f, points + base, fmt='p %d')
+        self.nverts += len(vertices)
+
+    def close(self):
+        self.f.close()
+
+# -----------------------------------------------------------------------------
+
+class PlyWriter():
+    """Binary little endian PLY with vertex, edge and face elements."""
+
+    extension = '.ply'
+
+    def __init__(self, path, ref_e, ref_n):
+        self.path = path
+        self.ref = (ref_e, ref_n)
+        tmp_dir = os.path.dirname(os.path.abspath(path))
+        self.vert_file = tempfile.TemporaryFile(dir=tmp_dir)
+        self.edge_file = tempfile.TemporaryFile(dir=tmp_dir)
+        self.face_file = tempfile.TemporaryFile(dir=tmp_dir)
+        self.nverts = 0
+        self.nedges = 0
+        self.nfaces = 0
+
+    def write_mesh(self, name, md):
+        base = self.nverts
+        self.vert_file.write(np.ascontiguousarray(md.vertices(), dtype='<f4').tobytes())
+        self.nverts += md.nverts
+        edges = md.edges()
+        if len(edges) > 0:
+            self.edge_file.write((edges.astype('<i4') + base).tobytes())
+            self.nedges += len(edges)
+        loop_totals = md.loop_totals()
+        if len(loop_totals) > 0:
+            # Each face: count followed by the vertex indices
+            loops = md.loops().astype('<i4') + base
+            starts = polygon_starts(loop_totals)
+            rec = np.empty(len(loops) + len(loop_totals), dtype='<i4')
+            count_pos = starts + np.arange(len(loop_totals))
+            rec[count_pos] = loop_totals
+            mask = np.ones(len(rec), dtype=bool)
+            mask[count_pos] = False
+            rec[mask] = loops
+            self.face_file.write(rec.tobytes())
+            self.nfaces += len(loop_totals)
+
+    def close(self):
+        header = ['ply', 'format binary_little_endian 1.0',
+            'comment SOSI export, reference coordinate E{} N{}'.format(*self.ref),
+            'element vertex {}'.format(self.nverts),
+            'property float x', 'property float y', 'property float z',
+            'element edge {}'.format(self.nedges),
+            'property int vertex1', 'property int vertex2',
+            'element face {}'.format(self.nfaces),
+            'property list int int vertex_indices',
+            'end_header']
+        with open(self.path, 'wb') as f:
+            f.write(('\n'.join(header) + '\n').encode('ascii'))
+            for tmp in (self.vert_file, self.edge_file, self.face_file):
+                tmp.seek(0)
+                shutil.copyfileobj(tmp, f)
+                tmp.close()
+
+# -----------------------------------------------------------------------------
+
+class GlbWriter():
+    """
+    Binary glTF 2.0, one node and mesh per committed mesh, with POINTS,
+    LINES and TRIANGLES primitives. glTF is Y up: (x, y, z) is written as
+    (x, z, -y).
+    """
+
+    extension = '.glb'
+
+    def __init__(self, path, ref_e, ref_n):
+        self.path = path
+        self.bin_file = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(path)))
+        self.nbytes = 0
+        self.gltf = {
+            'asset' : {'version' : '2.0', 'generator' : 'sosi_files_importer',
+                'extras' : {'reference_e' : ref_e, 'reference_n' : ref_n}},
+            'scene' : 0,
+            'scenes' : [{'nodes' : []}],
+            'nodes' : [],
+            'meshes' : [],
+            'accessors' : [],
+            'bufferViews' : []
+        }
+
+    def add_view(self, data, target):
+        data = data.tobytes()
+        self.gltf['bufferViews'].append({'buffer' : 0, 'byteOffset' : self.nbytes,
+            'byteLength' : len(data), 'target' : target})
+        pad = (-len(data)) % 4
+        self.bin_file.write(data + b'\0' * pad)
+        self.nbytes += len(data) + pad
+        return len(self.gltf['bufferViews']) - 1
+
+    def add_accessor(self, view, component_type, count, acc_type, vmin = None, vmax = None):
+        acc = {'bufferView' : view, 'componentType' : component_type,
+            'count' : int(count), 'type' : acc_type}
+        if vmin != None:
+            acc['min'] = vmin
+            acc['max'] = vmax
+        self.gltf['accessors'].append(acc)
+        return len(self.gltf['accessors']) - 1
+
+    def add_indices(self, indices, mode, position):
+        view = self.add_view(np.ascontiguousarray(indices, dtype='<u4').ravel(), 34963)
+        acc = self.add_accessor(view, 5125, indices.size, 'SCALAR')
+        return {'attributes' : {'POSITION' : position}, 'indices' : acc, 'mode' : mode}
+
+    def write_mesh(self, name, md):
+        v = md.vertices()
+        if len(v) == 0:
+            return
+        pos = np.empty((len(v), 3), dtype='<f4')
+        pos[:, 0] = v[:, 0]
+        pos[:, 1] = v[:, 2]
+        pos[:, 2] = -v[:, 1]
+        view = self.add_view(pos, 34962)
+        position = self.add_accessor(view, 5126, len(pos), 'VEC3',
+            pos.min(axis=0).tolist(), pos.max(axis=0).tolist())
+        prims = []
+        edges = md.edges()
+        if len(edges) > 0:
+            prims.append(self.add_indices(edges, 1, position))
+        if md.npolys > 0:
+            tris = triangulate_mesh_polygons(v, md.loops(), md.loop_totals())
+            if len(tris) > 0:
+                prims.append(self.add_indices(tris, 4, position))
+        if len(prims) == 0:
+            prims.append({'attributes' : {'POSITION' : position}, 'mode' : 0})
+        else:
+            # PUNKT vertices in a mesh with curves or polygons
+            points = np.flatnonzero(md.loose_vertices())
+            if len(points) > 0:
+                prims.append(self.add_indices(points, 0, position))
+        self.gltf['meshes'].append({'name' : name, 'primitives' : prims})
+        self.gltf['nodes'].append({'name' : name, 'mesh' : len(self.gltf['meshes']) - 1})
+        self.gltf['scenes'][0]['nodes'].append(len(self.gltf['nodes']) - 1)
+
+    def close(self):
+        self.gltf['buffers'] = [{'byteLength' : self.nbytes}]
+        js = json.dumps(self.gltf, separators=(',', ':')).encode('utf-8')
+        js += b' ' * ((-len(js)) % 4)
+        total = 12 + 8 + len(js) + 8 + self.nbytes
+        with open(self.path, 'wb') as f:
+            f.write(struct.pack('<4sII', b'glTF', 2, total))
+            f.write(struct.pack('<I4s', len(js), b'JSON'))
+            f.write(js)
+            f.write(struct.pack('<I4s', self.nbytes, b'BIN\0'))
+            self.bin_file.seek(0)
+            shutil.copyfileobj(self.bin_file, f)
+        self.bin_file.close()
+
+# -----------------------------------------------------------------------------
+
+WRITERS = {
+    'obj' : ObjWriter,
+    'ply' : PlyWriter,
+    'glb' : GlbWriter
+}
@@ -27,8 +27,10 @@ This file is part of SosiImporter, an addon to import SOSI files containing
 import numpy as np
 import math
 import logging
+import functools
 from . import sosi_log_helper as sologhlp
 from . import sosi_settings as soset
+from . import sosi_triangulate as sotri
 
 # -----------------------------------------------------------------------------
 
@@ -294,11 +296,11 @@ def arc_pts_segments_3D(arc_pts, num_splits):
     v2 = arr[2] - arr[1]
     logging.debug(' Arc vectors:\n %s %s', v1, v2)
     vn = np.cross(v1, v2) # Normal to vector plane
-    logging.debug(' Normal vector:\n %s',  sologhlp.formatArray(vn))
+    logging.debug(' Normal vector:\n %s',  sologhlp.LazyArray(vn))
     vz = np.array([0.0, 0.0, 1.0])
     # Rotation vector
     vr = np.cross(vn, vz) # Between normal and z vector
-    logging.debug(' Rotation vector:\n%s', sologhlp.formatArray(vr))
+    logging.debug(' Rotation vector:\n%s', sologhlp.LazyArray(vr))
     # rotation angle
     a = angle_vector_3D(vn, vz, True)
     logging.debug(' Rotation angle:\n%s', math.degrees(a))
@@ -306,9 +308,9 @@ def arc_pts_segments_3D(arc_pts, num_splits):
     if (a != 0.0) and (a != math.pi):
         rot_mtx = get_rotation_matrix(vr, a)
         logging.debug(' Rotation matrix:\n%s', rot_mtx)
-        logging.debug(' Arc pts pre:\n%s', sologhlp.formatArray(arc_pts))
+        logging.debug(' Arc pts pre:\n%s', sologhlp.LazyArray(arc_pts))
         arc_pts_horz = rotate_pts_3D(rot_mtx, arc_pts)
-        logging.debug(' Arc pts post:\n%s', sologhlp.formatArray(arc_pts_horz))
+        logging.debug(' Arc pts post:\n%s', sologhlp.LazyArray(arc_pts_horz))
     else:
         arc_pts_horz = arc_pts
         #ctr2D = get_arc_center_2D(arc_pts_horz[0], arc_pts_horz[1], arc_pts_horz[2])
@@ -318,16 +320,16 @@ def arc_pts_segments_3D(arc_pts, num_splits):
     logging.debug(' Circle center:\n%s', ctr3D)
     # Append the center point to the list
     cir_pts_hor = [arc_pts_horz[0], arc_pts_horz[1], arc_pts_horz[2], np.array(ctr3D)]
-    logging.debug(' Circle points:\n%s', sologhlp.formatArray(cir_pts_hor))
+    logging.debug(' Circle points:\n%s', sologhlp.LazyArray(cir_pts_hor))
     
     # Translation to origo
     trans_mtx1 = get_translation_matrix([-ctr3D[0], -ctr3D[1], 0]) # Translate circle center to origo
     cir_pts_hor_origo = transform_pts_3D(trans_mtx1, cir_pts_hor)
-    logging.debug(' Circle points around origo:\n%s', sologhlp.formatArray(cir_pts_hor_origo))
+    logging.debug(' Circle points around origo:\n%s', sologhlp.LazyArray(cir_pts_hor_origo))
     
     # Interpolate into arc segment points
     arc_pts_horz_origo = arc_pts_interpolate_2D(cir_pts_hor_origo, num_splits)
-    logging.debug(' Circle points around origo:\n%s', sologhlp.formatArray(arc_pts_horz_origo))
+    logging.debug(' Circle points around origo:\n%s', sologhlp.LazyArray(arc_pts_horz_origo))
     
     # Translation back
     trans_mtx2 = get_translation_matrix([ctr3D[0], ctr3D[1], 0]) # Circle center back
@@ -340,4 +342,369 @@ def arc_pts_segments_3D(arc_pts, num_splits):
             arc_pts_nonhorz.append(np.transpose(rot_mtx) @ ap)
     else:
         arc_pts_nonhorz = arc_pts_horz
-    return arc_pts_nonhorz
\ No newline at end of file
+    return arc_pts_nonhorz
+# -----------------------------------------------------------------------------
+
+def rotation_matrices(axes, thetas):
+    """
+    Vectorized get_rotation_matrix: axes is an (N, 3) array of rotation
+    axes, thetas the N rotation angles in radians.
+    Return the (N, 3, 3) array of rotation matrices.
+    """
+    axes = axes / np.linalg.norm(axes, axis=1)[:, None]
+    a = np.cos(thetas / 2.0)
+    bcd = -axes * np.sin(thetas / 2.0)[:, None]
+    b, c, d = bcd[:, 0], bcd[:, 1], bcd[:, 2]
+    aa, bb, cc, dd = a*a, b*b, c*c, d*d
+    bc, ad, ac, ab, bd, cd = b*c, a*d, a*c, a*b, b*d, c*d
+    mtx = np.empty((len(a), 3, 3))
+    mtx[:, 0, 0] = aa+bb-cc-dd
+    mtx[:, 0, 1] = 2*(bc+ad)
+    mtx[:, 0, 2] = 2*(bd-ac)
+    mtx[:, 1, 0] = 2*(bc-ad)
+    mtx[:, 1, 1] = aa+cc-bb-dd
+    mtx[:, 1, 2] = 2*(cd+ab)
+    mtx[:, 2, 0] = 2*(bd+ac)
+    mtx[:, 2, 1] = 2*(cd-ab)
+    mtx[:, 2, 2] = aa+dd-bb-cc
+    return mtx
+
+# -----------------------------------------------------------------------------
+
+def angles_circle_abs_2D_batch(pts):
+    """
+    Vectorized angles_circle_abs_2D: pts is an (..., 2) array of coordinates
+    relative to the circle center. Return angles in range 0 <= angl < 2 * pi.
+    """
+    x = pts[..., 0]
+    y = pts[..., 1]
+    radius = np.sqrt(x**2 + y**2)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        angls = np.arcsin(y / radius)
+    angls = np.where(x < 0., math.pi - angls, np.where(y < 0., 2 * math.pi + angls, angls))
+    return angls
+
+# -----------------------------------------------------------------------------
+
+class _ArcCircles():
+    """
+    Circle data for N BUEP elements, computed as in arc_pts_segments_3D:
+    the arc planes are rotated to horizontal, and the centers, radii,
+    start angles and sweeps of the two arcs found in that plane.
+    """
+
+    def __init__(self, arcs):
+        narcs = len(arcs)
+        self.arcs = arcs
+        
+        # Rotate the arc planes to horizontal
+        vn = np.cross(arcs[:, 0] - arcs[:, 1], arcs[:, 2] - arcs[:, 1])
+        vn_len = np.linalg.norm(vn, axis=1)
+        degenerate = (vn_len == 0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            a = np.arccos(vn[:, 2] / vn_len)
+        vr = np.stack((vn[:, 1], -vn[:, 0], np.zeros(narcs)), axis=1)  # vn x (0, 0, 1)
+        rotate = ~degenerate & (a != 0.0) & (a != math.pi)
+        self.rot_mtx = np.broadcast_to(np.eye(3), (narcs, 3, 3)).copy()
+        if np.any(rotate):
+            self.rot_mtx[rotate] = rotation_matrices(vr[rotate], a[rotate])
+        horz = np.einsum('nij,nkj->nki', self.rot_mtx, arcs)
+        self.z = horz[:, 0, 2]
+        
+        # Circle centers
+        x1, y1 = horz[:, 0, 0], horz[:, 0, 1]
+        x2, y2 = horz[:, 1, 0], horz[:, 1, 1]
+        x3, y3 = horz[:, 2, 0], horz[:, 2, 1]
+        d = 2 * (x2 * y1 - x3 * y1 - x1 * y2 + x3 * y2 + x1 * y3 - x2 * y3)
+        degenerate |= (d == 0.0)
+        d = np.where(d == 0.0, 1.0, d)
+        n = (-x2 * x2 * y1 + x3 * x3 * y1 + x1 * x1 * y2 - x3 * x3 * y2 \
+            + y1 * y1 * y2 - y1 * y2 * y2 - x1 * x1 * y3 + x2 * x2 * y3 \
+            - y1 * y1 * y3 + y2 * y2 * y3 + y1 * y3 * y3 - y2 * y3 * y3)
+        self.ctr_x = -(n / d)
+        n = -x1 * x1 * x2 + x1 * x2 * x2 + x1 * x1 * x3 - x2 * x2 * x3 \
+            - x1 * x3 * x3 + x2 * x3 * x3 - x2 * y1 * y1 + x3 * y1 * y1 \
+            + x1 * y2 * y2 - x3 * y2 * y2 - x1 * y3 * y3 + x2 * y3 * y3
+        self.ctr_y = -(n / d)
+        self.degenerate = degenerate
+        
+        # Start angles and sweeps of the two arcs, relative to the centers
+        rel = horz[:, :, :2] - np.stack((self.ctr_x, self.ctr_y), axis=1)[:, None, :]
+        self.radius = np.sqrt(rel[:, 0, 0]**2 + rel[:, 0, 1]**2)
+        self.angls = angles_circle_abs_2D_batch(rel)
+        dot = rel[:, :-1, 0] * rel[:, 1:, 0] + rel[:, :-1, 1] * rel[:, 1:, 1]
+        det = rel[:, :-1, 0] * rel[:, 1:, 1] - rel[:, :-1, 1] * rel[:, 1:, 0]
+        self.angls_diff = np.arctan2(det, dot)
+
+    def to_3D(self, sel, x, y):
+        """
+        Points in the horizontal plane of the arcs sel, given as x and y
+        relative to the circle centers, rotated back to original position.
+        x and y are (len(sel), k) arrays, return a (len(sel), k, 3) array.
+        """
+        seg = np.empty(x.shape + (3,))
+        seg[:, :, 0] = x + self.ctr_x[sel, None]
+        seg[:, :, 1] = y + self.ctr_y[sel, None]
+        seg[:, :, 2] = self.z[sel, None]
+        return np.einsum('nji,nkj->nki', self.rot_mtx[sel], seg)
+
+# -----------------------------------------------------------------------------
+
+def arcs_pts_segments_3D(arcs, num_splits):
+    """
+    Batch version of arc_pts_segments_3D for N BUEP elements at once.
+    arcs is an (N, 3, 3) array, three 3D-coordinates per element assumed to
+    lie on a circle (i.e. two arcs). Each arc is split into num_splits
+    segments, or a number computed from the angle if num_splits is 0.
+    Return (pts, offsets): pts is an (M, 3) array holding the segment points
+    of all elements, the points of element i are pts[offsets[i]:offsets[i+1]].
+    Elements with collinear points are returned unchanged.
+    """
+    arcs = np.asarray(arcs, dtype=np.float64).reshape(-1, 3, 3)
+    narcs = len(arcs)
+    if narcs == 0:
+        return np.empty((0, 3)), np.zeros(1, dtype=np.int64)
+    
+    cir = _ArcCircles(arcs)
+    angls = cir.angls
+    angls_diff = cir.angls_diff
+    if num_splits == 0:
+        angl_less = np.where(np.abs(angls_diff[:, 0]) > np.abs(angls_diff[:, 1]),
+            angls_diff[:, 1], angls_diff[:, 0])
+        splits = np.ceil(np.abs((angl_less * soset.SOSI_ARC_SEGMENTS) / (2 * math.pi))).astype(np.int64)
+        splits = np.maximum(splits, 1)
+    else:
+        splits = np.full(narcs, num_splits, dtype=np.int64)
+    npts = np.where(cir.degenerate, 3, 2 * splits + 1)
+    offsets = np.zeros(narcs + 1, dtype=np.int64)
+    np.cumsum(npts, out=offsets[1:])
+    pts = np.empty((offsets[-1], 3))
+    
+    # Segment points, arcs with the same number of splits in one go
+    valid = ~cir.degenerate
+    for ns in np.unique(splits[valid]):
+        sel = np.nonzero(valid & (splits == ns))[0]
+        j = np.arange(ns)
+        seg_angls = np.empty((len(sel), 2 * ns + 1))
+        seg_angls[:, :ns] = angls[sel, 0, None] + j * (angls_diff[sel, 0, None] / ns)
+        seg_angls[:, ns:2 * ns] = angls[sel, 1, None] + j * (angls_diff[sel, 1, None] / ns)
+        seg_angls[:, -1] = angls[sel, 2]
+        r = cir.radius[sel, None]
+        seg = cir.to_3D(sel, np.cos(seg_angls) * r, np.sin(seg_angls) * r)
+        idx = offsets[sel, None] + np.arange(2 * ns + 1)
+        pts[idx.ravel()] = seg.reshape(-1, 3)
+    
+    _copy_degenerate_arcs(cir, pts, offsets)
+    _snap_arc_ends(cir, pts, offsets)
+    return pts, offsets
+
+# -----------------------------------------------------------------------------
+
+def _snap_arc_ends(cir, pts, offsets):
+    # The end points exactly as given, shared with the neighbouring elements
+    pts[offsets[:-1]] = cir.arcs[:, 0]
+    pts[offsets[1:] - 1] = cir.arcs[:, 2]
+
+def _copy_degenerate_arcs(cir, pts, offsets):
+    for i in np.nonzero(cir.degenerate)[0]:
+        logging.warning('BUEP points on a line, drawn as line segments')
+        pts[offsets[i]:offsets[i + 1]] = cir.arcs[i]
+
+# -----------------------------------------------------------------------------
+
+@functools.lru_cache(maxsize=32)
+def unit_circle_table(nsegs):
+    """
+    cos and sin for the angles k * 2 * pi / nsegs, k = 0 .. nsegs, i.e. the
+    points of a unit circle split into nsegs segments. Cached, read only.
+    """
+    angls = np.arange(nsegs + 1) * (2 * math.pi / nsegs)
+    table = np.stack((np.cos(angls), np.sin(angls)))
+    table.flags.writeable = False
+    return table
+
+# -----------------------------------------------------------------------------
+
+# Upper limit for chord_circle_segments()
+SOSI_ARC_MAX_CIRCLE_SEGMENTS = 2 ** 16
+
+def chord_circle_segments(radius, chord_tol):
+    """
+    Number of segments for a full circle with the given radii such that no
+    chord deviates more than chord_tol from the circle. The counts are
+    rounded up to powers of two (min. 8) to share unit_circle_table()s.
+    """
+    ratio = np.clip(1.0 - chord_tol / np.maximum(radius, 1e-12), -1.0, 1.0)
+    max_step = np.minimum(2 * np.arccos(ratio), math.pi / 4)
+    nsegs = np.ceil(2 * math.pi / np.maximum(max_step, 1e-6))
+    nsegs = 2 ** np.ceil(np.log2(np.maximum(nsegs, 8))).astype(np.int64)
+    return np.minimum(nsegs, SOSI_ARC_MAX_CIRCLE_SEGMENTS)
+
+# -----------------------------------------------------------------------------
+
+def arcs_pts_chord_3D(arcs, chord_tol):
+    """
+    As arcs_pts_segments_3D(), but the number of segments is given by the
+    max. chord deviation chord_tol (same unit as the coordinates). Each arc
+    is stepped along the unit circle table for its radius; the last segment
+    of an arc may be shorter. The three given points are always included.
+    Return (pts, offsets) as arcs_pts_segments_3D().
+    """
+    arcs = np.asarray(arcs, dtype=np.float64).reshape(-1, 3, 3)
+    narcs = len(arcs)
+    if narcs == 0:
+        return np.empty((0, 3)), np.zeros(1, dtype=np.int64)
+    
+    cir = _ArcCircles(arcs)
+    valid = ~cir.degenerate
+    nsegs = chord_circle_segments(cir.radius, chord_tol)
+    step = 2 * math.pi / nsegs
+    # Number of segments for each of the two arcs
+    msegs = np.maximum(np.ceil(np.abs(cir.angls_diff) / step[:, None] - 1e-9), 1).astype(np.int64)
+    npts = np.where(valid, msegs[:, 0] + msegs[:, 1] + 1, 3)
+    offsets = np.zeros(narcs + 1, dtype=np.int64)
+    np.cumsum(npts, out=offsets[1:])
+    pts = np.empty((offsets[-1], 3))
+    
+    for ns in np.unique(nsegs[valid]):
+        sel = np.nonzero(valid & (nsegs == ns))[0]
+        table = unit_circle_table(ns)
+        for i_arc in range(2):
+            # Ragged point indices k = 0 .. msegs - 1 for all selected arcs
+            m = msegs[sel, i_arc]
+            starts = np.zeros(len(sel), dtype=np.int64)
+            np.cumsum(m[:-1], out=starts[1:])
+            owner = np.repeat(np.arange(len(sel)), m)
+            k = np.arange(m.sum()) - starts[owner]
+            
+            a0 = cir.angls[sel, i_arc][owner]
+            sign = np.sign(cir.angls_diff[sel, i_arc])[owner]
+            ck = table[0][k]
+            sk = table[1][k] * sign
+            r = cir.radius[sel][owner]
+            x = (np.cos(a0) * ck - np.sin(a0) * sk) * r
+            y = (np.sin(a0) * ck + np.cos(a0) * sk) * r
+            
+            seg = np.empty((len(k), 3))
+            seg[:, 0] = x + cir.ctr_x[sel][owner]
+            seg[:, 1] = y + cir.ctr_y[sel][owner]
+            seg[:, 2] = cir.z[sel][owner]
+            seg = np.einsum('nji,nj->ni', cir.rot_mtx[sel][owner], seg)
+            first = offsets[sel] + (0 if i_arc == 0 else msegs[sel, 0])
+            pts[first[owner] + k] = seg
+        # End point
+        a2 = cir.angls[sel, 2]
+        r = cir.radius[sel]
+        end = cir.to_3D(sel, (np.cos(a2) * r)[:, None], (np.sin(a2) * r)[:, None])
+        pts[offsets[sel + 1] - 1] = end[:, 0]
+    
+    _copy_degenerate_arcs(cir, pts, offsets)
+    _snap_arc_ends(cir, pts, offsets)
+    return pts, offsets
+
+# -----------------------------------------------------------------------------
+
+def buep_pts_segments_3D(arcs):
+    """
+    Segment points for the (N, 3, 3) BUEP point triples arcs according to
+    the settings: chord tolerance if SOSI_BUEP_CHORD_TOLERANCE > 0.0,
+    otherwise SOSI_BUEP_SPLITS segments per arc.
+    Return (pts, offsets) as arcs_pts_segments_3D().
+    """
+    if soset.SOSI_BUEP_CHORD_TOLERANCE > 0.0:
+        return arcs_pts_chord_3D(arcs, soset.SOSI_BUEP_CHORD_TOLERANCE)
+    return arcs_pts_segments_3D(arcs, soset.SOSI_BUEP_SPLITS)
+
+# -----------------------------------------------------------------------------
+
+def clip_polyline_box(pts, box):
+    """
+    Clip the (n, ndims) polyline pts to the box (xmin, ymin, xmax, ymax)
+    with Liang-Barsky, all segments at once. z is interpolated.
+    Return the list of the pieces inside the box.
+    """
+    if len(pts) < 2:
+        return []
+    p0 = pts[:-1]
+    d = pts[1:] - p0
+    t0 = np.zeros(len(d))
+    t1 = np.ones(len(d))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for p, q in ((-d[:, 0], p0[:, 0] - box[0]), (d[:, 0], box[2] - p0[:, 0]),
+            (-d[:, 1], p0[:, 1] - box[1]), (d[:, 1], box[3] - p0[:, 1])):
+            r = q / p
+            parallel = (p == 0.0)
+            t0 = np.where((p < 0.0), np.maximum(t0, r), t0)
+            t1 = np.where((p > 0.0), np.minimum(t1, r), t1)
+            t1 = np.where(parallel & (q < 0.0), -1.0, t1)   # Parallel and outside
+    keep = t0 <= t1
+    if not keep.any():
+        return []
+    a = p0 + d * t0[:, None]
+    b = p0 + d * t1[:, None]
+    # Runs of kept segments joined at the original vertices
+    joined = keep[:-1] & keep[1:] & (t1[:-1] == 1.0) & (t0[1:] == 0.0)
+    pieces = []
+    idx = np.nonzero(keep)[0]
+    start = idx[0]
+    for i, j in zip(idx[:-1], idx[1:]):
+        if (j != i + 1) or not joined[i]:
+            pieces.append(np.vstack((a[start:i + 1], b[i:i + 1])))
+            start = j
+    pieces.append(np.vstack((a[start:idx[-1] + 1], b[idx[-1]:idx[-1] + 1])))
+    return pieces
+
+# -----------------------------------------------------------------------------
+
+def clip_polygon_box(pts, box):
+    """
+    Clip the (n, ndims) polygon ring pts (not repeating the first point) to
+    the box (xmin, ymin, xmax, ymax) with Sutherland-Hodgman, vectorized
+    per box edge. z is interpolated. Return the clipped ring.
+    """
+    for axis, limit, inside_le in ((0, box[0], False), (0, box[2], True),
+        (1, box[1], False), (1, box[3], True)):
+        if len(pts) == 0:
+            break
+        v = pts[:, axis] - limit
+        inside = (v <= 0.0) if inside_le else (v >= 0.0)
+        nxt = np.roll(pts, -1, axis=0)
+        v_nxt = np.roll(v, -1)
+        inside_nxt = np.roll(inside, -1)
+        crossing = inside != inside_nxt
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = v / (v - v_nxt)
+            cross_pts = pts + (nxt - pts) * t[:, None]
+        # Per vertex: the vertex if inside, then the crossing towards the next
+        nout = inside.astype(np.int64) + crossing
+        out = np.empty((nout.sum(), pts.shape[1]))
+        first = np.cumsum(nout) - nout
+        out[first[inside]] = pts[inside]
+        out[(first + inside)[crossing]] = cross_pts[crossing]
+        pts = out
+    if len(pts) > 1:
+        # Vertices on the box edges give repeated points
+        pts = pts[np.any(pts != np.roll(pts, 1, axis=0), axis=1)]
+    if len(pts) < 3:
+        return pts[:0]
+    return pts
+
+# -----------------------------------------------------------------------------
+
+def polygon_area_2D(pts):
+    """Signed area of the ring pts (x, y), positive when counter clockwise."""
+    x = pts[:, 0]
+    y = pts[:, 1]
+    return 0.5 * (np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y))
+
+# -----------------------------------------------------------------------------
+
+def triangulate_polygon_2D(pts, holes = None):
+    """
+    Triangulate the polygon pts (x, y used), the outer ring followed by
+    the hole rings starting at the indices holes, see sosi_triangulate.
+    Return an (m, 3) int array of indices into pts, counter clockwise.
+    """
+    if len(pts) < 3:
+        return np.empty((0, 3), dtype=np.int64)
+    return sotri.triangulate(pts, holes)
@@ -27,20 +27,23 @@ This file is part of SosiImporter, an addon to import SOSI files containing
 import bpy
 import os
 import sys
+import time
 import numpy as np
-import ctypes
-from ctypes import wintypes
 import logging
 from . import sosi_settings as soset
 from . import sosi_log_helper as sologhlp
 from . import sosi_geom_helper as sogeohlp
+from . import sosi_parser as sopars
+from . import sosi_accumulator as soacc
+from . import sosi_pipeline as sopipe
+from . import sosi_cache as socache
+from . import sosi_scan as sosca
+from . import sosi_spatial as sospat
+from . import sosi_stats as sostat
+from . import sosi_backend as sobknd
 
 # -----------------------------------------------------------------------------
 
-RES_SOSI_GENERAL_ERROR	    = 0x0001
-RES_SOSI_DIMENSION_MISMATCH = 0x0010
-RES_SOSI_LOOP_UNCLOSED      = 0x0100
-
 #C = bpy.context
 #D = bpy.data
 
@@ -55,13 +58,12 @@ try:
     in_blender = os.path.basename(bpy.app.binary_path or '').lower().startswith('blender')
 except ModuleNotFoundError:
     in_blender = False   
-#print('INFO: Blender environment:', in_blender)
 
 if (in_blender == True):
     from . import sosi_datahelper as sodhlp    
     from . import blender_helper as bldhlp
     from bpy.types import AddonPreferences
-    from bpy.props import EnumProperty
+    from bpy.props import EnumProperty, BoolProperty
 else:
     import sosi_datahelper as sodhlp    
     import blender_helper as bldhlp
@@ -73,12 +75,6 @@ else:
 #import blender_helper as bldhlp
 #from sosi_importer import blender_helper as bldhlp # from directory sosi_importer
 
-c_int = ctypes.c_int
-c_int32 = ctypes.c_int32
-c_double = ctypes.c_double
-c_void_p = ctypes.c_void_p
-c_char_p = ctypes.c_char_p
-
 # -----------------------------------------------------------------------------
 
 class SosiImporterPreferences(AddonPreferences):
@@ -88,7 +84,6 @@ class SosiImporterPreferences(AddonPreferences):
     def update_log_level(self, context):
         logging.info("Setting log level to %s", self.log_level)
         #logging.setLevel(self.log_level)
-        #print('-->', self.log_level)
         return
     
     # Debug levels:
@@ -113,221 +108,352 @@ class SosiImporterPreferences(AddonPreferences):
         update = update_log_level,  # update method when changing
         default = 'INFO')
     
-#    def update_test_xenums(self, context):
-#        print("Hey")
-#        return
-#    
-#    test_xenums = [
-#        ('ONE', "One", "eqwe"),
-#        ('TWO', "Two", "sdaasd"),
-#        ('THREE', "Three", "dsfasdf")
-#        ]
-#    
-#    test_xenum: EnumProperty(
-#        name = "Some name",
-#        description = "Some description",
-#        items = test_xenums,
-#        update = update_test_xenums,
-#        default = 'THREE' 
-#        )
+    write_stats: BoolProperty(
+        name = "Write import statistics",
+        description = "Write the stage timings and counters of each import to a JSON file",
+        default = False)
+    
+    profile_cpu: BoolProperty(
+        name = "Profile imports (cProfile)",
+        description = "Run the imports under cProfile, slower. The profile is written next to the statistics",
+        default = False)
+    
+    profile_memory: BoolProperty(
+        name = "Trace memory (tracemalloc)",
+        description = "Record the peak Python memory use of the imports, much slower",
+        default = False)
+    
+    punkt_symbols: BoolProperty(
+        name = "PUNKT symbols",
+        description = "Show a shared symbol mesh per OBJTYPE on the PUNKT elements (geometry nodes instances, Blender 3.2+)",
+        default = False)
+    
+    backends = [
+        (sobknd.BACKEND_DLL, "Native library", "The SOSI DLL, Windows only", 0),
+        (sobknd.BACKEND_PYTHON, "Python parser", "The Python parser, all platforms", 1)
+        ]
+    
+    backend: EnumProperty(
+        name = "Parser",
+        description = "Parser used by Import SOSI Data",
+        items = backends,
+        default = sobknd.default_backend_name())
    
     def draw(self, context):
         layout = self.layout
         layout.prop(self, "log_level")
-#        layout.prop(self, "test_xenum")
+        layout.prop(self, "write_stats")
+        layout.prop(self, "profile_cpu")
+        layout.prop(self, "profile_memory")
+        layout.prop(self, "backend")
+        layout.prop(self, "punkt_symbols")
 
 # -----------------------------------------------------------------------------
 
-def coord_array_to_list(ndims, ncoords, ary):
-    coordList = []
-    if (ndims == 2):
-        for i in range(ncoords):
-            coordList.append((ary[i * 2], ary[i * 2 + 1], 0.0))
-    else: # ndims == 3
-        for i in range(ncoords):
-            coordList.append((ary[i * 3], ary[i * 3 + 1], ary[i * 3 + 2]))
-    return coordList
+# Called per chunk of sosi objects (sosi_parser.ElementTable) by the import backend
+def chunk_callback(table):
+	
+    t0 = time.perf_counter()
+    keys, key_ids = sospat.table_keys(table, 0.0, 0.0, 0.0)
+    res = process_element_table(table, keys, key_ids)
+    sostat.stats.add_time('callback', time.perf_counter() - t0)
+    return res
 
 # -----------------------------------------------------------------------------
 
-def get_full_path(rel_path):
-    dir_path = os.path.dirname(os.path.realpath(__file__))
-    head_path, tail_path = os.path.split(dir_path)
-    return os.path.join(head_path, rel_path)
+# Value types of the Blender attribute types
+BLENDER_ATTR_DTYPES = {'INT' : np.int32, 'FLOAT' : np.float32}
 
-# -----------------------------------------------------------------------------
+# The element attributes stored per vertex on mesh, defaults where the
+# attribute is missing (objects from an import without attributes)
+def get_element_attributes(mesh):
+    values = np.zeros(len(mesh.vertices), dtype=sodhlp.ELEMENT_ATTR_DTYPE)
+    values['hoyde'] = np.nan
+    values['rotation'] = 0.0
+    for field, (name, attr_type) in sodhlp.ELEMENT_ATTR_NAMES.items():
+        old = bldhlp.Mesh.get_attribute(mesh, name, 'POINT', BLENDER_ATTR_DTYPES[attr_type])
+        if (old is not None) and (len(old) == len(values)):
+            values[field] = old
+    return values
 
-def free_library(handle):
-    kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
-    #kernel32.FreeLibrary.argtypes = [ctypes.wintypes.HMODULE]
-    #kernel32.FreeLibrary.restype = ctypes.wintypes.BOOL
-    kernel32.FreeLibrary.argtypes = [wintypes.HMODULE]
-    kernel32.FreeLibrary.restype = wintypes.BOOL
-    kernel32.FreeLibrary(handle)
+# Store the element attributes as one vertex attribute per field. Polygons get
+# theirs through their vertices, every FLATE has vertices of its own. Values
+# out of the 32 bit range of INT attributes (large REF numbers) are clamped.
+def set_element_attributes(mesh, values):
+    for field, (name, attr_type) in sodhlp.ELEMENT_ATTR_NAMES.items():
+        dtype = BLENDER_ATTR_DTYPES[attr_type]
+        value = values[field]
+        if attr_type == 'INT':
+            info = np.iinfo(dtype)
+            if (len(value) > 0) and ((value.min() < info.min) or (value.max() > info.max)):
+                logging.warning('{} values out of the 32 bit range are clamped'.format(name))
+                value = np.clip(value, info.min, info.max)
+        bldhlp.Mesh.set_attribute(mesh, name, attr_type, 'POINT', value.astype(dtype))
 
-# -----------------------------------------------------------------------------
+# Create the Blender object, or extend the existing one, for the mesh data
+# accumulated for key (collection name, object name, OBJTYPE)
+def commit_mesh(key, meshdata):
+    
+    with sostat.stats.stage('mesh_commit'):
+        commit_mesh_data(key, meshdata)
 
-# Function will be called per sosi object and return ptr to object name, ptr to coordinate array 
-def my_cb_func(id, objrefnum, sosires, pobjname, ndims, ncoords, pcoord_ary, pfilename):
-	
-    #global top_parent
-    #print('PAR2 before:', top_parent)
+def commit_mesh_data(key, meshdata):
     
     sosi_parent_name = "SOSI_Parent"  
     top_parent = bldhlp.get_or_create_SOSI_parent_object(sosi_parent_name)
-	
-    objname = pobjname.decode('utf-8')  # Interpret the byte array as utf-8
-    #print(objname)
-    # NUMPY copy
-    a = np.fromiter(pcoord_ary, dtype=np.double, count=ndims * ncoords)
-    coord_list = coord_array_to_list(ndims, ncoords, a)
-    #print("A", coord_list)
-    #bpy.ops.object.mode_set(mode = 'OBJECT')
-    filename = pfilename.decode('utf8')
-    #print(filename) # pfilename is already utf8
-    coll = bldhlp.Collection.get_or_create_linked_subcollection_by_name('SOSI', filename)
+    coll_name, objname, objtype = key
     
-    if (sodhlp.SosiObjId(id) == sodhlp.SosiObjId.PUNKT):
-        ob = bldhlp.Mesh.point_cloud(objname, coord_list)
-        
-        if bldhlp.get_mesh_obj_named(objname) != None:
-            ob = bldhlp.mesh_obj_join_existing(objname, ob)
-            #print('  Joined', ob.data)
-            logging.debug('  Joined', ob.data)
-        else:
-            ob.parent = top_parent
-            #bpy.context.collection.objects.link(ob)
-            coll.objects.link(ob)
-            
-        bldhlp.lock_obj_to_parent(ob)
-        #print('PUNKT {}: Res= 0x{:x} NoOfCoords= {}'.format(objrefnum, sosires, ncoords))
-        logging.info('PUNKT {}: Res= 0x{:x} NoOfCoords= {}'.format(objrefnum, sosires, ncoords))
-    elif (sodhlp.SosiObjId(id) == sodhlp.SosiObjId.KURVE):
-        #print("A", coord_list)
-        edg_list = sodhlp.points_to_edglist(coord_list)
-        #print("B", edg_list)
-        ob = bldhlp.Mesh.point_cloud(objname, coord_list, edg_list)
-        
-        if bldhlp.get_mesh_obj_named(objname) != None:
-            ob = bldhlp.mesh_obj_join_existing(objname, ob)
-            #print('  Joined', ob.data)
-            logging.debug('  Joined', ob.data)
-        else:
-            ob.parent = top_parent
-            #bpy.context.collection.objects.link(ob)
-            coll.objects.link(ob)
-            
-        bldhlp.lock_obj_to_parent(ob)
-        #print('KURVE {}: Res= 0x{:x} NoOfCoords= {}'.format(objrefnum, sosires, ncoords))
-        logging.info('KURVE {}: Res= 0x{:x} NoOfCoords= {}'.format(objrefnum, sosires, ncoords))
-    elif (sodhlp.SosiObjId(id) == sodhlp.SosiObjId.FLATE):
-        #print("A", coord_list)
-        edg_list = sodhlp.points_to_edglist(coord_list)
-        ob = bldhlp.Mesh.point_cloud(objname, coord_list, edg_list)
-        
-        if bldhlp.get_mesh_obj_named(objname) != None:
-            ob = bldhlp.mesh_obj_join_existing(objname, ob)
-            #print('  Joined', ob.data)
-            logging.debug('  Joined', ob.data)
-        else:
-            ob.parent = top_parent
-            #ob = bldhlp.Mesh.point_cloud(filename, coord_list, edg_list)
-            #bpy.context.collection.objects.link(ob)
-            coll.objects.link(ob)
-            
-        bldhlp.lock_obj_to_parent(ob)
-        #print ('FLATE {}: Res= 0x{:x} NoOfCoords= {}'.format(objrefnum, sosires, ncoords))
-        logging.info('FLATE {}: Res= 0x{:x} NoOfCoords= {}'.format(objrefnum, sosires, ncoords))
-        if (sosires & RES_SOSI_DIMENSION_MISMATCH):
-            print('  WARNING: Dimension mismatch in FLATE elements, drawing might be strange.')
-        bpy.ops.object.select_all(action='DESELECT')
-        bpy.context.view_layer.objects.active = ob
-        ob.select_set(True)
-        bpy.ops.object.mode_set(mode = 'EDIT') 
-        bpy.ops.mesh.select_mode(type="EDGE")
-        bpy.ops.mesh.select_all(action = 'SELECT')
-        bpy.ops.mesh.edge_face_add() # Make the ngon
-        #bpy.ops.mesh.quads_convert_to_tris(quad_method='BEAUTY', ngon_method='BEAUTY') # Triangulate
-        bpy.ops.object.mode_set(mode = 'OBJECT')
-    elif (sodhlp.SosiObjId(id) == sodhlp.SosiObjId.BUEP):
-        num_segs = 8
-        arc_seg_pts = sogeohlp.arc_pts_segments_3D(coord_list, num_segs)
-        edg_list = sodhlp.points_to_edglist(arc_seg_pts)
-        ob = bldhlp.Mesh.point_cloud(objname, arc_seg_pts, edg_list)
+    attrs = meshdata.vertex_attrs()
+    ob = bldhlp.get_mesh_obj_named(objname)
+    if ob != None:
+        sostat.stats.count('mesh joins')
+        attrs = np.concatenate((get_element_attributes(ob.data), attrs))
+        bldhlp.Mesh.append_arrays(ob.data, meshdata.vertices(), meshdata.edges(),
+            meshdata.loops(), meshdata.loop_totals())
+        logging.debug('  Joined %s', ob.data)
+    else:
+        ob = bldhlp.Mesh.from_arrays(objname, meshdata.vertices(), meshdata.edges(),
+            meshdata.loops(), meshdata.loop_totals())
+        sostat.stats.count('meshes created')
+        bldhlp.register_mesh_obj(objname, ob)
+        ob.parent = top_parent
+        coll = bldhlp.Collection.get_or_create_linked_subcollection_by_name('SOSI', coll_name)
+        coll.objects.link(ob)
+    set_element_attributes(ob.data, attrs)
+    # OBJTYPE names of the sosi_objtype values
+    names = dict(ob.get('sosi_objtypes', {}))
+    names[str(sodhlp.objtype_id(objtype))] = objtype
+    ob['sosi_objtypes'] = names
+    if get_addon_prefs().punkt_symbols and bldhlp.PointSymbols.supported() and \
+        np.any(meshdata.loose_vertices()):
+        symbol = bldhlp.PointSymbols.symbol_object(objtype, soset.SOSI_PUNKT_SYMBOL_SIZE)
+        bldhlp.PointSymbols.add_modifier(ob, symbol)
         
-        if bldhlp.get_mesh_obj_named(objname) != None:
-            ob = bldhlp.mesh_obj_join_existing(objname, ob)
-            #print('  Joined', ob.data)
-            logging.debug('  Joined', ob.data)
-        else:
-            ob.parent = top_parent
-            #bpy.context.collection.objects.link(ob)
-            coll.objects.link(ob)
-            
-        bldhlp.lock_obj_to_parent(ob)
-        #print('BUEP {}: Res= 0x{:x} NoOfCoords= {}'.format(objrefnum, sosires, ncoords))
-        logging.info('BUEP {}: Res= 0x{:x} NoOfCoords= {}'.format(objrefnum, sosires, ncoords))
+    bldhlp.lock_obj_to_parent(ob)
+    logging.debug('%s: %d elements, %d vertices', objname, meshdata.nelements, meshdata.nverts)
+
+# Elements are collected per object name and collection, and the meshes
+# created when flushed
+mesh_accumulator = soacc.MeshAccumulator(commit_mesh, soset.SOSI_ACCUMULATOR_MAX_BYTES)
+
+# -----------------------------------------------------------------------------
+
+# Add the sosi objects of table to the Blender object(s) of their keys,
+# see sosi_spatial.table_keys()
+def process_element_table(table, keys, key_ids):
+	
+    mesh_accumulator.add_table(table, keys, key_ids)
+    element_log.add_table(table)
         
     return 0
 
+# Element counts per kind instead of a log line per element
+element_log = sologhlp.ElementLog()
+
+def log_element_summary():
+    element_log.log_summary()
+    nmismatch = element_log.count_flag(sodhlp.RES_SOSI_DIMENSION_MISMATCH, 'FLATE')
+    if nmismatch > 0:
+        logging.warning('Dimension mismatch in {} FLATE elements, drawing might be strange.'.format(nmismatch))
+
 # -----------------------------------------------------------------------------
 
-def do_imports():
-    
-    preferences = bpy.context.preferences
-    addon_prefs = preferences.addons[__package__].preferences
+def get_addon_prefs():
+    return bpy.context.preferences.addons[__package__].preferences
+
+def get_addon_logger():
+    addon_prefs = get_addon_prefs()
     
     #logger = sologhlp.get_logger(soset.ACT_LOG_LEVEL)
-    logger = sologhlp.get_logger(addon_prefs.log_level)
+    return sologhlp.get_logger(addon_prefs.log_level)
+
+# Stage timers and counters for one import, see sosi_stats.instrumented()
+def import_instrumentation(label):
+    addon_prefs = get_addon_prefs()
+    return sostat.instrumented(label, addon_prefs.write_stats, addon_prefs.profile_cpu,
+        addon_prefs.profile_memory)
+
+# -----------------------------------------------------------------------------
+
+# Import with a session backend (sosi_backend), the DLL by default. The
+# backend selects the files, e.g. the DLL by its own dialog.
+def do_imports(backend = None):
+    
+    logger = get_addon_logger()
     
     global top_parent
     top_parent = None
     
-    if soset.USE_DEBUG_DLL_PATH == True:
-        dll_path = soset.DEBUG_DLL_PATH
-    else:
-        rel_path = soset.REL_DLL_PATH
-        dll_path = get_full_path(rel_path)
-    
-    my_dll = ctypes.WinDLL(dll_path)
-    
-    #Prototype callback
-    callback_type = ctypes.CFUNCTYPE(c_int, c_int, c_int, c_int, c_char_p, c_int, c_int, ctypes.POINTER(c_double), c_char_p)
-    my_callback = callback_type(my_cb_func)  # Use a variable to avoid garbage collection
-    
-    # Prototype get_SosiInputObjects()
-    my_dll.get_SosiInputObjects.argtypes = [ctypes.POINTER(c_double), ctypes.POINTER(c_double), ctypes.POINTER(c_double), ctypes.c_double, ctypes.c_double, ctypes.c_int, ctypes.c_int, ctypes.c_double]
-    my_dll.get_SosiInputObjects.restype = c_int
-    
-    #Prototype process_SosiFiles()
-    my_dll.process_SosiFiles.argtypes = [c_int, c_void_p]
-    my_dll.process_SosiFiles.restype = c_int
+    if backend == None:
+        backend = sobknd.get_backend(sobknd.BACKEND_DLL)
     
     bldscale = 1.0  # bldhlp.LocalUnits.scene_unit_factor() # STRANGE??? Blender takes numbers as m always???
-    #print("Blender scale factor:", bldscale)
     #bldhlp.setMyEnvironment()   # TEMPORARY to set my local environment
     
-    peasting = (ctypes.c_double)()
-    pnorthing = (ctypes.c_double)()
-    punity = (ctypes.c_double)()
     clip_end = bldhlp.SceneSettings.get_clip_end()
-    #unit_system = bpy.context.scene.unit_settings.system
-    #unit_length = bpy.context.scene.unit_settings.length_unit
-    #print(unit_system, unit_length)
     unit_system = bldhlp.UnitSettings.scene_unit_system_get()
     unit_length = bldhlp.UnitSettings.scene_unit_length_get()
     unit_scale = bldhlp.UnitSettings.scene_unit_scale_get()
-    #print(unit_system, unit_length, unit_scale)
  
-    nfiles = my_dll.get_SosiInputObjects(peasting, pnorthing, punity, bldscale, clip_end, unit_system, unit_length, unit_scale)
-    # print(peasting, pnorthing, punity, nfiles)
+    try:
+        inputs = backend.get_inputs(bldscale, clip_end, unit_system, unit_length, unit_scale)
+        nfiles = inputs.nfiles
+        
+        if (nfiles > 0):
+            with import_instrumentation('{}, {} files'.format(backend.name, nfiles)) as stats:
+                bldhlp.ImportRegistry.begin()
+                mesh_accumulator.reset_stats()
+                element_log.reset()
+                try:
+                    with stats.stage('backend_process'):
+                        res = backend.process_chunks(nfiles, chunk_callback)
+                    # Parsing is what is left without the callbacks
+                    callback = stats.stages.get('callback', [0.0, 0])[0]
+                    stats.add_time('backend_parse', stats.stages['backend_process'][0] - callback)
+                    mesh_accumulator.flush()
+                finally:
+                    mesh_accumulator.discard()
+                    bldhlp.ImportRegistry.end()
+                mesh_accumulator.log_arc_stats()
+                log_element_summary()
+    finally:
+        # Unload the lib so we can change and recompile it without restarting Blender
+        if soset.SOSI_DLL_RELOAD_EACH_IMPORT and (backend.name == sobknd.BACKEND_DLL):
+            sobknd.close_backend(sobknd.BACKEND_DLL)
+    
+    return nfiles
+
+# -----------------------------------------------------------------------------
+
+# Parse the files in worker processes, only the Blender meshes are
+# created here. The objects are created in the same order as when
+# importing the files one by one.
+# Yields the progress (0 .. 1) after each mesh and while waiting for the
+# workers, see iter_imports_python().
+# When closed early (the import cancelled) the results of the files not
+# imported yet are released too.
+def import_files_parallel(filenames, easting, northing, elem_filter, tile_size, weld = None):
+    
+    results = sopipe.build_files_parallel(filenames, easting, northing, elem_filter, tile_size,
+        element_log=element_log, weld=weld, poll_seconds=soset.SOSI_MODAL_SLICE_SECONDS)
+    nfiles_done = 0
+    try:
+        for item in sostat.stats.timed_iter('wait_workers', results):
+            if item == None:
+                yield nfiles_done / len(filenames)
+                continue
+            filename, result, narcs, narc_pts = item
+            logging.info('Importing {}'.format(filename))
+            try:
+                for key, meshdata in result.meshes():
+                    commit_mesh(key, meshdata)
+                    mesh_accumulator.nwelded += meshdata.nwelded
+                    yield nfiles_done / len(filenames)
+            finally:
+                result.release()
+            mesh_accumulator.narcs += narcs
+            mesh_accumulator.narc_pts += narc_pts
+            nfiles_done += 1
+    finally:
+        results.close()
+
+# -----------------------------------------------------------------------------
+
+# Commit the meshes flushed to pending one by one, yielding the progress
+# after each, see import_files_python()
+def commit_pending(pending, progress):
+    
+    while len(pending) > 0:
+        key, meshdata = pending.pop(0)
+        commit_mesh(key, meshdata)
+        yield progress
+
+# -----------------------------------------------------------------------------
+
+# Import the SOSI files using the Python parser instead of the DLL.
+# Usable on all platforms, the file names are given by the caller.
+# elem_filter: sosi_parser.ElementFilter selecting the elements, None for all.
+# tile_size: split the objects into tile collections of this size (metres)
+# weld: merge the shared vertices of an object, SOSI_WELD_VERTICES when None
+def do_imports_python(ref_filename, filenames, elem_filter = None, tile_size = 0.0, weld = None):
+    
+    for progress in iter_imports_python(ref_filename, filenames, elem_filter, tile_size, weld):
+        pass
+    return len(filenames)
+
+# -----------------------------------------------------------------------------
+
+# As do_imports_python(), but a generator doing the import in small steps
+# and yielding the progress (0 .. 1) in between, for the modal operator.
+# Closing the generator cancels the import, the meshes already created
+# are kept.
+def iter_imports_python(ref_filename, filenames, elem_filter = None, tile_size = 0.0, weld = None):
     
-    if (nfiles > 0):
-        res = my_dll.process_SosiFiles(nfiles, my_callback)
+    logger = get_addon_logger()
     
-    # Unload the lib so we can change and recompile the lib without restarting the Python environment
-    lib_handle = my_dll._handle
-    #del my_dll
-    free_library(lib_handle)
+    easting, northing = sopars.read_reference_file(ref_filename)
+    logging.info('Reference coordinate: E{} N{}'.format(easting, northing))
     
-    return nfiles
+    with import_instrumentation('Python, {} files'.format(len(filenames))) as stats:
+        yield from stats.profile_steps(import_files_python(filenames, easting, northing, elem_filter,
+            tile_size, weld))
+        for name, count in socache.stats.items():
+            stats.count('cache ' + name, count)
+
+# -----------------------------------------------------------------------------
+
+# Import the files with the Python parser, in worker processes when there
+# are several. Yields the progress, see iter_imports_python(): after each
+# SOSI_MODAL_CHUNK_ELEMENTS elements and after each mesh created.
+def import_files_python(filenames, easting, northing, elem_filter, tile_size, weld = None):
+    
+    stats = sostat.stats
+    bldhlp.ImportRegistry.begin()
+    mesh_accumulator.reset_stats()
+    element_log.reset()
+    socache.reset_stats()
+    nelements = []
+    for filename in filenames:
+        # Already done if the tag selection dialog was shown
+        with stats.stage('scan'):
+            scan = sosca.scan_sosi_file(filename)
+        stats.count('bytes read', os.path.getsize(filename))
+        nelements.append(scan.nelements())
+        logging.info('{}: {} elements {}'.format(filename, scan.nelements(), scan.kinds))
+    # Progress by the elements in the files, filtered out ones included
+    ntotal = max(sum(nelements), 1)
+    ndone = 0
+    pending = []    # Flushed meshes, created one per step
+    mesh_accumulator.commit_func = lambda key, meshdata: pending.append((key, meshdata))
+    try:
+        if (len(filenames) > 1) and (sopipe.default_processes(len(filenames)) > 1):
+            yield from import_files_parallel(filenames, easting, northing, elem_filter, tile_size, weld)
+        else:
+            for filename, nfile in zip(filenames, nelements):
+                logging.info('Importing {}'.format(filename))
+                mesh_accumulator.weld = sopipe.weld_vertices(weld)
+                chunks = sopipe.load_chunks(filename, easting, northing, elem_filter,
+                    soset.SOSI_MODAL_CHUNK_ELEMENTS)
+                nfile_done = 0
+                for table in stats.timed_iter('parse', chunks):
+                    keys, key_ids = sospat.table_keys(table, easting, northing, tile_size)
+                    process_element_table(table, keys, key_ids)
+                    nfile_done += len(table)
+                    progress = (ndone + min(nfile_done, nfile)) / ntotal
+                    yield from commit_pending(pending, progress)
+                    yield progress
+                mesh_accumulator.flush()
+                ndone += nfile
+                yield from commit_pending(pending, ndone / ntotal)
+                yield ndone / ntotal
+    finally:
+        # Nothing left behind for the next import when cancelled
+        mesh_accumulator.discard()
+        mesh_accumulator.commit_func = commit_mesh
+        pending.clear()
+        mesh_accumulator.weld = False
+        bldhlp.ImportRegistry.end()
+    mesh_accumulator.log_arc_stats()
+    mesh_accumulator.log_weld_stats()
+    log_element_summary()
+    socache.log_stats()
\ No newline at end of file
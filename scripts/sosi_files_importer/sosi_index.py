@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright © 2022 Jonny Normann Skålvik
+
+Permission is hereby granted, free of charge, to any person obtaining a copy 
+of this software and associated documentation files (the “Software”), to deal 
+in the Software without restriction, including without limitation the rights 
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell 
+copies of the Software, and to permit persons to whom the Software is 
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in 
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE 
+SOFTWARE.
+
+This file is part of SosiImporter, an addon to import SOSI files containing
+3D model data into Blender.
+"""
+
+import os
+import hashlib
+import logging
+import numpy as np
+from . import sosi_datahelper as sodhlp
+from . import sosi_parser as sopars
+from . import sosi_cache as socache
+from . import sosi_spatial as sospat
+
+# Element offset index of a SOSI file: one record per element with its
+# byte range, kind, OBJTYPE, point count and extents. Stored next to the
+# parse cache and rebuilt when the size or modification time of the file
+# changes. Used to read only the selected elements of a file.
+
+INDEX_VERSION = 1
+
+INDEX_DTYPE = np.dtype([
+    ('offset', 'i8'),       # Byte offset of the element line
+    ('length', 'i8'),       # Bytes up to the next element
+    ('kind', 'i1'),         # SosiObjId value, UKJENT for other elements
+    ('refnum', 'i8'),
+    ('objtype_id', 'i4'),   # Index into SosiIndex.objtypes, -1 if none
+    ('npoints', 'i4'),
+    ('hoyde', 'f8'),        # ..HØYDE, NaN if none
+    ('min_e', 'f8'),        # Extents in file coordinates, NaN if unknown.
+    ('min_n', 'f8'),        # BUEP: the extents of the whole circle.
+    ('max_e', 'f8'),        # FLATE: the extents of the referenced curves.
+    ('max_n', 'f8'),
+    ('min_h', 'f8'),        # Height range, NaN for 2D elements
+    ('max_h', 'f8')])
+
+# -----------------------------------------------------------------------------
+
+class SosiIndex():
+    """
+    The index of one file. records is an INDEX_DTYPE array in file order,
+    the ..REF curve numbers of element i are
+    refs[ref_offsets[i]:ref_offsets[i + 1]] (FLATE only).
+    """
+
+    def __init__(self, size, mtime_ns, head_length, records, objtypes, refs, ref_offsets):
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.head_length = head_length      # Bytes before the first element
+        self.records = records
+        self.objtypes = objtypes
+        self.refs = refs
+        self.ref_offsets = ref_offsets
+        self._refnum_order = None
+        self._grid = None
+
+    def is_valid_for(self, st):
+        return (self.size == st.st_size) and (self.mtime_ns == st.st_mtime_ns)
+
+    def find_refnum(self, refnum):
+        """Return the record indices of the elements with reference number refnum."""
+        if self._refnum_order is None:
+            self._refnum_order = np.argsort(self.records['refnum'], kind='stable')
+        keys = self.records['refnum'][self._refnum_order]
+        lo = np.searchsorted(keys, refnum, side='left')
+        hi = np.searchsorted(keys, refnum, side='right')
+        return self._refnum_order[lo:hi]
+
+    def spatial_grid(self):
+        if self._grid == None:
+            self._grid = sospat.SpatialGrid(np.stack((self.records['min_e'], self.records['min_n'],
+                self.records['max_e'], self.records['max_n']), axis=1))
+        return self._grid
+
+    def select(self, elem_filter):
+        """
+        Return a boolean mask of the records which may pass elem_filter.
+        The test is conservative, the parser applies the filter exactly.
+        """
+        rec = self.records
+        mask = rec['kind'] != sodhlp.SosiObjId.UKJENT.value
+        if elem_filter == None:
+            return mask
+        if elem_filter.kinds != None:
+            mask &= np.isin(rec['kind'], list(elem_filter.kinds))
+        if elem_filter.objtypes != None:
+            ids = [i for i, name in enumerate(self.objtypes) if name in elem_filter.objtypes]
+            mask &= (rec['objtype_id'] < 0) | np.isin(rec['objtype_id'], ids)
+        with np.errstate(invalid='ignore'):
+            if elem_filter.bbox != None:
+                in_window = np.zeros(len(rec), dtype=bool)
+                in_window[self.spatial_grid().query(elem_filter.bbox)] = True
+                mask &= in_window
+            if elem_filter.hoyde_range != None:
+                lo, hi = elem_filter.hoyde_range
+                flate = rec['kind'] == sodhlp.SosiObjId.FLATE.value
+                mask &= flate | ((rec['max_h'] >= lo) & (rec['min_h'] <= hi))
+        return mask
+
+    def flate_refnums(self, mask):
+        """The curve reference numbers used by the selected FLATE records."""
+        rows = np.nonzero(mask & (self.records['kind'] == sodhlp.SosiObjId.FLATE.value))[0]
+        if len(rows) == 0:
+            return np.empty(0, dtype=np.int64)
+        parts = [self.refs[self.ref_offsets[i]:self.ref_offsets[i + 1]] for i in rows]
+        return np.unique(np.concatenate(parts))
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            np.savez(f, version=INDEX_VERSION, size=self.size, mtime_ns=self.mtime_ns,
+                head_length=self.head_length, records=self.records,
+                objtypes=np.array(self.objtypes, dtype=str), refs=self.refs,
+                ref_offsets=self.ref_offsets)
+
+    @staticmethod
+    def load(path):
+        with np.load(path) as data:
+            if int(data['version']) != INDEX_VERSION:
+                return None
+            return SosiIndex(int(data['size']), int(data['mtime_ns']), int(data['head_length']),
+                data['records'], [str(n) for n in data['objtypes']], data['refs'], data['ref_offsets'])
+
+# -----------------------------------------------------------------------------
+
+def _arc_extents(coords):
+    """Extents of the circle through three points, or of the points."""
+    if len(coords) == 3:
+        (x1, y1), (x2, y2), (x3, y3) = coords[:, :2]
+        d = 2.0 * (x1 * (y2 - y3) + x2 * (y3 - y1) + x3 * (y1 - y2))
+        if abs(d) > 1e-12:
+            s1 = x1 * x1 + y1 * y1
+            s2 = x2 * x2 + y2 * y2
+            s3 = x3 * x3 + y3 * y3
+            cx = (s1 * (y2 - y3) + s2 * (y3 - y1) + s3 * (y1 - y2)) / d
+            cy = (s1 * (x3 - x2) + s2 * (x1 - x3) + s3 * (x2 - x1)) / d
+            r = np.hypot(x1 - cx, y1 - cy)
+            return cx - r, cy - r, cx + r, cy + r
+    return coords[:, 0].min(), coords[:, 1].min(), coords[:, 0].max(), coords[:, 1].max()
+
+# -----------------------------------------------------------------------------
+
+def build_index(filename):
+    """Read all of filename once and return its SosiIndex."""
+    st = os.stat(filename)
+    header = sopars.SosiHeader()
+    rows = []
+    objtypes = []
+    objtype_ids = {}
+    refs = []
+    ref_offsets = [0]
+    head_length = None
+    elem = None
+    elem_offset = 0
+    in_head = False
+    offset = 0
+    nan = float('nan')
+
+    def finish(elem, end):
+        kind = sopars.SOSI_ELEMENT_IDS.get(elem.kind, sodhlp.SosiObjId.UKJENT).value
+        objtype_id = -1
+        if elem.objtype != None:
+            objtype_id = objtype_ids.setdefault(elem.objtype, len(objtypes))
+            if objtype_id == len(objtypes):
+                objtypes.append(elem.objtype)
+        ext = (nan, nan, nan, nan)
+        hrange = (nan, nan)
+        npoints = 0
+        if (kind != sodhlp.SosiObjId.FLATE.value) and (len(elem.coord_lines) > 0):
+            try:
+                coords = elem.coords(header, 0.0, 0.0)
+            except ValueError:
+                coords = np.empty((0, 2))   # Skipped by the parser, no extents
+            npoints = len(coords)
+            if npoints > 0:
+                if kind == sodhlp.SosiObjId.BUEP.value:
+                    ext = _arc_extents(coords)
+                else:
+                    ext = (coords[:, 0].min(), coords[:, 1].min(), coords[:, 0].max(), coords[:, 1].max())
+                if coords.shape[1] == 3:
+                    hrange = (coords[:, 2].min(), coords[:, 2].max())
+        elem_refs = []
+        if kind == sodhlp.SosiObjId.FLATE.value:
+            for ring in sopars.parse_ref_tokens(elem.refs):
+                elem_refs.extend(refnum for refnum, reverse in ring)
+        refs.extend(elem_refs)
+        ref_offsets.append(len(refs))
+        hoyde = nan if elem.hoyde == None else elem.hoyde
+        rows.append((elem_offset, end - elem_offset, kind, elem.refnum, objtype_id, npoints, hoyde) + tuple(ext) + hrange)
+
+    with open(filename, 'rb') as f:
+        for line in f:
+            start = offset
+            offset += len(line)
+            if line[:1] != b'.':
+                if elem == None:
+                    continue
+                if elem.in_coords:
+                    elem.add_coord_line(line)
+                elif elem.in_refs:
+                    elem.refs.extend(sopars.decode_line(line, header).split())
+                continue
+            level, tag, values = sopars.split_tag(sopars.decode_line(line, header))
+            if level == 1:
+                if elem != None:
+                    finish(elem, start)
+                    elem = None
+                in_head = (tag == 'HODE')
+                if tag == 'SLUTT':
+                    break
+                if not in_head:
+                    if head_length == None:
+                        head_length = start
+                    refnum = 0
+                    if len(values) > 0:
+                        try:
+                            refnum = int(values[0].rstrip(':'))
+                        except ValueError:
+                            pass
+                    elem = sopars._ElementBuilder(tag, refnum)
+                    elem_offset = start
+                continue
+            if in_head:
+                header.set_tag(tag, values)
+                continue
+            if elem == None:
+                continue
+            elem.in_coords = False
+            elem.in_refs = False
+            if level != 2:
+                continue
+            if tag in ('NØ', 'NØH'):
+                elem.in_coords = True
+                elem.has_h = (tag == 'NØH')
+                rest = line.split(None, 1)
+                if len(rest) > 1:
+                    elem.add_coord_line(rest[1])
+            elif tag == 'OBJTYPE' and len(values) > 0:
+                elem.objtype = values[0]
+            elif tag == 'HØYDE' and len(values) > 0:
+                elem.hoyde = float(values[0])
+            elif tag == 'REF':
+                elem.in_refs = True
+                elem.refs.extend(values)
+        if elem != None:
+            finish(elem, offset)
+
+    records = np.array(rows, dtype=INDEX_DTYPE)
+    if head_length == None:
+        head_length = offset
+    _set_flate_extents(records, np.array(refs, dtype=np.int64), np.array(ref_offsets, dtype=np.int64))
+    return SosiIndex(st.st_size, st.st_mtime_ns, head_length, records, objtypes,
+        np.array(refs, dtype=np.int64), np.array(ref_offsets, dtype=np.int64))
+
+# -----------------------------------------------------------------------------
+
+def _set_flate_extents(records, refs, ref_offsets):
+    """FLATE extents and point counts from the referenced curves."""
+    flates = np.nonzero(records['kind'] == sodhlp.SosiObjId.FLATE.value)[0]
+    if len(flates) == 0:
+        return
+    curves = np.nonzero(records['kind'] != sodhlp.SosiObjId.FLATE.value)[0]
+    order = curves[np.argsort(records['refnum'][curves], kind='stable')]
+    keys = records['refnum'][order]
+    for i in flates:
+        elem_refs = refs[ref_offsets[i]:ref_offsets[i + 1]]
+        pos = np.searchsorted(keys, elem_refs)
+        found = (pos < len(keys)) & (keys[np.minimum(pos, len(keys) - 1)] == elem_refs)
+        if (len(elem_refs) == 0) or not found.all():
+            continue    # Unknown curve, extents left NaN
+        crec = records[order[pos]]
+        records['npoints'][i] = crec['npoints'].sum()
+        for name, func in (('min_e', np.min), ('min_n', np.min), ('max_e', np.max),
+            ('max_n', np.max), ('min_h', np.min), ('max_h', np.max)):
+            records[name][i] = func(crec[name])
+
+# -----------------------------------------------------------------------------
+
+def index_path(filename):
+    hsh = hashlib.blake2b(os.path.realpath(filename).encode(), digest_size=20)
+    return os.path.join(socache.cache_dir(), 'index_' + hsh.hexdigest() + '.npz')
+
+# -----------------------------------------------------------------------------
+
+def load_or_build_index(filename):
+    """
+    Return the SosiIndex of filename, built and stored if missing or if
+    the file has changed size or modification time since.
+    """
+    st = os.stat(filename)
+    path = index_path(filename)
+    if os.path.isfile(path):
+        try:
+            index = SosiIndex.load(path)
+            if (index != None) and index.is_valid_for(st):
+                return index
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning('Index file %s unreadable (%s)', path, e)
+    logging.info('Building element index for {}'.format(filename))
+    index = build_index(filename)
+    try:
+        os.makedirs(socache.cache_dir(), exist_ok=True)
+        tmp_path = path + '.tmp'
+        index.save(tmp_path)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logging.warning('Index: could not store %s (%s)', filename, e)
+    return index
+
+# -----------------------------------------------------------------------------
+
+def _read_blocks(f, index, rows):
+    """Yield the lines of the header and of the records rows, in file order."""
+    f.seek(0)
+    yield from f.read(index.head_length).splitlines(keepends=True)
+    for i in rows:
+        f.seek(index.records['offset'][i])
+        yield from f.read(index.records['length'][i]).splitlines(keepends=True)
+
+# -----------------------------------------------------------------------------
+
+def iter_indexed_elements(filename, ref_e, ref_n, elem_filter = None, index = None):
+    """
+    Like sosi_parser.iter_sosi_elements(), but only the blocks of the
+    elements passing elem_filter (and the curves their FLATEs use) are
+    read from the file, located by its index.
+    """
+    if index == None:
+        index = load_or_build_index(filename)
+    mask = index.select(elem_filter)
+    flate_refs = index.flate_refnums(mask)
+    curve = index.records['kind'] != sodhlp.SosiObjId.FLATE.value
+    mask |= curve & np.isin(index.records['refnum'], flate_refs)
+    rows = np.nonzero(mask)[0]
+    with open(filename, 'rb') as f:
+        yield from sopars.parse_sosi_lines(_read_blocks(f, index, rows),
+            sopars.source_name(filename), ref_e, ref_n, elem_filter, set(flate_refs.tolist()))
+
+# -----------------------------------------------------------------------------
+
+def select_table(index, table, elem_filter):
+    """
+    The records of table (an sosi_parser.ElementTable of the whole file)
+    the index selects for elem_filter, matched by kind and reference
+    number. Conservative like SosiIndex.select().
+    """
+    mask = index.select(elem_filter)
+    wanted = index.records['refnum'][mask] * 16 + index.records['kind'][mask]
+    have = table.records['refnum'] * 16 + table.records['id']
+    return table.take(np.nonzero(np.isin(have, wanted))[0])
+
+# -----------------------------------------------------------------------------
+
+def read_elements_by_refnum(filename, refnums, ref_e, ref_n, index = None):
+    """Return the SosiElements with the given reference numbers."""
+    if index == None:
+        index = load_or_build_index(filename)
+    mask = np.zeros(len(index.records), dtype=bool)
+    for refnum in refnums:
+        mask[index.find_refnum(refnum)] = True
+    flate_refs = index.flate_refnums(mask)
+    curve = index.records['kind'] != sodhlp.SosiObjId.FLATE.value
+    wanted = set(refnums)
+    with open(filename, 'rb') as f:
+        rows = np.nonzero(mask | (curve & np.isin(index.records['refnum'], flate_refs)))[0]
+        elems = sopars.parse_sosi_lines(_read_blocks(f, index, rows),
+            sopars.source_name(filename), ref_e, ref_n, None, set(flate_refs.tolist()))
+        return [e for e in elems if e.objrefnum in wanted]
@@ -24,8 +24,11 @@ This file is part of SosiImporter, an addon to import SOSI files containing
 3D model data into Blender.
 """
 
+import time
 import numpy as np
 import logging
+from . import sosi_settings as soset
+from . import sosi_datahelper as sodhlp
 
 def get_logger1(logger_level):
                
@@ -123,4 +126,121 @@ def formatArray(ary, leadtxt=None):
     s = np.array2string(ary, precision=3, separator=' ')
     if (leadtxt != None):   
         s = leadtxt + '\n' + s
-    return s
\ No newline at end of file
+    return s
+
+# -----------------------------------------------------------------------------
+
+class LazyArray():
+    """
+    Log argument formatting an array with formatArray() only when the
+    message is emitted: logging.debug('Points:\n%s', LazyArray(pts))
+    """
+
+    __slots__ = ('ary',)
+
+    def __init__(self, ary):
+        self.ary = ary
+
+    def __str__(self):
+        return formatArray(self.ary)
+
+# -----------------------------------------------------------------------------
+
+class ElementLog():
+    """
+    Logging of the imported elements without a line per element: counts per
+    element kind (and result flags) logged as a summary, one line per element
+    only at DEBUG level, and an optional progress line at most every
+    SOSI_LOG_PROGRESS_SECONDS.
+    """
+
+    def __init__(self, logger = None):
+        self.logger = logger or logging.getLogger()
+        self.reset()
+
+    def reset(self):
+        self.kinds = {}     # kind name -> [elements, coordinates]
+        self.flags = {}     # (kind name, flag) -> elements
+        self.nelements = 0
+        self.t_start = time.perf_counter()
+        self.t_progress = self.t_start
+        # Checked once here, not per element. Changing the level during an
+        # import takes effect at the next reset().
+        self.debug = self.logger.isEnabledFor(logging.DEBUG)
+        self.progress_secs = soset.SOSI_LOG_PROGRESS_SECONDS if self.logger.isEnabledFor(logging.INFO) else 0.0
+
+    def add(self, kind, refnum, sosires, ncoords):
+        """Count one element, kind is the element kind name, e.g. 'KURVE'."""
+        counts = self.kinds.get(kind)
+        if counts == None:
+            counts = self.kinds[kind] = [0, 0]
+        counts[0] += 1
+        counts[1] += ncoords
+        if sosires:
+            key = (kind, sosires)
+            self.flags[key] = self.flags.get(key, 0) + 1
+        self.nelements += 1
+        if self.debug:
+            self.logger.debug('%s %d: Res= 0x%x NoOfCoords= %d', kind, refnum, sosires, ncoords)
+        if (self.progress_secs > 0.0) and ((self.nelements & 0x3ff) == 0):
+            self.progress()
+
+    def add_table(self, table):
+        """Count the elements of an sosi_parser.ElementTable, see add()."""
+        records = table.records
+        if self.debug:
+            for rec in records:
+                self.add(sodhlp.SosiObjId(int(rec['id'])).name, int(rec['refnum']), int(rec['flags']),
+                    int(rec['ncoords']))
+            return
+        for kind in np.unique(records['id']):
+            sel = records[records['id'] == kind]
+            name = sodhlp.SosiObjId(int(kind)).name
+            counts = self.kinds.get(name)
+            if counts == None:
+                counts = self.kinds[name] = [0, 0]
+            counts[0] += len(sel)
+            counts[1] += int(sel['ncoords'].sum())
+            flags, nflags = np.unique(sel['flags'], return_counts=True)
+            for flag, n in zip(flags, nflags):
+                if flag:
+                    key = (name, int(flag))
+                    self.flags[key] = self.flags.get(key, 0) + int(n)
+        self.nelements += len(records)
+        if self.progress_secs > 0.0:
+            self.progress()
+
+    def to_dict(self):
+        """The counts as plain data, e.g. to send from a worker process."""
+        return {'kinds' : {kind : list(counts) for kind, counts in self.kinds.items()},
+            'flags' : [(kind, res, n) for (kind, res), n in self.flags.items()]}
+
+    def merge(self, other):
+        """Add the counts of other, a to_dict() from a worker process."""
+        for kind, (nelements, ncoords) in other['kinds'].items():
+            counts = self.kinds.get(kind)
+            if counts == None:
+                counts = self.kinds[kind] = [0, 0]
+            counts[0] += nelements
+            counts[1] += ncoords
+            self.nelements += nelements
+        for kind, res, n in other['flags']:
+            self.flags[(kind, res)] = self.flags.get((kind, res), 0) + n
+
+    def progress(self):
+        t = time.perf_counter()
+        if t - self.t_progress >= self.progress_secs:
+            self.t_progress = t
+            self.logger.info('%d elements, %.1f s', self.nelements, t - self.t_start)
+
+    def count_flag(self, flag, kind = None):
+        """Number of elements (of kind, all if None) with flag set in their result."""
+        return sum(n for (k, res), n in self.flags.items() if (res & flag) and (kind in (None, k)))
+
+    def log_summary(self):
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+        for kind, (nelements, ncoords) in self.kinds.items():
+            self.logger.info('%s: %d elements, %d coordinates', kind, nelements, ncoords)
+        for (kind, res), n in sorted(self.flags.items()):
+            self.logger.info('%s: %d elements with Res= 0x%x', kind, n, res)
\ No newline at end of file
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright © 2022 Jonny Normann Skålvik
+
+Permission is hereby granted, free of charge, to any person obtaining a copy 
+of this software and associated documentation files (the “Software”), to deal 
+in the Software without restriction, including without limitation the rights 
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell 
+copies of the Software, and to permit persons to whom the Software is 
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in 
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE 
+SOFTWARE.
+
+This file is part of SosiImporter, an addon to import SOSI files containing
+3D model data into Blender.
+"""
+
+import os
+import time
+import bpy
+from bpy.props import StringProperty, CollectionProperty, BoolProperty, IntProperty, FloatProperty
+from bpy_extras.io_utils import ImportHelper
+from . import sosi_settings as soset
+from . import sosi_importer as sosimp
+from . import sosi_scan as sosca
+from . import sosi_parser as sopars
+from . import sosi_spatial as sospat
+from . import sosi_backend as sobknd
+
+# -----------------------------------------------------------------------------
+
+def main(context):
+    if sosimp.get_addon_prefs().backend == sobknd.BACKEND_PYTHON:
+        # The Python parser needs the files from the file browser
+        bpy.ops.import_files.sosi_data_python('INVOKE_DEFAULT')
+    else:
+        sosimp.do_imports()
+
+# -----------------------------------------------------------------------------
+
+class ImportSOSIData(bpy.types.Operator):
+    """Tooltip"""
+    bl_idname = "import_files.sosi_data"
+    bl_label = "Import SOSI Data"
+
+    def execute(self, context):
+        main(context)
+        return {'FINISHED'}
+        
+# -----------------------------------------------------------------------------
+
+class SosiTagItem(bpy.types.PropertyGroup):
+    """One OBJTYPE in the tag selection dialog"""
+    name: StringProperty()
+    count: IntProperty()
+    selected: BoolProperty(default=True)
+
+# -----------------------------------------------------------------------------
+
+class ImportSOSIDataPython(bpy.types.Operator, ImportHelper):
+    """Import SOSI files using the Python parser (all platforms)"""
+    bl_idname = "import_files.sosi_data_python"
+    bl_label = "Import SOSI Data (Python parser)"
+
+    filename_ext = ".sos"
+    filter_glob: StringProperty(default="*.sos", options={'HIDDEN'})
+    files: CollectionProperty(type=bpy.types.OperatorFileListElement)
+    directory: StringProperty(subtype='DIR_PATH')
+    ref_filepath: StringProperty(
+        name = "Reference file",
+        description = "Text file with the reference coordinate (E and N lines)",
+        subtype = 'FILE_PATH')
+    tags: CollectionProperty(type=SosiTagItem, options={'HIDDEN', 'SKIP_SAVE'})
+    tags_scanned: BoolProperty(default=False, options={'HIDDEN', 'SKIP_SAVE'})
+    use_bbox: BoolProperty(name = "Limit to area", default=False)
+    bbox_min_e: FloatProperty(name = "Min E")
+    bbox_min_n: FloatProperty(name = "Min N")
+    bbox_max_e: FloatProperty(name = "Max E")
+    bbox_max_n: FloatProperty(name = "Max N")
+    window_radius: FloatProperty(
+        name = "Window radius",
+        description = "Import only the area within this distance of the reference point, 0 for no limit",
+        min = 0.0, default = 0.0, unit = 'LENGTH')
+    clip_to_window: BoolProperty(
+        name = "Clip to area",
+        description = "Cut curves and surfaces at the area or window border",
+        default = False)
+    tile_size: FloatProperty(
+        name = "Tile size",
+        description = "Split the objects into tile collections of this size, 0 for no tiles",
+        min = 0.0, default = 0.0, unit = 'LENGTH')
+    weld_vertices: BoolProperty(
+        name = "Weld vertices",
+        description = "Merge the vertices shared by the curves and surfaces of an object",
+        default = soset.SOSI_WELD_VERTICES)
+    use_hoyde: BoolProperty(name = "Limit to heights", default=False)
+    hoyde_min: FloatProperty(name = "Min height")
+    hoyde_max: FloatProperty(name = "Max height")
+
+    def draw(self, context):
+        if not self.tags_scanned:
+            self.layout.prop(self, "ref_filepath")
+            return
+        # Tag selection dialog
+        col = self.layout.column(align=True)
+        for item in self.tags:
+            col.prop(item, "selected", text="{} ({})".format(item.name, item.count))
+        self.layout.prop(self, "use_bbox")
+        if self.use_bbox:
+            row = self.layout.row(align=True)
+            row.prop(self, "bbox_min_e")
+            row.prop(self, "bbox_min_n")
+            row = self.layout.row(align=True)
+            row.prop(self, "bbox_max_e")
+            row.prop(self, "bbox_max_n")
+        self.layout.prop(self, "window_radius")
+        self.layout.prop(self, "clip_to_window")
+        self.layout.prop(self, "tile_size")
+        self.layout.prop(self, "weld_vertices")
+        self.layout.prop(self, "use_hoyde")
+        if self.use_hoyde:
+            row = self.layout.row(align=True)
+            row.prop(self, "hoyde_min")
+            row.prop(self, "hoyde_max")
+
+    def get_filenames(self):
+        filenames = [os.path.join(self.directory, f.name) for f in self.files if f.name]
+        if len(filenames) == 0:
+            filenames = [self.filepath]
+        return filenames
+
+    def scan_tags(self, filenames):
+        """Fill the tag list from a header-only scan of the files."""
+        counts = {}
+        for filename in filenames:
+            scan = sosca.scan_sosi_file(filename)
+            for objtype, n in scan.objtypes.items():
+                counts[objtype] = counts.get(objtype, 0) + n
+            # Default area from the file header (..OMRÅDE)
+            hd = scan.header
+            if (hd.min_e != None) and (hd.max_e != None):
+                if (self.bbox_min_e, self.bbox_max_e) == (0.0, 0.0):
+                    self.bbox_min_e, self.bbox_min_n = hd.min_e, hd.min_n
+                    self.bbox_max_e, self.bbox_max_n = hd.max_e, hd.max_n
+                else:
+                    self.bbox_min_e, self.bbox_min_n = min(self.bbox_min_e, hd.min_e), min(self.bbox_min_n, hd.min_n)
+                    self.bbox_max_e, self.bbox_max_n = max(self.bbox_max_e, hd.max_e), max(self.bbox_max_n, hd.max_n)
+        self.tags.clear()
+        for objtype in sorted(counts):
+            item = self.tags.add()
+            item.name = objtype
+            item.count = counts[objtype]
+        self.tags_scanned = True
+
+    def execute(self, context):
+        if not os.path.isfile(bpy.path.abspath(self.ref_filepath)):
+            self.report({'ERROR'}, "Reference file not found")
+            return {'CANCELLED'}
+        filenames = self.get_filenames()
+        if not self.tags_scanned:
+            self.scan_tags(filenames)
+            if len(self.tags) > 0:
+                # Executed again when the dialog is confirmed
+                return context.window_manager.invoke_props_dialog(self, width=400)
+        ref_filepath = bpy.path.abspath(self.ref_filepath)
+        if bpy.app.background or (context.window == None):
+            sosimp.do_imports_python(ref_filepath, filenames, self.get_filter(ref_filepath),
+                self.tile_size, self.weld_vertices)
+            return {'FINISHED'}
+        
+        # Import in time slices from a timer, ESC cancels
+        self.job = sosimp.iter_imports_python(ref_filepath, filenames,
+            self.get_filter(ref_filepath), self.tile_size, self.weld_vertices)
+        wm = context.window_manager
+        self.timer = wm.event_timer_add(0.001, window=context.window)
+        wm.progress_begin(0, 100)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self.finish(context)
+            self.report({'WARNING'}, "SOSI import cancelled")
+            return {'CANCELLED'}
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+        deadline = time.perf_counter() + soset.SOSI_MODAL_SLICE_SECONDS
+        try:
+            for progress in self.job:
+                if time.perf_counter() >= deadline:
+                    context.window_manager.progress_update(100.0 * progress)
+                    return {'RUNNING_MODAL'}
+        except Exception:
+            self.finish(context)
+            raise
+        self.finish(context)
+        return {'FINISHED'}
+
+    def finish(self, context):
+        # Closing the generator cancels an unfinished import
+        self.job.close()
+        wm = context.window_manager
+        wm.event_timer_remove(self.timer)
+        wm.progress_end()
+
+    def get_filter(self, ref_filepath):
+        elem_filter = sopars.ElementFilter(clip = self.clip_to_window)
+        selected = set(item.name for item in self.tags if item.selected)
+        if len(selected) < len(self.tags):
+            # All selected: no filter, so the file cache is used as is
+            elem_filter.objtypes = selected
+        if self.window_radius > 0.0:
+            easting, northing = sopars.read_reference_file(ref_filepath)
+            elem_filter.bbox = sospat.window_bbox(easting, northing, self.window_radius)
+        elif self.use_bbox:
+            elem_filter.bbox = (self.bbox_min_e, self.bbox_min_n, self.bbox_max_e, self.bbox_max_n)
+        if self.use_hoyde:
+            elem_filter.hoyde_range = (self.hoyde_min, self.hoyde_max)
+        return elem_filter
+
+# -----------------------------------------------------------------------------
+    
+def menu_func_import(self, context):
+    self.layout.operator(ImportSOSIData.bl_idname)
+    self.layout.operator(ImportSOSIDataPython.bl_idname)
@@ -0,0 +1,809 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright © 2022 Jonny Normann Skålvik
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+This file is part of SosiImporter, an addon to import SOSI files containing
+3D model data into Blender.
+"""
+
+import os
+import logging
+import numpy as np
+from collections import namedtuple
+from . import sosi_datahelper as sodhlp
+from . import sosi_geom_helper as sogeohlp
+
+# -----------------------------------------------------------------------------
+
+# One SOSI element, same contents as delivered by the DLL callback.
+# coords is an (ncoords, ndims) float64 array, relative to the
+# reference coordinate (x = easting, y = northing). hoyde is the ..HØYDE
+# value, None if not given (the DLL does not deliver it). holes are the
+# indices in coords where the hole rings of a FLATE start, None if none;
+# the outer ring is counter clockwise, the holes clockwise. retning is the
+# ..RETNING value (symbol direction of a PUNKT), None if not given.
+# filename is the base name of the file, see source_name(). grid is the
+# (ncoords, 2) int64 array of the integer SOSI (E, N) coordinates the
+# coords were decoded from, GRID_NONE for points made by the importer
+# (segmented arcs, clipping), None if not known at all (the DLL).
+SosiElement = namedtuple('SosiElement',
+    ['id', 'objrefnum', 'sosires', 'objname', 'ndims', 'coords', 'filename', 'hoyde', 'holes', 'retning',
+    'grid'], defaults=[None, None, None, None])
+
+# SosiElement.grid value of points without integer SOSI coordinates
+GRID_NONE = np.iinfo(np.int64).min
+
+def no_grid(n):
+    """The grid of n points made by the importer"""
+    return np.full((n, 2), GRID_NONE, dtype=np.int64)
+
+def source_name(filename):
+    """The file name the elements of filename carry, its base name"""
+    return os.path.basename(filename)
+
+# Element tags handled, mapped to the object id used by the importer
+SOSI_ELEMENT_IDS = {
+    'PUNKT' : sodhlp.SosiObjId.PUNKT,
+    'SVERM' : sodhlp.SosiObjId.PUNKT,
+    'KURVE' : sodhlp.SosiObjId.KURVE,
+    'LINJE' : sodhlp.SosiObjId.KURVE,
+    'BUEP' : sodhlp.SosiObjId.BUEP,
+    'FLATE' : sodhlp.SosiObjId.FLATE
+}
+
+# SOSI ..TEGNSETT values mapped to Python codecs
+SOSI_CHARSETS = {
+    'ISO8859-10' : 'iso8859_10',
+    'ISO8859-1' : 'latin_1',
+    'UTF-8' : 'utf_8',
+    'ANSI' : 'cp1252',
+    'DOSN8' : 'cp865',
+    'ND7' : 'ascii'
+}
+
+# ND7 is 7 bit ASCII with the national characters in place of []\{}|
+ND7_TRANSLATION = str.maketrans('[\\]{|}', 'ÆØÅæøå')
+
+DEFAULT_CHARSET = 'ISO8859-10'
+
+# -----------------------------------------------------------------------------
+
+def read_reference_file(filename):
+    """
+    Read a reference coordinate file, i.e. one line starting with E
+    (easting) and one line starting with N (northing).
+    Return the tuple (easting, northing).
+    """
+    easting = 0.0
+    northing = 0.0
+    with open(filename, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith(('E', 'e')):
+                easting = float(line[1:])
+            elif line.startswith(('N', 'n')):
+                northing = float(line[1:])
+    return (easting, northing)
+
+# -----------------------------------------------------------------------------
+
+class SosiHeader():
+    """Values from the .HODE section needed to decode the elements."""
+
+    def __init__(self):
+        self.charset = DEFAULT_CHARSET
+        self.enhet = 1.0
+        self.enhet_h = None     # Defaults to enhet
+        self.origo_n = 0.0
+        self.origo_e = 0.0
+        self.min_n = None
+        self.min_e = None
+        self.max_n = None
+        self.max_e = None
+
+    def codec(self):
+        return SOSI_CHARSETS.get(self.charset.upper(), 'latin_1')
+
+    def height_unit(self):
+        if self.enhet_h == None:
+            return self.enhet
+        return self.enhet_h
+
+    def set_tag(self, tag, values):
+        """Store the value(s) of a header tag, unknown tags are ignored."""
+        if (tag == 'TEGNSETT') and (len(values) > 0):
+            self.charset = values[0]
+        elif (tag == 'ENHET') and (len(values) > 0):
+            self.enhet = float(values[0])
+        elif (tag == 'ENHET-H') and (len(values) > 0):
+            self.enhet_h = float(values[0])
+        elif (tag == 'ORIGO-NØ') and (len(values) > 1):
+            self.origo_n = float(values[0])
+            self.origo_e = float(values[1])
+        elif (tag == 'MIN-NØ') and (len(values) > 1):
+            self.min_n = float(values[0])
+            self.min_e = float(values[1])
+        elif (tag == 'MAX-NØ') and (len(values) > 1):
+            self.max_n = float(values[0])
+            self.max_e = float(values[1])
+
+# -----------------------------------------------------------------------------
+
+def decode_line(line, header):
+    """Decode a byte line from the SOSI file according to the header charset."""
+    s = line.decode(header.codec(), errors='replace')
+    if header.charset.upper() == 'ND7':
+        s = s.translate(ND7_TRANSLATION)
+    return s.strip()
+
+# -----------------------------------------------------------------------------
+
+def split_tag(s):
+    """
+    Split a decoded SOSI line like '..OBJTYPE Teiggrense' into the number of
+    leading dots, the tag name and a list of the remaining values.
+    """
+    level = len(s) - len(s.lstrip('.'))
+    parts = s[level:].split()
+    if len(parts) == 0:
+        return level, '', []
+    return level, parts[0].upper(), parts[1:]
+
+# -----------------------------------------------------------------------------
+
+def parse_ref_tokens(values):
+    """
+    Interpret the values of a FLATE ..REF tag, e.g. [':1', '-:3', '(:4', ':5)'].
+    Return a list of rings, the first one being the outer boundary and any
+    following ones holes. Each ring is a list of (refnum, reversed) tuples.
+    """
+    rings = [[]]
+    text = ' '.join(values).replace('(', ' ( ').replace(')', ' ) ')
+    for tok in text.split():
+        if tok == '(':
+            rings.append([])
+        elif tok == ')':
+            continue
+        else:
+            reverse = tok.startswith('-')
+            tok = tok.lstrip('-').lstrip(':')
+            try:
+                rings[-1].append((int(tok), reverse))
+            except ValueError:
+                logging.debug('Unknown ..REF value: %s', tok)
+    return rings
+
+# -----------------------------------------------------------------------------
+
+class ElementFilter():
+    """
+    Which elements to import, applied while parsing so that rejected
+    elements are never decoded. Criteria left as None do not restrict.
+    objtypes: OBJTYPE values, elements without OBJTYPE always pass
+    kinds: SosiObjId values
+    bbox: (min_e, min_n, max_e, max_n) in file coordinates, elements
+          overlapping the box pass
+    hoyde_range: (min, max), elements with heights in the range pass,
+          elements without heights do not
+    clip: cut the elements at bbox, see sosi_spatial.clip_elements()
+    """
+
+    def __init__(self, objtypes = None, kinds = None, bbox = None, hoyde_range = None, clip = False):
+        self.objtypes = objtypes
+        self.kinds = kinds
+        self.bbox = bbox
+        self.hoyde_range = hoyde_range
+        self.clip = clip
+
+    def is_empty(self):
+        return (self.objtypes == None) and (self.kinds == None) and \
+            (self.bbox == None) and (self.hoyde_range == None)
+
+    def accepts_kind(self, objid):
+        return (self.kinds == None) or (objid in self.kinds)
+
+    def accepts_objtype(self, objtype):
+        return (self.objtypes == None) or (objtype == None) or (objtype in self.objtypes)
+
+    def accepts_hoyde(self, hoyde):
+        if self.hoyde_range == None:
+            return True
+        return (hoyde != None) and (self.hoyde_range[0] <= hoyde <= self.hoyde_range[1])
+
+    def accepts_coords(self, coords, ref_e, ref_n):
+        """Test the decoded coordinates against bbox and hoyde_range."""
+        if len(coords) == 0:
+            return False
+        if self.bbox != None:
+            lo = coords[:, :2].min(axis=0)
+            hi = coords[:, :2].max(axis=0)
+            if (hi[0] + ref_e < self.bbox[0]) or (lo[0] + ref_e > self.bbox[2]) or \
+                (hi[1] + ref_n < self.bbox[1]) or (lo[1] + ref_n > self.bbox[3]):
+                return False
+        if self.hoyde_range != None:
+            if coords.shape[1] < 3:
+                return False
+            if (coords[:, 2].max() < self.hoyde_range[0]) or (coords[:, 2].min() > self.hoyde_range[1]):
+                return False
+        return True
+
+    def accepts(self, elem, ref_e, ref_n):
+        """Test an already decoded SosiElement."""
+        objtype = None if elem.objname in SOSI_ELEMENT_IDS else elem.objname
+        return self.accepts_kind(elem.id) and self.accepts_objtype(objtype) and \
+            self.accepts_coords(elem.coords, ref_e, ref_n)
+
+# -----------------------------------------------------------------------------
+
+def filter_elements(elements, elem_filter, ref_e, ref_n):
+    """Yield the decoded elements accepted by elem_filter (all if None)."""
+    for elem in elements:
+        if (elem_filter == None) or elem_filter.accepts(elem, ref_e, ref_n):
+            yield elem
+
+# -----------------------------------------------------------------------------
+
+class _ElementBuilder():
+    """Collects the tag values and coordinates for one SOSI element."""
+
+    def __init__(self, kind, refnum):
+        self.kind = kind
+        self.refnum = refnum
+        self.objtype = None
+        self.hoyde = None
+        self.retning = None
+        self.has_h = False
+        self.coord_lines = []   # Raw coordinate text, N E [H] N E [H] ...
+        self.refs = []  # ..REF values, FLATE only
+        self.in_coords = False
+        self.in_refs = False
+        self.selected = True    # False: only decoded for a FLATE
+
+    def add_coord_line(self, line):
+        i = line.find(b'!')
+        if i >= 0:
+            line = line[:i]   # Comment
+        i = line.find(b'...')
+        if i >= 0:
+            line = line[:i]   # Node info like ...KP, not a coordinate
+        self.coord_lines.append(line)
+
+    def ndims(self):
+        if self.has_h or (self.hoyde != None):
+            return 3
+        return 2
+
+    def coords(self, header, ref_e, ref_n, with_grid = False):
+        """Return the decoded coordinates as an (n, ndims) array, see decode_coord_block()."""
+        return decode_coord_block(b' '.join(self.coord_lines), self.has_h,
+            self.hoyde, header, ref_e, ref_n, with_grid)
+
+    def objname(self):
+        if self.objtype == None:
+            return self.kind
+        return self.objtype
+
+# -----------------------------------------------------------------------------
+
+def decode_coord_block(buf, has_h, hoyde, header, ref_e, ref_n, with_grid = False):
+    """
+    Decode a whole ..NØ or ..NØH coordinate block in one go.
+    buf holds the integer coordinate values as text, N E [H] N E [H] ...
+    The values are scaled by ENHET, offset by ORIGO-NØ and the reference
+    coordinate, and swapped into x = easting, y = northing order.
+    Return a contiguous (n, ndims) float64 array, where ndims is 3 when
+    heights are given (..NØH or ..HØYDE) and 2 otherwise. with_grid:
+    return (coords, grid), grid is the (n, 2) int64 array of the integer
+    E and N values, see SosiElement.
+    Raise ValueError for a value that is no integer, or a number of values
+    that is no multiple of the values per point.
+    """
+    step = 3 if has_h else 2
+    ndims = 3 if (has_h or (hoyde != None)) else 2
+    if len(buf.strip()) == 0:
+        coords = np.empty((0, ndims))
+        return (coords, no_grid(0)) if with_grid else coords
+    ints = np.array(buf.split(), dtype=np.int64)
+    if len(ints) % step != 0:
+        raise ValueError('{} coordinate values, not {} per point'.format(len(ints), step))
+    n = len(ints) // step
+    ints = ints.reshape(n, step)
+
+    coords = np.empty((n, ndims))
+    np.multiply(ints[:, 1], header.enhet, out=coords[:, 0])
+    coords[:, 0] += header.origo_e - ref_e
+    np.multiply(ints[:, 0], header.enhet, out=coords[:, 1])
+    coords[:, 1] += header.origo_n - ref_n
+    if has_h:
+        np.multiply(ints[:, 2], header.height_unit(), out=coords[:, 2])
+    elif hoyde != None:
+        coords[:, 2] = hoyde
+    if with_grid:
+        return coords, ints[:, 1::-1].copy()
+    return coords
+
+# -----------------------------------------------------------------------------
+
+def curve_points(kind, coords, grid = None):
+    """
+    Points along a curve element, BUEP arcs are split into segments, a
+    BUEP without exactly three points is kept as a polyline.
+    With the grid of coords return (points, grid), the segment points
+    between the arc ends have no grid values.
+    """
+    if (kind == 'BUEP') and (len(coords) == 3):
+        pts, offsets = sogeohlp.buep_pts_segments_3D(sodhlp.coords_to_3D(coords))
+        pts = pts[:, :coords.shape[1]]
+        if grid is None:
+            return pts
+        pts_grid = no_grid(len(pts))
+        pts_grid[0] = grid[0]
+        pts_grid[-1] = grid[2]
+        return pts, pts_grid
+    return coords if grid is None else (coords, grid)
+
+# -----------------------------------------------------------------------------
+
+def assemble_ring(ring_refs, curves):
+    """
+    Join the referenced curves into one closed ring of points.
+    curves maps refnum to (kind, coords, grid), BUEP arcs are segmented
+    when first used.
+    Return the (n, ndims) array of points, their grid, ndims and the
+    result flags.
+    """
+    res = 0
+    parts = []
+    grid_parts = []
+    ndims = None
+    for refnum, reverse in ring_refs:
+        curve = curves.get(refnum)
+        if curve == None:
+            logging.warning('FLATE references unknown curve %d', refnum)
+            res |= sodhlp.RES_SOSI_GENERAL_ERROR
+            continue
+        if curve[0] == 'BUEP':
+            curve = ('KURVE',) + curve_points(*curve)
+            curves[refnum] = curve
+        pts, grid = curve[1], curve[2]
+        if ndims == None:
+            ndims = pts.shape[1]
+        elif ndims != pts.shape[1]:
+            ndims = 3
+            res |= sodhlp.RES_SOSI_DIMENSION_MISMATCH
+        if reverse:
+            pts = pts[::-1]
+            grid = grid[::-1]
+        if (len(parts) > 0) and np.array_equal(parts[-1][-1, :2], pts[0, :2]):
+            pts = pts[1:]   # Shared end point
+            grid = grid[1:]
+        if len(pts) > 0:
+            parts.append(pts)
+            grid_parts.append(grid)
+    if len(parts) == 0:
+        return np.empty((0, ndims or 2)), no_grid(0), ndims or 2, res
+    if ndims == 3:
+        parts = [sodhlp.coords_to_3D(p) for p in parts]
+    ring = np.concatenate(parts)
+    ring_grid = np.concatenate(grid_parts)
+    if (len(ring) > 1) and np.array_equal(ring[0, :2], ring[-1, :2]):
+        ring = ring[:-1]
+        ring_grid = ring_grid[:-1]
+    else:
+        res |= sodhlp.RES_SOSI_LOOP_UNCLOSED
+    return ring, ring_grid, ndims, res
+
+# -----------------------------------------------------------------------------
+
+def assemble_polygon(rings, curves):
+    """
+    Join the referenced curves of a FLATE into its outer ring and holes,
+    see parse_ref_tokens() and assemble_ring(). The outer ring is turned
+    counter clockwise and the holes clockwise, empty holes are dropped.
+    Return the (n, ndims) points of all rings, their grid, the start
+    indices of the holes (None if none), ndims and the result flags.
+    """
+    parts = []
+    grid_parts = []
+    res = 0
+    ndims = None
+    for i, ring_refs in enumerate(rings):
+        ring, ring_grid, ring_ndims, ring_res = assemble_ring(ring_refs, curves)
+        res |= ring_res
+        if len(ring) < 3:
+            if i == 0:
+                return np.empty((0, ring_ndims)), no_grid(0), None, ring_ndims, res
+            continue
+        if (sogeohlp.polygon_area_2D(ring) < 0.0) == (i == 0):
+            ring = ring[::-1]
+            ring_grid = ring_grid[::-1]
+        if ndims == None:
+            ndims = ring_ndims
+        elif ndims != ring_ndims:
+            ndims = 3
+            res |= sodhlp.RES_SOSI_DIMENSION_MISMATCH
+        parts.append(ring)
+        grid_parts.append(ring_grid)
+    if len(parts) == 1:
+        return parts[0], grid_parts[0], None, ndims, res
+    if ndims == 3:
+        parts = [sodhlp.coords_to_3D(p) for p in parts]
+    holes = np.cumsum([len(p) for p in parts[:-1]])
+    return np.concatenate(parts), np.concatenate(grid_parts), holes, ndims, res
+
+# -----------------------------------------------------------------------------
+
+def flate_curve_refnums(filename, elem_filter):
+    """
+    Return the set of curve reference numbers used by the FLATE elements
+    passing elem_filter (all when None; bbox is ignored, it needs the
+    curves). Only the tag lines are looked at, no coordinates are decoded.
+    """
+    header = SosiHeader()
+    refnums = set()
+    flate = None
+    in_head = False
+    in_refs = False
+
+    def finish(flate):
+        if (elem_filter == None) or (elem_filter.accepts_objtype(flate.objtype) and \
+            ((elem_filter.hoyde_range == None) or (flate.hoyde == None) or elem_filter.accepts_hoyde(flate.hoyde))):
+            for ring in parse_ref_tokens(flate.refs):
+                refnums.update(refnum for refnum, reverse in ring)
+
+    with open(filename, 'rb') as f:
+        for line in f:
+            if line[:1] != b'.':
+                if in_refs:
+                    flate.refs.extend(decode_line(line, header).split())
+                continue
+            in_refs = False
+            if line[:2] != b'..':
+                if flate != None:
+                    finish(flate)
+                    flate = None
+                in_head = line.startswith(b'.HODE')
+                if line.startswith(b'.FLATE'):
+                    flate = _ElementBuilder('FLATE', 0)
+                elif line.startswith(b'.SLUTT'):
+                    break
+                continue
+            if not (in_head or (flate != None)):
+                continue
+            level, tag, values = split_tag(decode_line(line, header))
+            if in_head:
+                header.set_tag(tag, values)
+            elif level == 2:
+                if tag == 'OBJTYPE' and len(values) > 0:
+                    flate.objtype = values[0]
+                elif tag == 'HØYDE' and len(values) > 0:
+                    flate.hoyde = float(values[0])
+                elif tag == 'REF':
+                    in_refs = True
+                    flate.refs.extend(values)
+        if flate != None:
+            finish(flate)
+    return refnums
+
+# -----------------------------------------------------------------------------
+
+def iter_sosi_elements(filename, ref_e, ref_n, elem_filter = None):
+    """
+    Parse the SOSI file filename and yield one SosiElement per supported
+    element. The file is read line by line, only the current element is
+    kept in memory. Exceptions are the curves referenced by FLATE elements;
+    their points are kept until the end of the file, where the FLATE
+    elements are emitted. The referenced curves are found by a pass over
+    the tag lines first, when the file has FLATE elements.
+    With an ElementFilter, the elements rejected by kind, OBJTYPE or
+    ..HØYDE are skipped without decoding their coordinates, and only the
+    curves used by selected FLATE elements are kept.
+    """
+    if (elem_filter != None) and elem_filter.is_empty():
+        elem_filter = None
+    flate_refs = set()
+    if (elem_filter == None) or elem_filter.accepts_kind(sodhlp.SosiObjId.FLATE.value):
+        from . import sosi_scan as sosca    # Imports this module
+        if sosca.scan_sosi_file(filename).kinds.get('FLATE', 0) > 0:
+            flate_refs = flate_curve_refnums(filename, elem_filter)
+    with open(filename, 'rb') as f:
+        yield from parse_sosi_lines(f, source_name(filename), ref_e, ref_n,
+            elem_filter, flate_refs)
+
+# -----------------------------------------------------------------------------
+
+def parse_sosi_lines(lines, basename, ref_e, ref_n, elem_filter = None, flate_refs = None):
+    """
+    Parse SOSI byte lines, the .HODE lines first, and yield the SosiElements,
+    see iter_sosi_elements(). flate_refs is the set of curve reference
+    numbers to keep for FLATE elements, None to keep all curves.
+    """
+    if (elem_filter != None) and elem_filter.is_empty():
+        elem_filter = None
+    header = SosiHeader()
+    curves = {}     # refnum -> points for FLATE references
+    flates = []     # FLATE elements waiting for end of file
+    elem = None
+    in_head = False
+
+    def needed_by_flate(elem):
+        return (elem.kind in ('KURVE', 'LINJE', 'BUEP')) and \
+            ((flate_refs == None) or (elem.refnum in flate_refs))
+
+    def finish(elem):
+        if elem.kind == 'FLATE':
+            if elem.selected:
+                flates.append(elem)
+            return None
+        try:
+            coords, grid = elem.coords(header, ref_e, ref_n, with_grid=True)
+        except ValueError as e:
+            logging.warning('%s %d skipped, bad coordinates: %s', elem.kind, elem.refnum, e)
+            return None
+        if needed_by_flate(elem):
+            curves[elem.refnum] = (elem.kind, coords, grid)
+        if (len(coords) == 0) or not elem.selected:
+            return None
+        if (elem_filter != None) and not elem_filter.accepts_coords(coords, ref_e, ref_n):
+            return None
+        return SosiElement(SOSI_ELEMENT_IDS[elem.kind].value, elem.refnum, 0,
+            elem.objname(), coords.shape[1], coords, basename, elem.hoyde, None, elem.retning, grid)
+
+    for line in lines:
+        if line[:1] != b'.':
+            # Coordinate lines (or continued tag values), not decoded
+            if elem == None:
+                continue
+            if elem.in_coords:
+                elem.add_coord_line(line)
+            elif elem.in_refs:
+                elem.refs.extend(decode_line(line, header).split())
+            continue
+        if (elem == None) and (not in_head) and (line[:2] == b'..'):
+            continue    # Tags of a skipped element
+
+        level, tag, values = split_tag(decode_line(line, header))
+        if level == 1:
+            if elem != None:
+                rec = finish(elem)
+                if rec != None:
+                    yield rec
+                elem = None
+            in_head = (tag == 'HODE')
+            if tag == 'SLUTT':
+                break
+            if tag in SOSI_ELEMENT_IDS:
+                refnum = int(values[0].rstrip(':')) if len(values) > 0 else 0
+                elem = _ElementBuilder(tag, refnum)
+                if elem_filter != None:
+                    elem.selected = elem_filter.accepts_kind(SOSI_ELEMENT_IDS[tag].value)
+                    if not (elem.selected or needed_by_flate(elem)):
+                        elem = None     # Lines skipped up to the next element
+            continue
+
+        if in_head:
+            header.set_tag(tag, values)
+            continue
+        if elem == None:
+            continue
+
+        elem.in_coords = False
+        elem.in_refs = False
+        if level != 2:
+            continue
+        if (tag == 'NØ') and (elem_filter != None) and (elem.kind != 'FLATE') and \
+            not elem_filter.accepts_hoyde(elem.hoyde):
+            elem.selected = False   # No per point heights, ..HØYDE decides
+        if not (elem.selected or needed_by_flate(elem)):
+            elem = None     # Rejected, lines skipped up to the next element
+            continue
+        if tag in ('NØ', 'NØH'):
+            elem.in_coords = True
+            elem.has_h = (tag == 'NØH')
+            rest = line.split(None, 1)
+            if len(rest) > 1:
+                elem.add_coord_line(rest[1])   # Coordinates on the tag line
+        elif tag == 'OBJTYPE' and len(values) > 0:
+            elem.objtype = values[0]
+            if (elem_filter != None) and not elem_filter.accepts_objtype(elem.objtype):
+                elem.selected = False
+        elif tag == 'HØYDE' and len(values) > 0:
+            elem.hoyde = float(values[0])
+        elif tag == 'RETNING' and len(values) > 0:
+            elem.retning = float(values[0])
+        elif tag == 'REF':
+            elem.in_refs = True
+            elem.refs.extend(values)
+
+    if elem != None:
+        rec = finish(elem)
+        if rec != None:
+            yield rec
+
+    for elem in flates:
+        coords, grid, holes, ndims, res = assemble_polygon(parse_ref_tokens(elem.refs), curves)
+        if len(coords) == 0:
+            continue
+        if (elem_filter != None) and not elem_filter.accepts_coords(coords, ref_e, ref_n):
+            continue
+        yield SosiElement(sodhlp.SosiObjId.FLATE.value, elem.refnum, res,
+            elem.objname(), ndims, coords, basename, elem.hoyde, holes, elem.retning, grid)
+
+# -----------------------------------------------------------------------------
+
+# One row per element in an ElementTable
+ELEMENT_DTYPE = np.dtype([
+    ('id', 'i1'),           # SosiObjId value
+    ('refnum', 'i8'),       # Element reference number
+    ('flags', 'i4'),        # sosires
+    ('name_id', 'i4'),      # Index into ElementTable.names
+    ('ndims', 'i1'),
+    ('hoyde', 'f8'),        # NaN if none
+    ('coord_offset', 'i8'), # First row in ElementTable.coords
+    ('ncoords', 'i4'),
+    ('hole_offset', 'i8'),  # First entry in ElementTable.holes
+    ('nholes', 'i4'),
+    ('retning', 'f8')])     # NaN if none
+
+class ElementTable():
+    """
+    All elements of one SOSI file in a few arrays: one ELEMENT_DTYPE record
+    per element, the object names interned in names, the coordinates
+    of all elements in one (n, 3) array (z = 0.0 for 2D elements), their
+    integer SOSI coordinates in the (n, 2) grid (see SosiElement) and the
+    FLATE hole start indices of all elements in holes.
+    """
+
+    def __init__(self, filename, records, names, coords, holes, grid):
+        self.filename = filename
+        self.records = records
+        self.names = names
+        self.coords = coords
+        self.holes = holes
+        self.grid = grid
+
+    def __len__(self):
+        return len(self.records)
+
+    @staticmethod
+    def from_elements(filename, elements):
+        """Collect the SosiElements of one file into an ElementTable."""
+        builder = ElementTableBuilder(filename)
+        for elem in elements:
+            builder.add(elem.id, elem.objrefnum, elem.sosires, elem.objname, elem.ndims, elem.coords,
+                elem.hoyde, elem.holes, elem.retning, elem.grid)
+        return builder.table()
+
+    def chunks(self, size):
+        """Yield the records in ElementTables of at most size elements, sharing the other arrays."""
+        for start in range(0, len(self.records), size):
+            yield ElementTable(self.filename, self.records[start:start + size], self.names,
+                self.coords, self.holes, self.grid)
+
+    def take(self, rows):
+        """The ElementTable of the given records only, sharing the other arrays."""
+        return ElementTable(self.filename, self.records[rows], self.names, self.coords, self.holes, self.grid)
+
+    def vertex_rows(self, records = None):
+        """
+        The rows in self.coords of the vertices of records (all when None),
+        element after element, and the number of vertices per element.
+        """
+        if records is None:
+            records = self.records
+        counts = records['ncoords'].astype(np.int64)
+        starts = np.cumsum(counts) - counts
+        rows = np.repeat(records['coord_offset'] - starts, counts) + np.arange(counts.sum())
+        return rows, counts
+
+    def element_attrs(self):
+        """The sosi_datahelper.ELEMENT_ATTR_DTYPE values per record."""
+        attrs = np.empty(len(self.records), dtype=sodhlp.ELEMENT_ATTR_DTYPE)
+        objtypes = np.array([sodhlp.objtype_id(name) for name in self.names], dtype=np.int32)
+        attrs['refnum'] = self.records['refnum']
+        attrs['objtype'] = objtypes[self.records['name_id']] if len(objtypes) > 0 else 0
+        attrs['hoyde'] = self.records['hoyde']
+        attrs['sosires'] = self.records['flags']
+        attrs['rotation'] = sodhlp.retning_rotation(self.records['retning'])
+        return attrs
+
+    def elements(self):
+        """Yield the SosiElements, coords are (n, ndims) views into self.coords."""
+        for rec in self.records:
+            off = rec['coord_offset']
+            coords = self.coords[off:off + rec['ncoords'], :rec['ndims']]
+            hoyde = None if np.isnan(rec['hoyde']) else float(rec['hoyde'])
+            retning = None if np.isnan(rec['retning']) else float(rec['retning'])
+            holes = None
+            if rec['nholes'] > 0:
+                holes = self.holes[rec['hole_offset']:rec['hole_offset'] + rec['nholes']]
+            yield SosiElement(int(rec['id']), int(rec['refnum']), int(rec['flags']),
+                self.names[rec['name_id']], int(rec['ndims']), coords, self.filename, hoyde, holes, retning,
+                self.grid[off:off + rec['ncoords']])
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            np.savez_compressed(f, records=self.records, coords=self.coords, holes=self.holes,
+                grid=self.grid, names=np.array(self.names, dtype=str), filename=np.array(self.filename))
+
+    @staticmethod
+    def load(path):
+        with np.load(path) as data:
+            return ElementTable(str(data['filename']), data['records'],
+                [str(n) for n in data['names']], data['coords'], data['holes'], data['grid'])
+
+class ElementTableBuilder():
+    """Collects elements one by one into an ElementTable, names interned."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.rows = []
+        self.names = []
+        self.name_ids = {}
+        self.parts = []
+        self.grid_parts = []
+        self.hole_parts = []
+        self.offset = 0
+        self.hole_offset = 0
+
+    def __len__(self):
+        return len(self.rows)
+
+    def add(self, id, refnum, flags, objname, ndims, coords, hoyde = None, holes = None, retning = None,
+        grid = None):
+        """
+        Add one element, coords and grid are copied, hoyde, retning and
+        grid None if unknown.
+        """
+        name_id = self.name_ids.get(objname)
+        if name_id == None:
+            name_id = len(self.names)
+            self.name_ids[objname] = name_id
+            self.names.append(objname)
+        ncoords = len(coords)
+        nholes = 0 if holes is None else len(holes)
+        self.rows.append((id, refnum, flags, name_id, ndims, float('nan') if hoyde == None else hoyde,
+            self.offset, ncoords, self.hole_offset, nholes, float('nan') if retning == None else retning))
+        self.parts.append(np.array(sodhlp.coords_to_3D(coords), dtype=np.float64))
+        self.grid_parts.append(no_grid(ncoords) if grid is None else np.array(grid, dtype=np.int64))
+        if nholes > 0:
+            self.hole_parts.append(np.asarray(holes, dtype=np.int64))
+        self.offset += ncoords
+        self.hole_offset += nholes
+
+    def table(self):
+        records = np.array(self.rows, dtype=ELEMENT_DTYPE)
+        coords = np.concatenate(self.parts) if len(self.parts) > 0 else np.empty((0, 3))
+        grid = np.concatenate(self.grid_parts) if len(self.grid_parts) > 0 else no_grid(0)
+        holes = np.concatenate(self.hole_parts) if len(self.hole_parts) > 0 else np.empty(0, dtype=np.int64)
+        return ElementTable(self.filename, records, self.names, coords, holes, grid)
+
+def iter_element_chunks(elements, filename, size):
+    """Collect the SosiElements into ElementTables of at most size elements."""
+    builder = ElementTableBuilder(filename)
+    for elem in elements:
+        builder.add(elem.id, elem.objrefnum, elem.sosires, elem.objname, elem.ndims, elem.coords,
+            elem.hoyde, elem.holes, elem.retning, elem.grid)
+        if len(builder) >= size:
+            yield builder.table()
+            builder = ElementTableBuilder(filename)
+    if len(builder) > 0:
+        yield builder.table()
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright © 2022 Jonny Normann Skålvik
+
+Permission is hereby granted, free of charge, to any person obtaining a copy 
+of this software and associated documentation files (the “Software”), to deal 
+in the Software without restriction, including without limitation the rights 
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell 
+copies of the Software, and to permit persons to whom the Software is 
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in 
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE 
+SOFTWARE.
+
+This file is part of SosiImporter, an addon to import SOSI files containing
+3D model data into Blender.
+"""
+
+import os
+import logging
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+from . import sosi_settings as soset
+from . import sosi_datahelper as sodhlp
+from . import sosi_parser as sopars
+from . import sosi_accumulator as soacc
+from . import sosi_cache as socache
+from . import sosi_spatial as sospat
+from . import sosi_stats as sostat
+from . import sosi_log_helper as sologhlp
+
+# Parsing, coordinate decoding, BUEP segmentation and mesh array assembly
+# for several SOSI files in parallel worker processes. Only the finished
+# arrays are returned to the caller (via shared memory), which then only
+# has to create the Blender meshes.
+
+# Settings copied to the worker processes
+WORKER_SETTINGS = [
+    'SOSI_CHUNK_ELEMENTS',
+    'SOSI_BUEP_SPLITS',
+    'SOSI_BUEP_CHORD_TOLERANCE',
+    'SOSI_ARC_SEGMENTS',
+    'SOSI_ACCUMULATOR_MAX_BYTES',
+    'SOSI_CACHE_ENABLED',
+    'SOSI_CACHE_DIR',
+    'SOSI_CACHE_MAX_BYTES',
+    'SOSI_INDEX_ENABLED',
+    'SOSI_WELD_VERTICES'
+]
+
+# Array names in the order stored per mesh
+MESH_ARRAYS = ['vertices', 'edges', 'loops', 'loop_totals', 'element_attrs', 'element_counts']
+
+# -----------------------------------------------------------------------------
+
+def get_settings():
+    return {name : getattr(soset, name) for name in WORKER_SETTINGS}
+
+# -----------------------------------------------------------------------------
+
+def apply_settings(settings):
+    for name, value in settings.items():
+        setattr(soset, name, value)
+
+# -----------------------------------------------------------------------------
+
+def load_elements(filename, ref_e, ref_n, elem_filter = None):
+    """
+    The elements of one SOSI file accepted by elem_filter (all when None),
+    from the cache or parsed, and clipped to the filter window if asked.
+    """
+    elements = socache.load_or_parse(filename, ref_e, ref_n, elem_filter)
+    return sospat.clip_elements(elements, elem_filter, ref_e, ref_n)
+
+def load_chunks(filename, ref_e, ref_n, elem_filter = None, size = None):
+    """
+    The elements of load_elements() in sosi_parser.ElementTables of at most
+    size (SOSI_CHUNK_ELEMENTS when None) elements.
+    """
+    return sopars.iter_element_chunks(load_elements(filename, ref_e, ref_n, elem_filter),
+        sopars.source_name(filename), size or soset.SOSI_CHUNK_ELEMENTS)
+
+# -----------------------------------------------------------------------------
+
+def weld_vertices(weld = None):
+    """Whether to weld the vertices: weld, SOSI_WELD_VERTICES when None."""
+    if weld == None:
+        return soset.SOSI_WELD_VERTICES
+    return weld
+
+# -----------------------------------------------------------------------------
+
+def build_file_meshes(filename, ref_e, ref_n, elem_filter = None, tile_size = 0.0, element_log = None,
+    weld = None):
+    """
+    Assemble the mesh arrays per object for the elements of one SOSI file,
+    see load_elements(). With tile_size > 0 the objects are split into
+    tiles, see sosi_spatial.element_key(). The vertices are welded when
+    weld is set (SOSI_WELD_VERTICES when None), see MeshData.weld(). The
+    elements are counted in element_log (sosi_log_helper.ElementLog) if
+    given.
+    Return the list of (key, MeshData) in commit order, and the number of
+    BUEP elements and BUEP points created.
+    """
+    meshes = []
+    acc = soacc.MeshAccumulator(lambda key, md: meshes.append((key, md)),
+        soset.SOSI_ACCUMULATOR_MAX_BYTES, weld_vertices(weld))
+    for table in sostat.stats.timed_iter('parse', load_chunks(filename, ref_e, ref_n, elem_filter)):
+        keys, key_ids = sospat.table_keys(table, ref_e, ref_n, tile_size)
+        acc.add_table(table, keys, key_ids)
+        if element_log != None:
+            element_log.add_table(table)
+    acc.flush()
+    return meshes, acc.narcs, acc.narc_pts
+
+# -----------------------------------------------------------------------------
+
+def pack_meshes(meshes):
+    """
+    Copy the arrays of meshes, a list of (key, MeshData), into one shared
+    memory block. Return the block name and a manifest describing where
+    the arrays are found, see unpack_meshes().
+    """
+    manifest = []
+    parts = []
+    nbytes = 0
+    for key, md in meshes:
+        arrays = []
+        for name in MESH_ARRAYS:
+            a = np.ascontiguousarray(getattr(md, name)())
+            arrays.append((a.dtype, a.shape, nbytes))
+            parts.append((nbytes, a))
+            nbytes += (a.nbytes + 7) & ~7  # 8 byte aligned
+        manifest.append((key, md.nelements, md.nwelded, arrays))
+    
+    shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 8))
+    for offset, a in parts:
+        np.ndarray(a.shape, a.dtype, buffer=shm.buf, offset=offset)[...] = a
+    name = shm.name
+    # The reading process owns the block from now on and unlinks it
+    if os.name == 'posix':
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    shm.close()
+    return name, manifest
+
+# -----------------------------------------------------------------------------
+
+class PackedMeshes():
+    """
+    Mesh arrays in a shared memory block made by pack_meshes().
+    meshes() gives (key, MeshData) with copies of the arrays, so they stay
+    valid after release() has unmapped the block.
+    """
+
+    def __init__(self, name, manifest):
+        self.shm = shared_memory.SharedMemory(name=name)
+        self.manifest = manifest
+
+    def meshes(self):
+        for key, nelements, nwelded, arrays in self.manifest:
+            copies = {name : np.ndarray(shape, dtype, buffer=self.shm.buf, offset=offset).copy()
+                for name, (dtype, shape, offset) in zip(MESH_ARRAYS, arrays)}
+            md = soacc.MeshData.from_arrays(nelements=nelements, **copies)
+            md.nwelded = nwelded
+            yield key, md
+
+    def release(self):
+        self.shm.close()
+        self.shm.unlink()
+
+# -----------------------------------------------------------------------------
+
+def _worker_build_file(filename, ref_e, ref_n, elem_filter, tile_size, settings):
+    apply_settings(settings)
+    socache.reset_stats()
+    sostat.stats.reset()
+    element_log = sologhlp.ElementLog()
+    meshes, narcs, narc_pts = build_file_meshes(filename, ref_e, ref_n, elem_filter, tile_size, element_log)
+    cache_stats = dict(socache.stats)
+    worker_stats = (cache_stats, sostat.stats.to_dict(), element_log.to_dict())
+    if os.name == 'posix':
+        with sostat.stats.stage('pack'):
+            name, manifest = pack_meshes(meshes)
+        return ('shm', name, manifest), narcs, narc_pts, worker_stats
+    # Windows removes a shared memory block when the creating process closes
+    # it, so the arrays are sent back pickled instead
+    return ('pickle', meshes), narcs, narc_pts, worker_stats
+
+# -----------------------------------------------------------------------------
+
+class _PickledMeshes():
+    
+    def __init__(self, meshes):
+        self._meshes = meshes
+    
+    def meshes(self):
+        return iter(self._meshes)
+    
+    def release(self):
+        self._meshes = None
+
+# -----------------------------------------------------------------------------
+
+def default_processes(nfiles):
+    nproc = soset.SOSI_IMPORT_PROCESSES
+    if nproc <= 0:
+        nproc = os.cpu_count() or 1
+    return max(1, min(nproc, nfiles))
+
+# -----------------------------------------------------------------------------
+
+def build_files_parallel(filenames, ref_e, ref_n, elem_filter = None, tile_size = 0.0, processes = None,
+    element_log = None, weld = None, poll_seconds = None):
+    """
+    Build the mesh arrays for all filenames in worker processes, see
+    build_file_meshes(). weld is sent to the workers with the other
+    settings, SOSI_WELD_VERTICES when None. The element counts of the workers are added to
+    element_log (sosi_log_helper.ElementLog) if given.
+    Yield (filename, result, narcs, narc_pts) in the order of filenames,
+    where result.meshes() gives the (key, MeshData) of the file in the same
+    order as a sequential import. Call result.release() when done with it.
+    With poll_seconds, None is yielded every poll_seconds while waiting for
+    the next file, so that the caller can keep its UI responsive.
+    """
+    if processes == None:
+        processes = default_processes(len(filenames))
+    settings = get_settings()
+    if weld != None:
+        settings['SOSI_WELD_VERTICES'] = weld
+    # Never fork the (possibly Blender) main process
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=processes, mp_context=ctx) as pool:
+        futures = [pool.submit(_worker_build_file, f, ref_e, ref_n, elem_filter, tile_size, settings) for f in filenames]
+        nyielded = 0
+        try:
+            for filename, fut in zip(filenames, futures):
+                while (poll_seconds != None) and (len(wait([fut], poll_seconds).done) == 0):
+                    yield None
+                packed, narcs, narc_pts, (cache_stats, worker_stats, worker_log) = fut.result()
+                for name, count in cache_stats.items():
+                    socache.stats[name] += count
+                sostat.stats.merge(worker_stats, 'worker ')
+                if element_log != None:
+                    element_log.merge(worker_log)
+                nyielded += 1
+                yield filename, _unpack(packed), narcs, narc_pts
+        finally:
+            # Stopped early, drop the results not handed over
+            for fut in futures[nyielded:]:
+                if not fut.cancel() and (fut.exception() == None):
+                    _unpack(fut.result()[0]).release()
+
+# -----------------------------------------------------------------------------
+
+def _unpack(packed):
+    if packed[0] == 'shm':
+        return PackedMeshes(packed[1], packed[2])
+    return _PickledMeshes(packed[1])
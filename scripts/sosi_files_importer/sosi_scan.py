@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright © 2022 Jonny Normann Skålvik
+
+Permission is hereby granted, free of charge, to any person obtaining a copy 
+of this software and associated documentation files (the “Software”), to deal 
+in the Software without restriction, including without limitation the rights 
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell 
+copies of the Software, and to permit persons to whom the Software is 
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in 
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE 
+SOFTWARE.
+
+This file is part of SosiImporter, an addon to import SOSI files containing
+3D model data into Blender.
+"""
+
+import os
+import re
+import mmap
+from collections import Counter
+from . import sosi_parser as sopars
+
+# Fast scan of a SOSI file without decoding any coordinates: the .HODE
+# values, the number of elements per kind and per ..OBJTYPE. The file is
+# memory mapped and searched for lines starting with '.' at byte level.
+
+# An element line ('.KURVE 12:') or an ..OBJTYPE line, after a line break.
+# Gives b'KURVE' or b'.OBJTYPE Teiggrense', counted without decoding.
+_SCAN_PATTERN = re.compile(rb'\n\.(\.OBJTYPE[ \t]+[^\s]+|[^.\s][^\s]*)')
+_OBJTYPE_PREFIX = b'.OBJTYPE'
+
+# The first element line after .HODE ends the header
+_HEAD_END_PATTERN = re.compile(rb'\n\.[^.\s]')
+
+# Level 1 tags which are not elements
+NON_ELEMENT_TAGS = ('HODE', 'SLUTT')
+
+# (path, size, mtime) -> SosiScan, scans made during this session
+_scans = {}
+
+# -----------------------------------------------------------------------------
+
+class SosiScan():
+    """Result of scan_sosi_file()."""
+
+    def __init__(self, filename, header, kinds, objtypes):
+        self.filename = filename
+        self.header = header        # SosiHeader
+        self.kinds = kinds          # Element tag -> count, e.g. {'KURVE' : 12}
+        self.objtypes = objtypes    # OBJTYPE -> count
+
+    def nelements(self):
+        return sum(self.kinds.values())
+
+# -----------------------------------------------------------------------------
+
+def _scan_header(buf):
+    """Parse the .HODE section at the start of buf into a SosiHeader."""
+    header = sopars.SosiHeader()
+    start = buf.find(b'.HODE')
+    if start < 0:
+        return header
+    m = _HEAD_END_PATTERN.search(buf, start)
+    end = m.start() if m else len(buf)
+    for line in buf[start:end].splitlines()[1:]:
+        if line[:1] != b'.':
+            continue
+        level, tag, values = sopars.split_tag(sopars.decode_line(line, header))
+        header.set_tag(tag, values)
+    return header
+
+# -----------------------------------------------------------------------------
+
+def _scan_buffer(filename, buf):
+    header = _scan_header(buf)
+    counts = Counter(_SCAN_PATTERN.findall(buf))
+    if buf[:1] == b'.' and buf[1:2] != b'.':
+        counts[buf[1:64].split(None, 1)[0]] += 1   # No line break before line 1
+
+    # Only the distinct values are decoded
+    kinds = Counter()
+    objtypes = Counter()
+    for value, n in counts.items():
+        if value.startswith(_OBJTYPE_PREFIX):
+            objtypes[sopars.decode_line(value[len(_OBJTYPE_PREFIX):], header)] += n
+        else:
+            kinds[sopars.decode_line(value, header).upper()] += n
+    for tag in NON_ELEMENT_TAGS:
+        kinds.pop(tag, None)
+    return SosiScan(filename, header, dict(kinds), dict(objtypes))
+
+# -----------------------------------------------------------------------------
+
+def scan_sosi_file(filename):
+    """
+    Scan filename for its header values and element/OBJTYPE counts.
+    The result is kept for the session, so a file scanned for the tag
+    selection dialog is not scanned again by the import.
+    """
+    st = os.stat(filename)
+    key = (os.path.realpath(filename), st.st_size, st.st_mtime_ns)
+    scan = _scans.get(key)
+    if scan != None:
+        return scan
+    with open(filename, 'rb') as f:
+        if st.st_size == 0:
+            scan = _scan_buffer(filename, b'')
+        else:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                scan = _scan_buffer(filename, mm)
+    _scans[key] = scan
+    return scan
@@ -48,6 +48,73 @@ REL_DLL_PATH = 'sosi_files_importer\\bin\\x64\\JoNoS_Blender_SosiLib.dll'
 DEBUG_DLL_PATH = \
     'F:\\MyProjects\\Projects\\TGT\\PY\\JoNoS_Blender_SosiLib\\' \
     'x64\\Debug\\JoNoS_Blender_SosiLib.dll'
+
+# Unload the DLL after each import, to recompile it without restarting
+# Blender. Otherwise it is loaded once per session.
+SOSI_DLL_RELOAD_EACH_IMPORT = USE_DEBUG_DLL_PATH
     
 # Number of segments for BUE drawing
-SOSI_ARC_SEGMENTS = 32 # 32 segments over angle Pi (half circle)
\ No newline at end of file
+SOSI_ARC_SEGMENTS = 32 # 32 segments over angle Pi (half circle)
+
+# Number of segments per arc for BUEP elements (each BUEP contains two arcs)
+SOSI_BUEP_SPLITS = 8
+
+# Max. deviation [m] between BUEP arcs and their segments. When > 0.0 the
+# number of segments is computed from this and the arc radius and angle,
+# instead of using SOSI_BUEP_SPLITS. E.g. 0.02 for 2 cm.
+SOSI_BUEP_CHORD_TOLERANCE = 0.0
+
+
+# Max. memory used for vertex and edge data collected before the Blender
+# meshes are created. Partial meshes are flushed when exceeded.
+SOSI_ACCUMULATOR_MAX_BYTES = 512 * 1024 * 1024
+
+# Triangulate the FLATE polygons (once per object) instead of keeping n-gons
+SOSI_FLATE_TRIANGULATE = False
+
+# Number of worker processes used by the Python parser when importing
+# several files. 0: one per CPU, 1: import in Blender's process only.
+SOSI_IMPORT_PROCESSES = 0
+
+# Cache of parsed SOSI files, re-imports of unchanged files skip parsing.
+# SOSI_CACHE_DIR '' uses .sosi_importer_cache in the user home directory.
+SOSI_CACHE_ENABLED = True
+SOSI_CACHE_DIR = ''
+SOSI_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+# Element offset index per SOSI file (stored in the cache directory), used
+# to read only the selected elements when importing with a filter.
+SOSI_INDEX_ENABLED = True
+
+# Merge the vertices shared by the elements of an object (same integer SOSI
+# coordinates), so the curves and surfaces of each OBJTYPE form one connected
+# mesh. Done per accumulator flush, used by the Python parser only.
+SOSI_WELD_VERTICES = False
+
+# Interval [s] of the progress line logged during imports (INFO level),
+# 0.0 for none
+SOSI_LOG_PROGRESS_SECONDS = 5.0
+
+# Time slice [s] of the modal (cancellable) Python parser import, the
+# progress is updated and the UI redrawn in between
+SOSI_MODAL_SLICE_SECONDS = 0.05
+
+# Directory for the import statistics (JSON) and profiles, see sosi_stats.
+# '' uses .sosi_importer_cache/stats in the user home directory.
+SOSI_STATS_DIR = ''
+
+# Number of elements handed from the parser to the mesh building at a time,
+# see sosi_parser.ElementTable
+SOSI_CHUNK_ELEMENTS = 4096
+
+# Number of elements per progress step of the Python parser import, see
+# SOSI_MODAL_SLICE_SECONDS
+SOSI_MODAL_CHUNK_ELEMENTS = 1024
+
+# Unit of ..RETNING (PUNKT symbol direction, clockwise from north):
+# 360.0 for degrees, 400.0 for gon
+SOSI_RETNING_FULL_CIRCLE = 360.0
+
+# Size [m] of the default symbol mesh instanced on PUNKT elements when
+# point symbols are enabled, replace the symbol objects' mesh for others
+SOSI_PUNKT_SYMBOL_SIZE = 1.0
\ No newline at end of file
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright © 2022 Jonny Normann Skålvik
+
+Permission is hereby granted, free of charge, to any person obtaining a copy 
+of this software and associated documentation files (the “Software”), to deal 
+in the Software without restriction, including without limitation the rights 
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell 
+copies of the Software, and to permit persons to whom the Software is 
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in 
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE 
+SOFTWARE.
+
+This file is part of SosiImporter, an addon to import SOSI files containing
+3D model data into Blender.
+"""
+
+import math
+import numpy as np
+from . import sosi_datahelper as sodhlp
+from . import sosi_geom_helper as sogeohlp
+from . import sosi_parser as sopars
+
+# Window import and tiling: a uniform grid over the element extents of a
+# file index, clipping of elements to the window, and the assignment of
+# elements to tile collections.
+
+# Elements covering more grid cells than this are kept in a separate list
+# which is tested against every query
+GRID_MAX_CELLS_PER_ELEMENT = 64
+
+# Target number of elements per grid cell
+GRID_ELEMENTS_PER_CELL = 4
+
+# -----------------------------------------------------------------------------
+
+class SpatialGrid():
+    """
+    Uniform grid over the (n, 4) extents min_e, min_n, max_e, max_n.
+    Each cell lists the elements overlapping it (CSR arrays). Elements
+    without extents (NaN) or covering many cells are always candidates.
+    """
+
+    def __init__(self, extents):
+        self.extents = extents
+        n = len(extents)
+        valid = np.all(np.isfinite(extents), axis=1)
+        self.origin = np.zeros(2)
+        self.cell = 1.0
+        self.nx = 1
+        self.ny = 1
+        if valid.any():
+            lo = extents[valid, :2].min(axis=0)
+            hi = extents[valid, 2:].max(axis=0)
+            size = np.maximum(hi - lo, 1e-9)
+            ncells = max(1, valid.sum() // GRID_ELEMENTS_PER_CELL)
+            self.cell = max(math.sqrt(size[0] * size[1] / ncells), max(size) / 4096.0, 1e-6)
+            self.origin = lo
+            self.nx = int(size[0] // self.cell) + 1
+            self.ny = int(size[1] // self.cell) + 1
+
+        rows = np.nonzero(valid)[0]
+        ix0, iy0 = self.cell_of(extents[rows, 0], extents[rows, 1])
+        ix1, iy1 = self.cell_of(extents[rows, 2], extents[rows, 3])
+        w = ix1 - ix0 + 1
+        counts = w * (iy1 - iy0 + 1)
+        large = counts > GRID_MAX_CELLS_PER_ELEMENT
+        self.always = np.concatenate((np.nonzero(~valid)[0], rows[large]))
+        
+        rows, ix0, iy0, w, counts = rows[~large], ix0[~large], iy0[~large], w[~large], counts[~large]
+        rep = np.repeat(np.arange(len(rows)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cells = (iy0[rep] + local // w[rep]) * self.nx + (ix0[rep] + local % w[rep])
+        order = np.argsort(cells, kind='stable')
+        self.cell_rows = rows[rep[order]]
+        self.cell_start = np.zeros(self.nx * self.ny + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cells, minlength=self.nx * self.ny), out=self.cell_start[1:])
+
+    def cell_of(self, e, n):
+        ix = np.clip(((e - self.origin[0]) // self.cell).astype(np.int64), 0, self.nx - 1)
+        iy = np.clip(((n - self.origin[1]) // self.cell).astype(np.int64), 0, self.ny - 1)
+        return ix, iy
+
+    def query(self, bbox):
+        """Return the sorted indices of the elements overlapping bbox."""
+        ix0, iy0 = self.cell_of(np.array([bbox[0]]), np.array([bbox[1]]))
+        ix1, iy1 = self.cell_of(np.array([bbox[2]]), np.array([bbox[3]]))
+        parts = [self.always]
+        for iy in range(iy0[0], iy1[0] + 1):
+            first = iy * self.nx
+            parts.append(self.cell_rows[self.cell_start[first + ix0[0]]:self.cell_start[first + ix1[0] + 1]])
+        cand = np.unique(np.concatenate(parts))
+        ext = self.extents[cand]
+        with np.errstate(invalid='ignore'):
+            outside = (ext[:, 2] < bbox[0]) | (ext[:, 0] > bbox[2]) | \
+                (ext[:, 3] < bbox[1]) | (ext[:, 1] > bbox[3])
+        return cand[~outside]
+
+# -----------------------------------------------------------------------------
+
+def window_bbox(ref_e, ref_n, radius):
+    """The window (min_e, min_n, max_e, max_n) of radius around the reference point."""
+    return (ref_e - radius, ref_n - radius, ref_e + radius, ref_n + radius)
+
+# -----------------------------------------------------------------------------
+
+def clip_elements(elements, elem_filter, ref_e, ref_n):
+    """
+    Cut the elements at the window of elem_filter if its clip flag is set,
+    otherwise pass them unchanged. Curves may be split into several pieces,
+    BUEP arcs are segmented and delivered as curves. The cut curves and
+    surfaces have no grid, their vertices are not welded.
+    """
+    if (elem_filter == None) or (elem_filter.bbox == None) or not elem_filter.clip:
+        yield from elements
+        return
+    bbox = elem_filter.bbox
+    box = (bbox[0] - ref_e, bbox[1] - ref_n, bbox[2] - ref_e, bbox[3] - ref_n)
+    for elem in elements:
+        coords = elem.coords
+        if len(coords) == 0:
+            continue
+        lo = coords[:, :2].min(axis=0)
+        hi = coords[:, :2].max(axis=0)
+        if (lo[0] >= box[0]) and (lo[1] >= box[1]) and (hi[0] <= box[2]) and (hi[1] <= box[3]):
+            yield elem  # Inside
+            continue
+        objid = sodhlp.SosiObjId(elem.id)
+        if objid == sodhlp.SosiObjId.PUNKT:
+            inside = (coords[:, 0] >= box[0]) & (coords[:, 0] <= box[2]) & \
+                (coords[:, 1] >= box[1]) & (coords[:, 1] <= box[3])
+            if inside.any():
+                grid = None if elem.grid is None else elem.grid[inside]
+                yield elem._replace(coords=coords[inside], grid=grid)
+        elif objid == sodhlp.SosiObjId.FLATE:
+            # Each ring on its own, holes outside the box vanish
+            starts = [0] + ([] if elem.holes is None else list(elem.holes))
+            rings = [sogeohlp.clip_polygon_box(coords[i:j], box)
+                for i, j in zip(starts, starts[1:] + [len(coords)])]
+            if len(rings[0]) == 0:
+                continue
+            rings = [ring for ring in rings if len(ring) > 0]
+            holes = np.cumsum([len(ring) for ring in rings[:-1]]) if len(rings) > 1 else None
+            yield elem._replace(coords=np.concatenate(rings), holes=holes, grid=None)
+        else:
+            if objid == sodhlp.SosiObjId.BUEP:
+                coords = sopars.curve_points('BUEP', coords)
+            for piece in sogeohlp.clip_polyline_box(coords, box):
+                yield elem._replace(id=sodhlp.SosiObjId.KURVE.value, coords=piece, grid=None)
+
+# -----------------------------------------------------------------------------
+
+def element_key(elem, ref_e, ref_n, tile_size):
+    """
+    The (collection name, object name, OBJTYPE) an element is imported to.
+    With a tile_size > 0 the file is split into tiles of tile_size metres,
+    named by their lower left corner, and the element goes to the tile
+    holding the centre of its extents.
+    """
+    if tile_size <= 0.0 or len(elem.coords) == 0:
+        return (elem.filename, elem.objname, elem.objname)
+    lo = elem.coords[:, :2].min(axis=0)
+    hi = elem.coords[:, :2].max(axis=0)
+    tile_e = math.floor(((lo[0] + hi[0]) * 0.5 + ref_e) / tile_size) * tile_size
+    tile_n = math.floor(((lo[1] + hi[1]) * 0.5 + ref_n) / tile_size) * tile_size
+    tile = 'E{:.0f}_N{:.0f}'.format(tile_e, tile_n)
+    return ('{} {}'.format(elem.filename, tile), '{} {}'.format(elem.objname, tile), elem.objname)
+
+def table_keys(table, ref_e, ref_n, tile_size):
+    """
+    element_key() for all elements of an sosi_parser.ElementTable at once.
+    Return the list of keys and the index into it per record.
+    """
+    records = table.records
+    if tile_size <= 0.0 or len(records) == 0:
+        return [(table.filename, name, name) for name in table.names], records['name_id']
+    rows, counts = table.vertex_rows()
+    tiled = counts > 0
+    tiles = np.zeros((len(records), 2))
+    if np.any(tiled):
+        starts = (np.cumsum(counts) - counts)[tiled]
+        xy = table.coords[rows, :2]
+        centre = (np.minimum.reduceat(xy, starts) + np.maximum.reduceat(xy, starts)) * 0.5
+        tiles[tiled] = np.floor((centre + (ref_e, ref_n)) / tile_size) * tile_size
+    parts = np.column_stack((records['name_id'], tiled, tiles))
+    uniq, key_ids = np.unique(parts, axis=0, return_inverse=True)
+    keys = []
+    for name_id, has_tile, tile_e, tile_n in uniq:
+        name = table.names[int(name_id)]
+        if has_tile:
+            tile = 'E{:.0f}_N{:.0f}'.format(tile_e, tile_n)
+            keys.append(('{} {}'.format(table.filename, tile), '{} {}'.format(name, tile), name))
+        else:
+            keys.append((table.filename, name, name))
+    return keys, key_ids.ravel()
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright © 2022 Jonny Normann Skålvik
+
+Permission is hereby granted, free of charge, to any person obtaining a copy 
+of this software and associated documentation files (the “Software”), to deal 
+in the Software without restriction, including without limitation the rights 
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell 
+copies of the Software, and to permit persons to whom the Software is 
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in 
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE 
+SOFTWARE.
+
+This file is part of SosiImporter, an addon to import SOSI files containing
+3D model data into Blender.
+"""
+
+import os
+import io
+import json
+import time
+import logging
+import datetime
+import contextlib
+from . import sosi_settings as soset
+
+# -----------------------------------------------------------------------------
+
+class ImportStats():
+    """
+    Wall time per named stage and counters for one import. Stages may be
+    nested (e.g. mesh_commit inside callback), their times are inclusive.
+    """
+
+    def __init__(self):
+        self.profiler = None    # cProfile of instrumented(), if any
+        self.reset()
+
+    def reset(self):
+        self.stages = {}    # name -> [seconds, calls], in order of first use
+        self.counters = {}
+        self.info = {}
+        self.started = datetime.datetime.now().isoformat(timespec='seconds')
+        self.t_start = time.perf_counter()
+
+    def add_time(self, name, seconds, calls = 1):
+        stage = self.stages.get(name)
+        if stage == None:
+            self.stages[name] = [seconds, calls]
+        else:
+            stage[0] += seconds
+            stage[1] += calls
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - t0)
+
+    def profile_steps(self, iterable):
+        """
+        Yield from iterable with the profiler only enabled while the items
+        are produced, not while the caller runs in between (the modal
+        operator between its timer events).
+        """
+        profiler = self.profiler
+        if profiler == None:
+            yield from iterable
+            return
+        it = iter(iterable)
+        while True:
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            profiler.disable()
+            try:
+                yield item
+            finally:
+                profiler.enable()
+
+    def timed_iter(self, name, iterable):
+        """Yield from iterable, the time spent producing the items goes to stage name."""
+        it = iter(iterable)
+        seconds = 0.0
+        ncalls = 0
+        try:
+            while True:
+                t0 = time.perf_counter()
+                try:
+                    item = next(it)
+                except StopIteration:
+                    break
+                finally:
+                    seconds += time.perf_counter() - t0
+                    ncalls += 1
+                yield item
+        finally:
+            self.add_time(name, seconds, ncalls)
+
+    def count(self, name, n = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def to_dict(self):
+        return {
+            'started' : self.started,
+            'total_seconds' : time.perf_counter() - self.t_start,
+            'stages' : {name : {'seconds' : s, 'calls' : n} for name, (s, n) in self.stages.items()},
+            'counters' : dict(self.counters),
+            'info' : dict(self.info)}
+
+    def merge(self, other, prefix = ''):
+        """
+        Add the stages and counters of other, a to_dict() from a worker
+        process. The stage names get prefix, worker times overlap in time.
+        """
+        for name, stage in other['stages'].items():
+            self.add_time(prefix + name, stage['seconds'], stage['calls'])
+        for name, n in other['counters'].items():
+            self.count(name, n)
+
+    def summary_table(self):
+        total = time.perf_counter() - self.t_start
+        out = io.StringIO()
+        out.write('{:<28} {:>10} {:>7} {:>10}\n'.format('Stage', 'Seconds', '%', 'Calls'))
+        for name, (seconds, calls) in self.stages.items():
+            share = 100.0 * seconds / total if total > 0.0 else 0.0
+            out.write('{:<28} {:>10.3f} {:>7.1f} {:>10}\n'.format(name, seconds, share, calls))
+        out.write('{:<28} {:>10.3f}\n'.format('total', total))
+        for name in sorted(self.counters):
+            out.write('{:<28} {:>10}\n'.format(name, self.counters[name]))
+        for name, value in self.info.items():
+            out.write('{:<28} {:>10}\n'.format(name, value))
+        return out.getvalue()
+
+    def write_json(self, out_dir):
+        """Write the stats to a new time stamped file in out_dir, return its path."""
+        os.makedirs(out_dir, exist_ok=True)
+        stamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        path = os.path.join(out_dir, 'sosi_import_{}.json'.format(stamp))
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=1)
+        return path
+
+# Stats of the current import (per process, workers send theirs back)
+stats = ImportStats()
+
+# -----------------------------------------------------------------------------
+
+def stats_dir():
+    if soset.SOSI_STATS_DIR:
+        return soset.SOSI_STATS_DIR
+    return os.path.join(os.path.expanduser('~'), '.sosi_importer_cache', 'stats')
+
+# -----------------------------------------------------------------------------
+
+@contextlib.contextmanager
+def instrumented(label, write_json = False, profile_cpu = False, profile_memory = False):
+    """
+    Reset the stats for a new import named label and log the summary when
+    done. Optionally write the stats as JSON to stats_dir(), and run the
+    import under cProfile (the .prof file is written next to the JSON file,
+    the top functions logged) and tracemalloc (peak memory in the stats).
+    """
+    stats.reset()
+    stats.info['import'] = label
+    profiler = None
+    if profile_cpu:
+        import cProfile
+        profiler = cProfile.Profile()
+    if profile_memory:
+        import tracemalloc
+        tracemalloc.start()
+    if profiler != None:
+        stats.profiler = profiler
+        profiler.enable()
+    try:
+        yield stats
+    finally:
+        if profiler != None:
+            profiler.disable()
+            stats.profiler = None
+        if profile_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            stats.info['peak_traced_bytes'] = peak
+        logging.info('SOSI import statistics (%s):\n%s', label, stats.summary_table().rstrip('\n'))
+        try:
+            if write_json or (profiler != None):
+                path = stats.write_json(stats_dir())
+                logging.info('Import statistics written to %s', path)
+            if profiler != None:
+                prof_path = os.path.splitext(path)[0] + '.prof'
+                profiler.dump_stats(prof_path)
+                log_profile(profiler)
+                logging.info('Profile written to %s', prof_path)
+        except OSError as e:
+            logging.warning('Import statistics not written: %s', e)
+
+def log_profile(profiler, nfuncs = 25):
+    import pstats
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(nfuncs)
+    logging.info('%s', out.getvalue())
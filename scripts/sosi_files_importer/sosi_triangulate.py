@@ -0,0 +1,473 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright © 2022 Jonny Normann Skålvik
+
+Permission is hereby granted, free of charge, to any person obtaining a copy 
+of this software and associated documentation files (the “Software”), to deal 
+in the Software without restriction, including without limitation the rights 
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell 
+copies of the Software, and to permit persons to whom the Software is 
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in 
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE 
+SOFTWARE.
+
+This file is part of SosiImporter, an addon to import SOSI files containing
+3D model data into Blender.
+"""
+
+import numpy as np
+
+# Polygon triangulation by ear clipping, after the earcut algorithm (Mapbox,
+# ISC license): holes are bridged into the outer ring, and with more than
+# EARCUT_HASH_MIN_POINTS points the ear tests only visit the vertices whose
+# z-order code lies between the codes of the ear bbox corners. The vertices
+# are kept sorted by code in arrays, so a code range is a slice, and ranges
+# longer than EARCUT_BUCKET_MIN_POINTS are tested with numpy in one go.
+#
+# The ear tests still grow with the ring, as a jagged ring has large ears
+# late in the clipping whose code ranges span much of the ring: a jagged ring
+# of 20000 points takes about 1 s, 100000 points 7 s and 200000 points 22 s.
+
+EARCUT_HASH_MIN_POINTS = 80
+EARCUT_BUCKET_MIN_POINTS = 64
+
+# -----------------------------------------------------------------------------
+
+class _Node():
+    """Polygon vertex in the doubly linked ring (prev, next) and z-order list."""
+
+    __slots__ = ('i', 'x', 'y', 'prev', 'next', 'z', 'steiner')
+
+    def __init__(self, i, x, y, z = -1):
+        self.i = i
+        self.x = x
+        self.y = y
+        self.prev = None
+        self.next = None
+        self.z = z
+        self.steiner = False
+
+# -----------------------------------------------------------------------------
+
+def triangulate(xy, holes = None):
+    """
+    Triangulate the polygon with the outer ring xy[:holes[0]] and the hole
+    rings starting at the indices holes (x, y used, any orientation).
+    Return an (m, 3) int array of indices into xy, counter clockwise.
+    """
+    xy = np.asarray(xy, dtype=np.float64)[:, :2]
+    npts = len(xy)
+    starts = [0] + [int(h) for h in (holes if holes is not None else [])]
+    ends = starts[1:] + [npts]
+    
+    grid = None
+    zs = None
+    if npts > EARCUT_HASH_MIN_POINTS:
+        outer = xy[:ends[0]]
+        lo = outer.min(axis=0)
+        size = (outer.max(axis=0) - lo).max()
+        if size > 0.0:
+            grid = _ZGrid(lo[0], lo[1], 32767.0 / size)
+            zs = grid.codes(xy).tolist()
+    xs = xy[:, 0].tolist()
+    ys = xy[:, 1].tolist()
+    
+    outer = _linked_list(xs, ys, zs, starts[0], ends[0], True)
+    tris = []
+    if (outer != None) and (outer.next is not outer.prev):
+        if len(starts) > 1:
+            outer = _eliminate_holes(xs, ys, zs, starts[1:], ends[1:], outer)
+        _earcut_linked(outer, tris, grid, 0)
+    if len(tris) == 0:
+        return np.empty((0, 3), dtype=np.int64)
+    return np.array(tris, dtype=np.int64).reshape(-1, 3)
+
+# -----------------------------------------------------------------------------
+
+class _ZGrid():
+    """z-order (Morton) codes on a 32768 x 32768 grid over the outer ring."""
+
+    MASKS = ((8, 0x00FF00FF), (4, 0x0F0F0F0F), (2, 0x33333333), (1, 0x55555555))
+
+    def __init__(self, lo_x, lo_y, inv_size):
+        self.lo_x = lo_x
+        self.lo_y = lo_y
+        self.inv_size = inv_size
+
+    def codes(self, xy):
+        """Codes of all points xy at once."""
+        q = ((xy - (self.lo_x, self.lo_y)) * self.inv_size).astype(np.int64) & 0x7fff
+        for shift, mask in self.MASKS:
+            q = (q | (q << shift)) & mask
+        return q[:, 0] | (q[:, 1] << 1)
+
+    def code(self, x, y):
+        x = int((x - self.lo_x) * self.inv_size) & 0x7fff
+        y = int((y - self.lo_y) * self.inv_size) & 0x7fff
+        for shift, mask in self.MASKS:
+            x = (x | (x << shift)) & mask
+            y = (y | (y << shift)) & mask
+        return x | (y << 1)
+
+def _linked_list(xs, ys, zs, start, end, clockwise):
+    # Signed area of the ring, positive when clockwise
+    area = 0.0
+    j = end - 1
+    for i in range(start, end):
+        area += (xs[j] - xs[i]) * (ys[i] + ys[j])
+        j = i
+    if clockwise == (area > 0.0):
+        order = range(start, end)
+    else:
+        order = range(end - 1, start - 1, -1)
+    last = None
+    for i in order:
+        last = _insert_node(i, xs[i], ys[i], zs[i] if zs != None else -1, last)
+    if (last != None) and _equals(last, last.next):
+        _remove_node(last)
+        last = last.next
+    return last
+
+def _filter_points(start, end = None):
+    """Remove duplicate and collinear points."""
+    if start == None:
+        return start
+    if end == None:
+        end = start
+    p = start
+    while True:
+        again = False
+        if (not p.steiner) and (_equals(p, p.next) or _area(p.prev, p, p.next) == 0.0):
+            _remove_node(p)
+            p = end = p.prev
+            if p is p.next:
+                break
+            again = True
+        else:
+            p = p.next
+        if not again and (p is end):
+            break
+    return end
+
+def _earcut_linked(ear, tris, grid, pass_no, index = None):
+    if ear == None:
+        return
+    if (pass_no == 0) and (grid != None):
+        index = _ZIndex(ear, grid)
+    stop = ear
+    while ear.prev is not ear.next:
+        prev = ear.prev
+        nxt = ear.next
+        is_ear = index.is_ear(ear) if (index != None) else _is_ear(ear)
+        if is_ear:
+            tris.extend((prev.i, ear.i, nxt.i))
+            _remove_node(ear)
+            if index != None:
+                index.removed()
+            # Skipping the next vertex gives less sliver triangles
+            ear = nxt.next
+            stop = nxt.next
+            continue
+        ear = nxt
+        if ear is stop:
+            # No ears found in a whole round
+            if pass_no == 0:
+                _earcut_linked(_filter_points(ear), tris, grid, 1, index)
+            elif pass_no == 1:
+                ear = _cure_local_intersections(_filter_points(ear), tris)
+                _earcut_linked(ear, tris, grid, 2, index)
+            else:
+                _split_earcut(ear, tris, grid)
+            break
+
+def _is_ear(ear):
+    a = ear.prev
+    b = ear
+    c = ear.next
+    if _area(a, b, c) >= 0.0:
+        return False    # Reflex
+    x0, x1 = min(a.x, b.x, c.x), max(a.x, b.x, c.x)
+    y0, y1 = min(a.y, b.y, c.y), max(a.y, b.y, c.y)
+    p = c.next
+    while p is not a:
+        if (x0 <= p.x <= x1) and (y0 <= p.y <= y1) and \
+            _point_in_triangle(a.x, a.y, b.x, b.y, c.x, c.y, p.x, p.y) and \
+            _area(p.prev, p, p.next) >= 0.0:
+            return False
+        p = p.next
+    return True
+
+class _ZIndex():
+    """
+    The vertices of a ring sorted by z-order code, for the ear tests. Removed
+    vertices are skipped when their neighbours no longer link to them, and
+    dropped from the arrays once they are half of them.
+    """
+
+    def __init__(self, start, grid):
+        nodes = []
+        p = start
+        while True:
+            nodes.append(p)
+            p = p.next
+            if p is start:
+                break
+        nodes.sort(key=lambda node: node.z)
+        self.grid = grid
+        self.set_nodes(nodes)
+
+    def set_nodes(self, nodes):
+        self.nodes = nodes
+        self.z = np.array([node.z for node in nodes], dtype=np.int64)
+        self.x = np.array([node.x for node in nodes])
+        self.y = np.array([node.y for node in nodes])
+        self.nremoved = 0
+
+    def removed(self):
+        """Count a clipped ear, drop the removed vertices now and then."""
+        self.nremoved += 1
+        if 2 * self.nremoved > len(self.nodes):
+            self.set_nodes([p for p in self.nodes if p.prev.next is p])
+
+    def is_ear(self, ear):
+        a = ear.prev
+        b = ear
+        c = ear.next
+        if _area(a, b, c) >= 0.0:
+            return False    # Reflex
+        x0, x1 = min(a.x, b.x, c.x), max(a.x, b.x, c.x)
+        y0, y1 = min(a.y, b.y, c.y), max(a.y, b.y, c.y)
+        # The codes of the bbox corners bound the codes of the vertices within
+        lo = int(np.searchsorted(self.z, self.grid.code(x0, y0), 'left'))
+        hi = int(np.searchsorted(self.z, self.grid.code(x1, y1), 'right'))
+        if hi - lo < EARCUT_BUCKET_MIN_POINTS:
+            candidates = [p for p in self.nodes[lo:hi] if (x0 <= p.x <= x1) and (y0 <= p.y <= y1) and \
+                _point_in_triangle(a.x, a.y, b.x, b.y, c.x, c.y, p.x, p.y)]
+        else:
+            px = self.x[lo:hi]
+            py = self.y[lo:hi]
+            inside = (px >= x0) & (px <= x1) & (py >= y0) & (py <= y1) & \
+                ((c.x - px) * (a.y - py) >= (a.x - px) * (c.y - py)) & \
+                ((a.x - px) * (b.y - py) >= (b.x - px) * (a.y - py)) & \
+                ((b.x - px) * (c.y - py) >= (c.x - px) * (b.y - py))
+            candidates = [self.nodes[lo + k] for k in np.flatnonzero(inside).tolist()]
+        for p in candidates:
+            if (p is not a) and (p is not b) and (p is not c) and (p.prev.next is p) and \
+                _area(p.prev, p, p.next) >= 0.0:
+                return False
+        return True
+
+def _cure_local_intersections(start, tris):
+    p = start
+    while True:
+        a = p.prev
+        b = p.next.next
+        if (not _equals(a, b)) and _intersects(a, p, p.next, b) and \
+            _locally_inside(a, b) and _locally_inside(b, a):
+            tris.extend((a.i, p.i, b.i))
+            _remove_node(p)
+            _remove_node(p.next)
+            p = start = b
+        p = p.next
+        if p is start:
+            break
+    return _filter_points(p)
+
+def _split_earcut(start, tris, grid):
+    """Split the ring along a valid diagonal and triangulate both halves."""
+    a = start
+    while True:
+        b = a.next.next
+        while b is not a.prev:
+            if (a.i != b.i) and _is_valid_diagonal(a, b):
+                c = _split_polygon(a, b)
+                a = _filter_points(a, a.next)
+                c = _filter_points(c, c.next)
+                _earcut_linked(a, tris, grid, 0)
+                _earcut_linked(c, tris, grid, 0)
+                return
+            b = b.next
+        a = a.next
+        if a is start:
+            break
+
+def _eliminate_holes(xs, ys, zs, starts, ends, outer):
+    queue = []
+    for start, end in zip(starts, ends):
+        lst = _linked_list(xs, ys, zs, start, end, False)
+        if lst == None:
+            continue
+        if lst is lst.next:
+            lst.steiner = True
+        queue.append(_get_leftmost(lst))
+    queue.sort(key=lambda node: node.x)
+    for hole in queue:
+        outer = _eliminate_hole(hole, outer)
+    return outer
+
+def _eliminate_hole(hole, outer):
+    bridge = _find_hole_bridge(hole, outer)
+    if bridge == None:
+        return outer
+    bridge_reverse = _split_polygon(bridge, hole)
+    _filter_points(bridge_reverse, bridge_reverse.next)
+    return _filter_points(bridge, bridge.next)
+
+def _find_hole_bridge(hole, outer):
+    """The outer ring vertex to connect the leftmost hole vertex with."""
+    p = outer
+    hx = hole.x
+    hy = hole.y
+    qx = -np.inf
+    m = None
+    # Segment to the left of the hole point crossing its horizontal ray
+    while True:
+        if (hy <= p.y) and (hy >= p.next.y) and (p.next.y != p.y):
+            x = p.x + (hy - p.y) * (p.next.x - p.x) / (p.next.y - p.y)
+            if (x <= hx) and (x > qx):
+                qx = x
+                m = p if p.x < p.next.x else p.next
+                if x == hx:
+                    return m
+        p = p.next
+        if p is outer:
+            break
+    if m == None:
+        return None
+    # Of the vertices inside the triangle (hole, crossing, m) the one with
+    # the smallest angle to the ray, if any
+    stop = m
+    mx = m.x
+    my = m.y
+    tan_min = np.inf
+    p = m
+    while True:
+        if (hx >= p.x >= mx) and (hx != p.x) and _point_in_triangle(
+            hx if hy < my else qx, hy, mx, my, qx if hy < my else hx, hy, p.x, p.y):
+            tan = abs(hy - p.y) / (hx - p.x)
+            if _locally_inside(p, hole) and ((tan < tan_min) or ((tan == tan_min) and \
+                ((p.x > m.x) or ((p.x == m.x) and _sector_contains_sector(m, p))))):
+                m = p
+                tan_min = tan
+        p = p.next
+        if p is stop:
+            break
+    return m
+
+def _sector_contains_sector(m, p):
+    return (_area(m.prev, m, p.prev) < 0.0) and (_area(p.next, m, m.next) < 0.0)
+
+def _get_leftmost(start):
+    p = start
+    leftmost = start
+    while True:
+        if (p.x < leftmost.x) or ((p.x == leftmost.x) and (p.y < leftmost.y)):
+            leftmost = p
+        p = p.next
+        if p is start:
+            break
+    return leftmost
+
+def _point_in_triangle(ax, ay, bx, by, cx, cy, px, py):
+    return ((cx - px) * (ay - py) >= (ax - px) * (cy - py)) and \
+        ((ax - px) * (by - py) >= (bx - px) * (ay - py)) and \
+        ((bx - px) * (cy - py) >= (cx - px) * (by - py))
+
+def _is_valid_diagonal(a, b):
+    if (a.next.i == b.i) or (a.prev.i == b.i) or _intersects_polygon(a, b):
+        return False
+    if _locally_inside(a, b) and _locally_inside(b, a) and _middle_inside(a, b) and \
+        ((_area(a.prev, a, b.prev) != 0.0) or (_area(a, b.prev, b) != 0.0)):
+        return True
+    return _equals(a, b) and (_area(a.prev, a, a.next) > 0.0) and (_area(b.prev, b, b.next) > 0.0)
+
+def _area(p, q, r):
+    return (q.y - p.y) * (r.x - q.x) - (q.x - p.x) * (r.y - q.y)
+
+def _equals(p1, p2):
+    return (p1.x == p2.x) and (p1.y == p2.y)
+
+def _sign(v):
+    return (v > 0.0) - (v < 0.0)
+
+def _intersects(p1, q1, p2, q2):
+    o1 = _sign(_area(p1, q1, p2))
+    o2 = _sign(_area(p1, q1, q2))
+    o3 = _sign(_area(p2, q2, p1))
+    o4 = _sign(_area(p2, q2, q1))
+    if (o1 != o2) and (o3 != o4):
+        return True
+    return ((o1 == 0) and _on_segment(p1, p2, q1)) or ((o2 == 0) and _on_segment(p1, q2, q1)) or \
+        ((o3 == 0) and _on_segment(p2, p1, q2)) or ((o4 == 0) and _on_segment(p2, q1, q2))
+
+def _on_segment(p, q, r):
+    return (min(p.x, r.x) <= q.x <= max(p.x, r.x)) and (min(p.y, r.y) <= q.y <= max(p.y, r.y))
+
+def _intersects_polygon(a, b):
+    p = a
+    while True:
+        if (p.i != a.i) and (p.next.i != a.i) and (p.i != b.i) and (p.next.i != b.i) and \
+            _intersects(p, p.next, a, b):
+            return True
+        p = p.next
+        if p is a:
+            return False
+
+def _locally_inside(a, b):
+    if _area(a.prev, a, a.next) < 0.0:
+        return (_area(a, b, a.next) >= 0.0) and (_area(a, a.prev, b) >= 0.0)
+    return (_area(a, b, a.prev) < 0.0) or (_area(a, a.next, b) < 0.0)
+
+def _middle_inside(a, b):
+    p = a
+    inside = False
+    px = (a.x + b.x) / 2
+    py = (a.y + b.y) / 2
+    while True:
+        if ((p.y > py) != (p.next.y > py)) and (p.next.y != p.y) and \
+            (px < (p.next.x - p.x) * (py - p.y) / (p.next.y - p.y) + p.x):
+            inside = not inside
+        p = p.next
+        if p is a:
+            return inside
+
+def _split_polygon(a, b):
+    """Connect a and b with a diagonal, return the copy of b in the new ring."""
+    a2 = _Node(a.i, a.x, a.y, a.z)
+    b2 = _Node(b.i, b.x, b.y, b.z)
+    an = a.next
+    bp = b.prev
+    a.next = b
+    b.prev = a
+    a2.next = an
+    an.prev = a2
+    b2.next = a2
+    a2.prev = b2
+    bp.next = b2
+    b2.prev = bp
+    return b2
+
+def _insert_node(i, x, y, z, last):
+    p = _Node(i, x, y, z)
+    if last == None:
+        p.prev = p
+        p.next = p
+    else:
+        p.next = last.next
+        p.prev = last
+        last.next.prev = p
+        last.next = p
+    return p
+
+def _remove_node(p):
+    p.next.prev = p.prev
+    p.prev.next = p.next
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright © 2022 Jonny Normann Skålvik
+
+Permission is hereby granted, free of charge, to any person obtaining a copy 
+of this software and associated documentation files (the “Software”), to deal 
+in the Software without restriction, including without limitation the rights 
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell 
+copies of the Software, and to permit persons to whom the Software is 
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in 
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE 
+SOFTWARE.
+
+This file is part of SosiImporter, an addon to import SOSI files containing
+3D model data into Blender.
+"""
+
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+from sosi_files_importer import sosi_settings as soset
+
+# Tests of the modules that do not need Blender, run from the repository
+# root: python -m pytest tests
+
+SOSI_HEAD = '''.HODE
+..TEGNSETT UTF-8
+..TRANSPAR
+...KOORDSYS 22
+...ORIGO-NØ 0 0
+...ENHET {enhet}
+'''
+
+@pytest.fixture
+def write_sosi(tmp_path):
+    """Write a SOSI file from its elements text, return the path."""
+    def write(body, enhet = '0.01', name = 'test.sos'):
+        path = tmp_path / name
+        path.write_text(SOSI_HEAD.format(enhet=enhet) + body + '.SLUTT\n', encoding='utf-8')
+        return str(path)
+    return write
+
+@pytest.fixture(autouse=True)
+def no_cache(monkeypatch, tmp_path):
+    """No cache or index files outside the test directory."""
+    monkeypatch.setattr(soset, 'SOSI_CACHE_ENABLED', False)
+    monkeypatch.setattr(soset, 'SOSI_CACHE_DIR', str(tmp_path / 'cache'))
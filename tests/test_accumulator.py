@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright © 2022 Jonny Normann Skålvik
+
+Permission is hereby granted, free of charge, to any person obtaining a copy 
+of this software and associated documentation files (the “Software”), to deal 
+in the Software without restriction, including without limitation the rights 
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell 
+copies of the Software, and to permit persons to whom the Software is 
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in 
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE 
+SOFTWARE.
+
+This file is part of SosiImporter, an addon to import SOSI files containing
+3D model data into Blender.
+"""
+
+import numpy as np
+from sosi_files_importer import sosi_settings as soset
+from sosi_files_importer import sosi_datahelper as sodhlp
+from sosi_files_importer import sosi_parser as sopars
+from sosi_files_importer import sosi_accumulator as soacc
+from sosi_files_importer import sosi_pipeline as sopipe
+from sosi_files_importer import sosi_spatial as sospat
+
+# -----------------------------------------------------------------------------
+
+# Curves in mm far (some 30 and 80 km) from the reference: float32 vertices
+# relative to it are coarser than the units
+FAR_CURVES = '''.KURVE 1:
+..OBJTYPE Grense
+..NØ
+6635218001 579843001
+6635218101 579843101
+.KURVE 2:
+..OBJTYPE Grense
+..NØ
+6635218101 579843101
+6635218102 579843101
+6635218201 579843201
+'''
+
+def test_weld_mm_units_far_from_reference(write_sosi, monkeypatch):
+    monkeypatch.setattr(soset, 'SOSI_WELD_VERTICES', True)
+    filename = write_sosi(FAR_CURVES, enhet='0.001')
+    meshes, narcs, narc_pts = sopipe.build_file_meshes(filename, 500000.0, 6600000.0)
+    assert len(meshes) == 1
+    md = meshes[0][1]
+    # Only the shared end point is merged, the point 1 mm away is kept
+    assert md.nwelded == 1
+    assert len(md.vertices()) == 4
+    assert md.edges().tolist() == [[0, 1], [1, 2], [2, 3]]
+
+def test_weld_off_keeps_vertices(write_sosi):
+    filename = write_sosi(FAR_CURVES, enhet='0.001')
+    md = sopipe.build_file_meshes(filename, 500000.0, 6600000.0)[0][0][1]
+    assert md.nwelded == 0
+    assert len(md.vertices()) == 5
+
+# A curve and an arc sharing the integer end point 663521000 57981000
+CURVE_AND_ARC = '''.KURVE 1:
+..OBJTYPE Veikant
+..NØ
+663520000 57980000
+663521000 57981000
+.BUEP 2:
+..OBJTYPE Veikant
+..NØ
+663521000 57981000
+663522000 57982000
+663521000 57983000
+'''
+
+def test_weld_arc_end_by_integer_coordinates(write_sosi, monkeypatch):
+    monkeypatch.setattr(soset, 'SOSI_CACHE_ENABLED', True)
+    filename = write_sosi(CURVE_AND_ARC)
+    for i in range(2):   # Parsed, then from the cache
+        md = sopipe.build_file_meshes(filename, 579800.0, 6635200.0, weld=True)[0][0][1]
+        assert md.nwelded == 1
+        edges = md.edges()
+        # The curve end and the arc start are one vertex
+        assert edges[0, 1] == edges[1, 0]
+
+def test_weld_parameter_overrides_setting(write_sosi):
+    filenames = [write_sosi(FAR_CURVES, enhet='0.001', name=name) for name in ('a.sos', 'b.sos')]
+    md = sopipe.build_file_meshes(filenames[0], 500000.0, 6600000.0, weld=True)[0][0][1]
+    assert md.nwelded == 1
+    for filename, result, narcs, narc_pts in sopipe.build_files_parallel(filenames, 500000.0, 6600000.0,
+        processes=2, weld=True):
+        try:
+            assert [md.nwelded for key, md in result.meshes()] == [1]
+        finally:
+            result.release()
+    assert not soset.SOSI_WELD_VERTICES
+
+# -----------------------------------------------------------------------------
+
+MIXED = '''.PUNKT 1:
+..OBJTYPE Tre
+..HØYDE 12.5
+..NØ
+663521806 57984371
+.PUNKT 2:
+..OBJTYPE Tre
+..NØ
+663521906 57984471
+.KURVE 3:
+..OBJTYPE Grense
+..NØ
+663520000 57980000
+663520000 57990000
+663530000 57990000
+663530000 57980000
+663520000 57980000
+.BUEP 4:
+..OBJTYPE Grense
+..NØ
+663520000 57980000
+663519000 57985000
+663520000 57990000
+.KURVE 5:
+..OBJTYPE Grense
+..NØ
+663522000 57982000
+663522000 57984000
+663524000 57984000
+663524000 57982000
+663522000 57982000
+.FLATE 6:
+..OBJTYPE Teig
+..REF :3 (-:5)
+..NØ
+663521000 57981000
+'''
+
+MESH_ARRAYS = ['vertices', 'edges', 'loops', 'loop_totals', 'element_attrs', 'element_counts']
+
+def build_meshes(add):
+    meshes = []
+    acc = soacc.MeshAccumulator(lambda key, md: meshes.append((key, md)), 1 << 40)
+    add(acc)
+    acc.flush()
+    return meshes
+
+def test_chunks_match_elements(write_sosi):
+    filename = write_sosi(MIXED)
+    ref_e, ref_n = 579800.0, 6635200.0
+    elems = list(sopipe.load_elements(filename, ref_e, ref_n))
+
+    def add_elements(acc):
+        for elem in elems:
+            acc.add_element(elem.id, sospat.element_key(elem, ref_e, ref_n, 20.0),
+                sodhlp.coords_to_3D(elem.coords),
+                sodhlp.element_attrs(elem.objrefnum, elem.objname, elem.hoyde, elem.sosires, elem.retning),
+                elem.holes)
+
+    def add_chunks(acc):
+        for table in sopars.iter_element_chunks(elems, elems[0].filename, 2):
+            keys, key_ids = sospat.table_keys(table, ref_e, ref_n, 20.0)
+            acc.add_table(table, keys, key_ids)
+
+    one = build_meshes(add_elements)
+    chunked = build_meshes(add_chunks)
+    assert [key for key, md in one] == [key for key, md in chunked]
+    for (key, md1), (key, md2) in zip(one, chunked):
+        assert md1.nelements == md2.nelements
+        for name in MESH_ARRAYS:
+            # Bytes, as the attributes have NaN heights
+            assert getattr(md1, name)().tobytes() == getattr(md2, name)().tobytes(), (key, name)
+
+def test_buep_without_three_points_is_a_curve():
+    md = soacc.MeshData()
+    md.add_arc(np.array([[0.0, 0.0, 0.0], [10.0, 0.0, 0.0]]))
+    md.add_arc(np.array([[0.0, 0.0, 0.0], [5.0, 5.0, 0.0], [10.0, 0.0, 0.0]]))
+    md.add_arc(np.array([[0.0, 0.0, 0.0], [1.0, 1.0, 0.0], [2.0, 1.0, 0.0], [3.0, 0.0, 0.0]]))
+    narcs, npts = md.tessellate_arcs()
+    assert narcs == 1
+    assert md.nelements == 3
+    assert md.nverts == 2 + 4 + npts
+    # The polylines keep their points and segments
+    assert md.edges()[:4].tolist() == [[0, 1], [2, 3], [3, 4], [4, 5]]
+    assert md.element_counts().tolist() == [2, 4, npts]
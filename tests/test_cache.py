@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright © 2022 Jonny Normann Skålvik
+
+Permission is hereby granted, free of charge, to any person obtaining a copy 
+of this software and associated documentation files (the “Software”), to deal 
+in the Software without restriction, including without limitation the rights 
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell 
+copies of the Software, and to permit persons to whom the Software is 
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in 
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE 
+SOFTWARE.
+
+This file is part of SosiImporter, an addon to import SOSI files containing
+3D model data into Blender.
+"""
+
+import os
+from sosi_files_importer import sosi_settings as soset
+from sosi_files_importer import sosi_cache as socache
+from sosi_files_importer import sosi_index as soidx
+from sosi_files_importer import sosi_parser as sopars
+
+# -----------------------------------------------------------------------------
+
+REF_E = 579800.0
+REF_N = 6635200.0
+
+ELEMENTS = '''.PUNKT 1:
+..OBJTYPE Tre
+..NØ
+663551806 57994371
+.KURVE 2:
+..OBJTYPE Grense
+..NØ
+663520000 57980000
+663520000 57990000
+663530000 57990000
+.BUEP 3:
+..OBJTYPE Veikant
+..NØ
+663520000 57980000
+663521000 57981000
+663520000 57982000
+.FLATE 4:
+..OBJTYPE Teig
+..REF :2
+..NØ
+663521000 57981000
+'''
+
+def refnums(elements):
+    return sorted(e.objrefnum for e in elements)
+
+def test_filtered_cache_miss_and_hit(write_sosi, monkeypatch):
+    monkeypatch.setattr(soset, 'SOSI_CACHE_ENABLED', True)
+    filename = write_sosi(ELEMENTS)
+    elem_filter = sopars.ElementFilter(objtypes=['Veikant', 'Teig'])
+    socache.reset_stats()
+    assert refnums(socache.load_or_parse(filename, REF_E, REF_N, elem_filter)) == [3, 4]
+    assert refnums(socache.load_or_parse(filename, REF_E, REF_N, elem_filter)) == [3, 4]
+    # The whole file is stored, and the filter selects rows of it
+    assert refnums(socache.load_or_parse(filename, REF_E, REF_N)) == [1, 2, 3, 4]
+    assert socache.stats == {'hits' : 2, 'misses' : 1}
+    table = sopars.ElementTable.load(os.path.join(socache.cache_dir(),
+        socache.cache_key(filename, REF_E, REF_N) + '.npz'))
+    selected = soidx.select_table(soidx.load_or_build_index(filename), table, elem_filter)
+    assert sorted(selected.records['refnum'].tolist()) == [3, 4]
+
+def test_evict_keeps_indexes(write_sosi, monkeypatch):
+    monkeypatch.setattr(soset, 'SOSI_CACHE_ENABLED', True)
+    filename = write_sosi(ELEMENTS)
+    list(socache.load_or_parse(filename, REF_E, REF_N, sopars.ElementFilter(objtypes=['Tre'])))
+    assert os.path.isfile(soidx.index_path(filename))
+    socache.evict(0)
+    assert os.path.isfile(soidx.index_path(filename))
+    assert [name for name in os.listdir(socache.cache_dir()) if socache.is_cache_file(name)] == []
+
+def test_window_selects_cached_rows(write_sosi, monkeypatch):
+    monkeypatch.setattr(soset, 'SOSI_CACHE_ENABLED', True)
+    filename = write_sosi(ELEMENTS)
+    # Around the PUNKT only
+    elem_filter = sopars.ElementFilter(bbox=(REF_E + 143.0, REF_N + 318.0, REF_E + 144.0, REF_N + 319.0))
+    table = sopars.ElementTable.from_elements('test.sos', sopars.iter_sosi_elements(filename, REF_E, REF_N))
+    selected = soidx.select_table(soidx.load_or_build_index(filename), table, elem_filter)
+    assert selected.records['refnum'].tolist() == [1]
+    for i in range(2):   # Miss, then hit
+        assert refnums(socache.load_or_parse(filename, REF_E, REF_N, elem_filter)) == [1]
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright © 2022 Jonny Normann Skålvik
+
+Permission is hereby granted, free of charge, to any person obtaining a copy 
+of this software and associated documentation files (the “Software”), to deal 
+in the Software without restriction, including without limitation the rights 
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell 
+copies of the Software, and to permit persons to whom the Software is 
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in 
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE 
+SOFTWARE.
+
+This file is part of SosiImporter, an addon to import SOSI files containing
+3D model data into Blender.
+"""
+
+import os
+from sosi_files_importer import convert
+
+# -----------------------------------------------------------------------------
+
+def test_recursive_outputs_keep_subdirectories(write_sosi, tmp_path):
+    for sub in ('a', 'b'):
+        os.makedirs(tmp_path / 'in' / sub)
+        write_sosi('', name=os.path.join('in', sub, 'x.sos'))
+    filenames = convert.find_sosi_files([str(tmp_path / 'in')], True)
+    assert [rel for filename, rel in filenames] == [os.path.join('a', 'x.sos'), os.path.join('b', 'x.sos')]
+    out = str(tmp_path / 'out')
+    assert convert.output_paths(filenames, out, '.glb') == [os.path.join(out, 'a', 'x.glb'),
+        os.path.join(out, 'b', 'x.glb')]
+    # The same base name from two inputs is refused
+    flat = [(filename, os.path.basename(filename)) for filename, rel in filenames]
+    assert convert.output_paths(flat, out, '.glb') == None
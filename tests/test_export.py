@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright © 2022 Jonny Normann Skålvik
+
+Permission is hereby granted, free of charge, to any person obtaining a copy 
+of this software and associated documentation files (the “Software”), to deal 
+in the Software without restriction, including without limitation the rights 
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell 
+copies of the Software, and to permit persons to whom the Software is 
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in 
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE 
+SOFTWARE.
+
+This file is part of SosiImporter, an addon to import SOSI files containing
+3D model data into Blender.
+"""
+
+import json
+import struct
+import numpy as np
+from sosi_files_importer import sosi_export as soexp
+from sosi_files_importer import sosi_pipeline as sopipe
+
+# -----------------------------------------------------------------------------
+
+ELEMENTS = '''.PUNKT 1:
+..OBJTYPE Tre
+..NØ
+663521806 57984371
+.KURVE 2:
+..OBJTYPE Grense
+..NØ
+663520000 57980000
+663520000 57990000
+663530000 57990000
+663530000 57980000
+663520000 57980000
+.KURVE 3:
+..OBJTYPE Grense
+..NØ
+663522000 57982000
+663522000 57984000
+663524000 57984000
+663524000 57982000
+663522000 57982000
+.FLATE 4:
+..OBJTYPE Teig
+..REF :2 (-:3)
+..NØ
+663521000 57981000
+'''
+
+REF_E = 579800.0
+REF_N = 6635200.0
+
+def export(write_sosi, tmp_path, fmt):
+    meshes = sopipe.build_file_meshes(write_sosi(ELEMENTS), REF_E, REF_N)[0]
+    path = str(tmp_path / ('out' + soexp.WRITERS[fmt].extension))
+    writer = soexp.WRITERS[fmt](path, REF_E, REF_N)
+    for (coll_name, objname, objtype), md in meshes:
+        writer.write_mesh(objname, md)
+    writer.close()
+    return path
+
+def read_glb(path):
+    """The JSON and the binary chunk of a GLB file."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version, total = struct.unpack_from('<4sII', data, 0)
+    assert (magic, version, total) == (b'glTF', 2, len(data))
+    js_len = struct.unpack_from('<I', data, 12)[0]
+    gltf = json.loads(data[20:20 + js_len])
+    return gltf, data[28 + js_len:]
+
+def test_obj(write_sosi, tmp_path):
+    with open(export(write_sosi, tmp_path, 'obj')) as f:
+        lines = f.read().splitlines()
+    kinds = [line.split(' ')[0] for line in lines]
+    assert [line for line in lines if line.startswith('o ')] == ['o Tre', 'o Grense', 'o Teig']
+    # Tre: 1 point, Grense: 2 x 4 edges, Teig: 8 triangles around the hole
+    assert kinds.count('p') == 1
+    assert kinds.count('l') == 8
+    assert kinds.count('f') == 8
+    assert kinds.count('v') == 1 + 10 + 8
+
+def test_ply(write_sosi, tmp_path):
+    with open(export(write_sosi, tmp_path, 'ply'), 'rb') as f:
+        data = f.read()
+    head, body = data.split(b'end_header\n')
+    head = head.decode('ascii').splitlines()
+    assert 'element vertex 19' in head
+    assert 'element edge 8' in head
+    assert 'element face 8' in head
+    assert len(body) == 19 * 12 + 8 * 8 + 8 * 16
+
+def test_glb(write_sosi, tmp_path):
+    gltf, buf = read_glb(export(write_sosi, tmp_path, 'glb'))
+    assert [mesh['name'] for mesh in gltf['meshes']] == ['Tre', 'Grense', 'Teig']
+    assert [[p['mode'] for p in mesh['primitives']] for mesh in gltf['meshes']] == [[0], [1], [4]]
+    assert len(buf) == gltf['buffers'][0]['byteLength']
+    # Triangle indices are within the vertices of their mesh
+    teig = gltf['meshes'][2]['primitives'][0]
+    position = gltf['accessors'][teig['attributes']['POSITION']]
+    indices = gltf['accessors'][teig['indices']]
+    view = gltf['bufferViews'][indices['bufferView']]
+    values = np.frombuffer(buf, '<u4', indices['count'], view['byteOffset'])
+    assert values.max() < position['count'] == 8
+
+# A point and a curve of the same OBJTYPE end up in one mesh
+MIXED = '''.PUNKT 1:
+..OBJTYPE Grense
+..NØ
+663521806 57984371
+.KURVE 2:
+..OBJTYPE Grense
+..NØ
+663520000 57980000
+663520000 57990000
+663530000 57990000
+'''
+
+def test_loose_points_in_mixed_mesh(write_sosi, tmp_path):
+    meshes = sopipe.build_file_meshes(write_sosi(MIXED), REF_E, REF_N)[0]
+    assert len(meshes) == 1
+    path = str(tmp_path / 'mixed.glb')
+    writer = soexp.GlbWriter(path, REF_E, REF_N)
+    writer.write_mesh('Grense', meshes[0][1])
+    writer.close()
+    gltf, buf = read_glb(path)
+    prims = gltf['meshes'][0]['primitives']
+    assert [p['mode'] for p in prims] == [1, 0]
+    indices = gltf['accessors'][prims[1]['indices']]
+    view = gltf['bufferViews'][indices['bufferView']]
+    assert np.frombuffer(buf, '<u4', indices['count'], view['byteOffset']).tolist() == [0]
+
+    path = str(tmp_path / 'mixed.obj')
+    writer = soexp.ObjWriter(path, REF_E, REF_N)
+    writer.write_mesh('Grense', meshes[0][1])
+    writer.close()
+    with open(path) as f:
+        lines = f.read().splitlines()
+    assert [line for line in lines if line[0] in 'lp'] == ['l 2 3', 'l 3 4', 'p 1']
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright © 2022 Jonny Normann Skålvik
+
+Permission is hereby granted, free of charge, to any person obtaining a copy 
+of this software and associated documentation files (the “Software”), to deal 
+in the Software without restriction, including without limitation the rights 
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell 
+copies of the Software, and to permit persons to whom the Software is 
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in 
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE 
+SOFTWARE.
+
+This file is part of SosiImporter, an addon to import SOSI files containing
+3D model data into Blender.
+"""
+
+import numpy as np
+from sosi_files_importer import sosi_geom_helper as sogeohlp
+
+# -----------------------------------------------------------------------------
+
+def random_arcs(narcs, seed = 0):
+    """Random BUEP point triples, a third of them horizontal."""
+    rng = np.random.default_rng(seed)
+    arcs = rng.uniform(-100.0, 100.0, (narcs, 3, 3))
+    arcs[:narcs // 3, :, 2] = rng.uniform(-10.0, 10.0, (narcs // 3, 1))
+    return arcs
+
+def circle_centres(arcs):
+    """Centres of the circles through the point triples arcs (N, 3, 3)."""
+    a = arcs[:, 0] - arcs[:, 2]
+    b = arcs[:, 1] - arcs[:, 2]
+    axb = np.cross(a, b)
+    num = np.cross((a * a).sum(axis=1)[:, None] * b - (b * b).sum(axis=1)[:, None] * a, axb)
+    return arcs[:, 2] + num / (2 * (axb * axb).sum(axis=1))[:, None]
+
+def test_arc_batch_matches_single():
+    arcs = random_arcs(200)
+    for num_splits in (0, 1, 8):
+        pts, offsets = sogeohlp.arcs_pts_segments_3D(arcs, num_splits)
+        for i, arc in enumerate(arcs):
+            ref = np.asarray(sogeohlp.arc_pts_segments_3D(arc, num_splits))
+            assert np.abs(ref - pts[offsets[i]:offsets[i + 1]]).max() < 1e-9
+
+def test_arc_chord_deviation():
+    arcs = random_arcs(200, 1)
+    centres = circle_centres(arcs)
+    radius = np.linalg.norm(arcs[:, 0] - centres, axis=1)
+    for tol in (0.5, 0.01):
+        pts, offsets = sogeohlp.arcs_pts_chord_3D(arcs, tol)
+        for i in range(len(arcs)):
+            arc_pts = pts[offsets[i]:offsets[i + 1]]
+            # The given points kept, all points on the circle
+            assert np.array_equal(arc_pts[0], arcs[i, 0])
+            assert np.array_equal(arc_pts[-1], arcs[i, 2])
+            assert np.allclose(np.linalg.norm(arc_pts - centres[i], axis=1), radius[i])
+            # Chord midpoints at most tol inside the circle
+            mid = (arc_pts[:-1] + arc_pts[1:]) * 0.5
+            dev = radius[i] - np.linalg.norm(mid - centres[i], axis=1)
+            assert dev.max() <= tol * (1 + 1e-9)
+
+def test_arc_collinear_kept():
+    arcs = np.array([[[0.0, 0.0, 0.0], [1.0, 1.0, 0.0], [2.0, 2.0, 0.0]]])
+    pts, offsets = sogeohlp.arcs_pts_segments_3D(arcs, 8)
+    assert offsets.tolist() == [0, 3]
+    assert np.array_equal(pts, arcs[0])
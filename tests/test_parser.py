@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright © 2022 Jonny Normann Skålvik
+
+Permission is hereby granted, free of charge, to any person obtaining a copy 
+of this software and associated documentation files (the “Software”), to deal 
+in the Software without restriction, including without limitation the rights 
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell 
+copies of the Software, and to permit persons to whom the Software is 
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in 
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE 
+SOFTWARE.
+
+This file is part of SosiImporter, an addon to import SOSI files containing
+3D model data into Blender.
+"""
+
+import ctypes
+import pytest
+import numpy as np
+from sosi_files_importer import sosi_datahelper as sodhlp
+from sosi_files_importer import sosi_geom_helper as sogeohlp
+from sosi_files_importer import sosi_parser as sopars
+from sosi_files_importer import sosi_pipeline as sopipe
+
+# -----------------------------------------------------------------------------
+
+REF_E = 579800.0
+REF_N = 6635200.0
+
+ELEMENTS = '''.PUNKT 1:
+..OBJTYPE Tre
+..HØYDE 12.5
+..RETNING 100
+..NØ
+663521806 57984371
+.KURVE 2:
+..OBJTYPE Veikant
+..NØH
+663521000 57980000 100
+663522000 57981000 250
+.KURVE 3:
+..OBJTYPE Grense
+..NØ
+663520000 57980000
+663520000 57990000
+663530000 57990000
+663530000 57980000
+663520000 57980000
+.KURVE 4:
+..OBJTYPE Grense
+..NØ
+663522000 57982000
+663522000 57984000
+663524000 57984000
+663524000 57982000
+663522000 57982000
+.FLATE 5:
+..OBJTYPE Teig
+..REF :3 (-:4)
+..NØ
+663521000 57981000
+'''
+
+def test_coord_buffer_is_a_view():
+    values = np.arange(6, dtype=np.float64)
+    buf = (ctypes.c_double * 6)(*values)
+    pcoord_ary = ctypes.cast(buf, ctypes.POINTER(ctypes.c_double))
+    a = sodhlp.coord_buffer_to_array(pcoord_ary, 2, 3)
+    assert a.shape == (3, 2)
+    assert np.array_equal(a.ravel(), values)
+    buf[5] = 42.0
+    assert a[2, 1] == 42.0
+    pts = sodhlp.coords_to_3D(a)
+    assert pts.shape == (3, 3)
+    assert np.array_equal(pts[:, :2], a)
+    assert not np.any(pts[:, 2])
+
+def test_parse_elements(write_sosi):
+    filename = write_sosi(ELEMENTS)
+    elems = list(sopipe.load_elements(filename, REF_E, REF_N))
+    assert [(e.id, e.objrefnum, e.objname) for e in elems] == [
+        (sodhlp.SosiObjId.PUNKT.value, 1, 'Tre'),
+        (sodhlp.SosiObjId.KURVE.value, 2, 'Veikant'),
+        (sodhlp.SosiObjId.KURVE.value, 3, 'Grense'),
+        (sodhlp.SosiObjId.KURVE.value, 4, 'Grense'),
+        (sodhlp.SosiObjId.FLATE.value, 5, 'Teig')]
+    # The base name of the file, see sosi_parser.source_name()
+    assert {e.filename for e in elems} == {'test.sos'}
+    punkt, kurve = elems[0], elems[1]
+    # Coordinates relative to the reference, easting first
+    # ..HØYDE gives the z of elements without per point heights
+    assert np.allclose(punkt.coords, [[43.71, 18.06, 12.5]])
+    assert punkt.hoyde == 12.5
+    assert punkt.retning == 100.0
+    assert kurve.ndims == 3
+    assert np.allclose(kurve.coords, [[0.0, 10.0, 1.0], [10.0, 20.0, 2.5]])
+
+def test_flate_with_hole(write_sosi):
+    filename = write_sosi(ELEMENTS)
+    flate = list(sopipe.load_elements(filename, REF_E, REF_N))[-1]
+    assert flate.sosires == 0
+    assert flate.holes.tolist() == [4]
+    outer = flate.coords[:4]
+    hole = flate.coords[4:]
+    assert len(hole) == 4
+    # Closing points dropped, outer ring counter clockwise and hole clockwise
+    assert sogeohlp.polygon_area_2D(outer) == 10000.0
+    assert sogeohlp.polygon_area_2D(hole) == -400.0
+    tris = sogeohlp.triangulate_polygon_2D(flate.coords, flate.holes)
+    areas = [sogeohlp.polygon_area_2D(flate.coords[t]) for t in tris]
+    assert min(areas) > 0.0
+    assert np.isclose(sum(areas), 9600.0)
+
+def test_flate_filter_keeps_referenced_curves(write_sosi):
+    filename = write_sosi(ELEMENTS)
+    elem_filter = sopars.ElementFilter(objtypes=['Teig'])
+    elems = list(sopipe.load_elements(filename, REF_E, REF_N, elem_filter))
+    assert [e.objrefnum for e in elems] == [5]
+    assert elems[0].holes.tolist() == [4]
+
+def test_table_chunks_match_elements(write_sosi):
+    filename = write_sosi(ELEMENTS)
+    elems = list(sopipe.load_elements(filename, REF_E, REF_N))
+    chunked = [e for table in sopars.iter_element_chunks(elems, elems[0].filename, 2)
+        for e in table.elements()]
+    assert len(chunked) == len(elems)
+    for a, b in zip(elems, chunked):
+        assert a._replace(coords=None, holes=None, grid=None) == b._replace(coords=None, holes=None, grid=None)
+        assert np.array_equal(a.coords, b.coords)
+        assert np.array_equal(a.grid, b.grid)
+        assert (a.holes is None) == (b.holes is None)
+
+def test_coord_comments_and_bad_values(write_sosi, caplog):
+    body = '''.KURVE 1:
+..OBJTYPE Veikant
+..NØ 663520000 57980000 ! Start
+663521000 57981000 !663529999 57989999
+.KURVE 2:
+..OBJTYPE Veikant
+..NØ
+663520000 5798x000
+.KURVE 3:
+..OBJTYPE Veikant
+..NØ
+663520000 57980000 663521000
+'''
+    filename = write_sosi(body)
+    elems = list(sopipe.load_elements(filename, REF_E, REF_N))
+    assert [e.objrefnum for e in elems] == [1]
+    assert np.allclose(elems[0].coords, [[0.0, 0.0], [10.0, 10.0]])
+    assert 'KURVE 2 skipped' in caplog.text
+    assert 'KURVE 3 skipped' in caplog.text
+    with pytest.raises(ValueError):
+        sopars.decode_coord_block(b'1 2 3', False, None, sopars.SosiHeader(), 0.0, 0.0)
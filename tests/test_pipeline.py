@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright © 2022 Jonny Normann Skålvik
+
+Permission is hereby granted, free of charge, to any person obtaining a copy 
+of this software and associated documentation files (the “Software”), to deal 
+in the Software without restriction, including without limitation the rights 
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell 
+copies of the Software, and to permit persons to whom the Software is 
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in 
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE 
+SOFTWARE.
+
+This file is part of SosiImporter, an addon to import SOSI files containing
+3D model data into Blender.
+"""
+
+import numpy as np
+from sosi_files_importer import sosi_log_helper as sologhlp
+from sosi_files_importer import sosi_pipeline as sopipe
+
+# -----------------------------------------------------------------------------
+
+ELEMENTS = '''.PUNKT 1:
+..OBJTYPE Tre
+..NØ
+663521806 57984371
+.KURVE 2:
+..OBJTYPE Grense
+..NØ
+663520000 57980000
+663520000 57990000
+663530000 57990000
+.FLATE 3:
+..OBJTYPE Teig
+..REF :2
+..NØ
+663521000 57981000
+'''
+
+def test_parallel_element_counts(write_sosi):
+    filenames = [write_sosi(ELEMENTS, name='a.sos'), write_sosi(ELEMENTS, name='b.sos')]
+    expected = sologhlp.ElementLog()
+    for filename in filenames:
+        sopipe.build_file_meshes(filename, 579800.0, 6635200.0, element_log=expected)
+    element_log = sologhlp.ElementLog()
+    for filename, result, narcs, narc_pts in sopipe.build_files_parallel(filenames, 579800.0, 6635200.0,
+        processes=2, element_log=element_log):
+        result.release()
+    assert element_log.kinds == {'PUNKT' : [2, 2], 'KURVE' : [2, 6], 'FLATE' : [2, 6]}
+    assert element_log.kinds == expected.kinds
+    assert element_log.flags == expected.flags
+    assert element_log.nelements == 6
+
+def test_packed_meshes_outlive_release(write_sosi):
+    filename = write_sosi(ELEMENTS)
+    meshes, narcs, narc_pts = sopipe.build_file_meshes(filename, 579800.0, 6635200.0)
+    packed = sopipe.PackedMeshes(*sopipe.pack_meshes(meshes))
+    unpacked = list(packed.meshes())
+    packed.release()
+    assert [key for key, md in unpacked] == [key for key, md in meshes]
+    for (key, a), (key, b) in zip(meshes, unpacked):
+        assert np.array_equal(a.vertices(), b.vertices())
+        assert np.array_equal(a.loops(), b.loops())
+
+def test_parallel_poll_yields_results_in_order(write_sosi):
+    filenames = [write_sosi(ELEMENTS, name=name) for name in ('a.sos', 'b.sos', 'c.sos')]
+    done = []
+    for item in sopipe.build_files_parallel(filenames, 579800.0, 6635200.0, processes=2, poll_seconds=0.001):
+        if item != None:
+            filename, result, narcs, narc_pts = item
+            result.release()
+            done.append(filename)
+    assert done == filenames
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright © 2022 Jonny Normann Skålvik
+
+Permission is hereby granted, free of charge, to any person obtaining a copy 
+of this software and associated documentation files (the “Software”), to deal 
+in the Software without restriction, including without limitation the rights 
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell 
+copies of the Software, and to permit persons to whom the Software is 
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in 
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE 
+SOFTWARE.
+
+This file is part of SosiImporter, an addon to import SOSI files containing
+3D model data into Blender.
+"""
+
+import numpy as np
+from sosi_files_importer import sosi_datahelper as sodhlp
+from sosi_files_importer import sosi_parser as sopars
+from sosi_files_importer import sosi_spatial as sospat
+
+# -----------------------------------------------------------------------------
+
+def test_grid_query_matches_brute_force():
+    rng = np.random.default_rng(0)
+    lo = rng.uniform(0.0, 1000.0, (500, 2))
+    extents = np.column_stack((lo, lo + rng.uniform(0.0, 50.0, (500, 2))))
+    extents[:5] = np.nan      # Elements without extents
+    extents[5] = (0.0, 0.0, 1000.0, 1000.0)
+    grid = sospat.SpatialGrid(extents)
+    for bbox in ((100.0, 100.0, 200.0, 300.0), (-10.0, -10.0, 0.0, 0.0), (990.0, 0.0, 2000.0, 2000.0)):
+        inside = ~((extents[:, 2] < bbox[0]) | (extents[:, 0] > bbox[2]) | \
+            (extents[:, 3] < bbox[1]) | (extents[:, 1] > bbox[3]))
+        expected = np.union1d(np.nonzero(inside)[0], np.arange(5))
+        assert np.array_equal(grid.query(bbox), expected)
+
+def test_table_keys_match_element_key():
+    rng = np.random.default_rng(1)
+    builder = sopars.ElementTableBuilder('test.sos')
+    for i in range(50):
+        npts = int(rng.integers(0, 4))
+        coords = rng.uniform(-100.0, 100.0, (npts, 2))
+        builder.add(sodhlp.SosiObjId.KURVE.value, i, 0, ('Veikant', 'Grense', 'Tre')[i % 3], 2, coords)
+    table = builder.table()
+    elems = list(table.elements())
+    for tile_size in (0.0, 30.0):
+        keys, key_ids = sospat.table_keys(table, 1000.0, 2000.0, tile_size)
+        assert [keys[k] for k in key_ids] == [sospat.element_key(e, 1000.0, 2000.0, tile_size) for e in elems]
+        # The OBJTYPE also for tiled object names
+        assert [keys[k][2] for k in key_ids] == [e.objname for e in elems]
+
+def test_clip_flate_drops_outside_hole():
+    outer = [[0.0, 0.0], [10.0, 0.0], [10.0, 10.0], [0.0, 10.0]]
+    hole = [[7.0, 7.0], [7.0, 9.0], [9.0, 9.0], [9.0, 7.0]]
+    elem = sopars.SosiElement(sodhlp.SosiObjId.FLATE.value, 1, 0, 'Teig', 2, np.array(outer + hole), 'test.sos', None, np.array([4]))
+    elem_filter = sopars.ElementFilter(bbox=(100.0, 200.0, 105.0, 205.0), clip=True)
+    clipped = list(sospat.clip_elements([elem], elem_filter, 100.0, 200.0))
+    assert len(clipped) == 1
+    assert clipped[0].holes is None
+    assert sorted(map(tuple, clipped[0].coords.tolist())) == [(0.0, 0.0), (0.0, 5.0), (5.0, 0.0), (5.0, 5.0)]
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright © 2022 Jonny Normann Skålvik
+
+Permission is hereby granted, free of charge, to any person obtaining a copy 
+of this software and associated documentation files (the “Software”), to deal 
+in the Software without restriction, including without limitation the rights 
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell 
+copies of the Software, and to permit persons to whom the Software is 
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in 
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE 
+SOFTWARE.
+
+This file is part of SosiImporter, an addon to import SOSI files containing
+3D model data into Blender.
+"""
+
+import sys
+from sosi_files_importer import sosi_settings as soset
+from sosi_files_importer import sosi_stats as sostat
+
+# -----------------------------------------------------------------------------
+
+def test_profiler_off_between_steps(monkeypatch, tmp_path):
+    monkeypatch.setattr(soset, 'SOSI_STATS_DIR', str(tmp_path))
+    inside = []
+
+    def steps():
+        for i in range(3):
+            inside.append(sys.getprofile() != None)
+            yield i
+
+    def job():
+        with sostat.instrumented('test', profile_cpu=True) as stats:
+            yield from stats.profile_steps(steps())
+
+    outside = []
+    for i in job():
+        outside.append(sys.getprofile() != None)
+    assert inside == [True, True, True]
+    assert outside == [False, False, False]
+    assert sys.getprofile() == None
+    assert len(list(tmp_path.glob('*.prof'))) == 1
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright © 2022 Jonny Normann Skålvik
+
+Permission is hereby granted, free of charge, to any person obtaining a copy 
+of this software and associated documentation files (the “Software”), to deal 
+in the Software without restriction, including without limitation the rights 
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell 
+copies of the Software, and to permit persons to whom the Software is 
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in 
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE 
+SOFTWARE.
+
+This file is part of SosiImporter, an addon to import SOSI files containing
+3D model data into Blender.
+"""
+
+import numpy as np
+from sosi_files_importer import sosi_geom_helper as sogeohlp
+from sosi_files_importer import sosi_triangulate as sotri
+
+# -----------------------------------------------------------------------------
+
+def jagged_ring(npts, seed = 0):
+    """Star shaped ring with random radii, counter clockwise."""
+    rng = np.random.default_rng(seed)
+    angls = np.linspace(0.0, 2 * np.pi, npts, endpoint=False)
+    r = 1000.0 * (1.0 + 0.3 * rng.random(npts))
+    return np.column_stack((r * np.cos(angls), r * np.sin(angls)))
+
+def triangle_areas(xy, tris):
+    a, b, c = xy[tris[:, 0]], xy[tris[:, 1]], xy[tris[:, 2]]
+    return 0.5 * ((b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (c[:, 0] - a[:, 0]) * (b[:, 1] - a[:, 1]))
+
+def test_square_with_hole():
+    outer = [[0, 0], [10, 0], [10, 10], [0, 10]]
+    hole = [[2, 2], [4, 2], [4, 4], [2, 4]]     # Any orientation
+    xy = np.array(outer + hole, dtype=np.float64)
+    tris = sotri.triangulate(xy, [4])
+    areas = triangle_areas(xy, tris)
+    assert len(tris) == 8
+    assert areas.min() > 0.0
+    assert areas.sum() == 96.0
+
+def test_clockwise_ring_gives_ccw_triangles():
+    xy = jagged_ring(50)[::-1]
+    tris = sotri.triangulate(xy)
+    assert len(tris) == 48
+    assert triangle_areas(xy, tris).min() > 0.0
+
+def test_hashed_matches_plain(monkeypatch):
+    xy = jagged_ring(2000)
+    holes = [len(xy)]
+    angls = np.linspace(0.0, 2 * np.pi, 40, endpoint=False)
+    xy = np.concatenate((xy, np.column_stack((100.0 * np.cos(angls), 100.0 * np.sin(angls)))))
+    hashed = sotri.triangulate(xy, holes)
+    monkeypatch.setattr(sotri, 'EARCUT_HASH_MIN_POINTS', len(xy))
+    plain = sotri.triangulate(xy, holes)
+    assert np.array_equal(hashed, plain)
+    areas = triangle_areas(xy, hashed)
+    assert areas.min() >= 0.0
+    hole_area = sogeohlp.polygon_area_2D(xy[holes[0]:])
+    assert np.isclose(areas.sum(), sogeohlp.polygon_area_2D(xy[:holes[0]]) - hole_area)
+
+def test_degenerate_input():
+    assert sogeohlp.triangulate_polygon_2D(np.zeros((2, 2))).shape == (0, 3)
+    assert sotri.triangulate(np.zeros((4, 2))).shape == (0, 3)